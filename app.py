@@ -1,30 +1,105 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Query, Header
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field, ValidationError
+from typing import List, Optional, Dict, Any, AsyncIterator, Iterable, Iterator, Literal
 import sqlite3
 import os
 import uuid
 import json
+import re
+import time
+import hashlib
+import hmac
+import sys
+import contextvars
 import requests
 from datetime import datetime
 import shutil
+import asyncio
+import threading
+import queue
+import heapq
+import itertools
+import random
+import socket
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager, nullcontext
 from pathlib import Path
+from urllib.parse import urlsplit
+import httpx
 
 # Load environment variables
 from dotenv import load_dotenv
 load_dotenv()
 
 # Structured Data Processing
+import numpy as np
 import pandas as pd
 import openpyxl
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather
 
 # Constants
 STRUCTURED_DATA_UPLOAD_DIR = "excel_uploads"
+DATABASE_PATH = os.getenv("DATABASE_PATH", "database.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_POOL_MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", "8"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "65536"))
+DB_MMAP_SIZE_MB = int(os.getenv("DB_MMAP_SIZE_MB", "256"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_BUSY_RETRY_AFTER_SECONDS = int(os.getenv("DB_BUSY_RETRY_AFTER_SECONDS", "2"))
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+GROQ_API_URL = os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions")
+GROQ_MAX_CONNECTIONS = int(os.getenv("GROQ_MAX_CONNECTIONS", "100"))
+GROQ_MAX_CONNECTIONS_PER_HOST = int(os.getenv("GROQ_MAX_CONNECTIONS_PER_HOST", "20"))
+GROQ_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("GROQ_MAX_KEEPALIVE_CONNECTIONS", "20"))
+GROQ_KEEPALIVE_EXPIRY = float(os.getenv("GROQ_KEEPALIVE_EXPIRY", "30"))
+GROQ_MODEL = "llama3-8b-8192"
+GROQ_RPM_LIMIT = int(os.getenv("GROQ_RPM_LIMIT", "30"))
+GROQ_TPM_LIMIT = int(os.getenv("GROQ_TPM_LIMIT", "30000"))
+GROQ_QUEUE_MAX_SIZE = int(os.getenv("GROQ_QUEUE_MAX_SIZE", "100"))
+GROQ_QUEUE_TIMEOUT_SECONDS = float(os.getenv("GROQ_QUEUE_TIMEOUT_SECONDS", "60"))
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "3"))
+HEALTH_PROBE_INTERVAL_SECONDS = float(os.getenv("HEALTH_PROBE_INTERVAL_SECONDS", "60"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000"))
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", "3600"))
+LLM_CACHE_PREDEFINED_TTL_SECONDS = int(os.getenv("LLM_CACHE_PREDEFINED_TTL_SECONDS", "86400"))
+COLUMNAR_EXTENSION = ".arrow"
+DATAFRAME_CACHE_MAX_MB = int(os.getenv("DATAFRAME_CACHE_MAX_MB", "512"))
+INGEST_BACKGROUND_THRESHOLD_MB = float(os.getenv("INGEST_BACKGROUND_THRESHOLD_MB", "5"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+CHAT_BATCH_MAX_ITEMS = int(os.getenv("CHAT_BATCH_MAX_ITEMS", "50"))
+CHAT_BATCH_CONCURRENCY = int(os.getenv("CHAT_BATCH_CONCURRENCY", "5"))
+DOCUMENTS_PAGE_SIZE = int(os.getenv("DOCUMENTS_PAGE_SIZE", "100"))  # /structured-documents page when only 'before' is given
+DIGEST_TOP_K = int(os.getenv("DIGEST_TOP_K", "5"))
+DIGEST_SAMPLE_ROWS = int(os.getenv("DIGEST_SAMPLE_ROWS", "5"))
+PROMPT_CONTEXT_TOKEN_BUDGET = int(os.getenv("PROMPT_CONTEXT_TOKEN_BUDGET", "1200"))
+PROMPT_VALUE_MAX_CHARS = int(os.getenv("PROMPT_VALUE_MAX_CHARS", "80"))
+DIGEST_MAX_TRACKED_VALUES = int(os.getenv("DIGEST_MAX_TRACKED_VALUES", "10000"))
+MAX_UPLOAD_SIZE_MB = float(os.getenv("MAX_UPLOAD_SIZE_MB", "2048"))  # 0 disables the limit
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", "100000"))
+CSV_VALIDATE_ROWS = int(os.getenv("CSV_VALIDATE_ROWS", "1000"))
+CSV_BAD_LINES = os.getenv("CSV_BAD_LINES", "error")  # error, warn or skip
+XLSX_CHUNK_ROWS = int(os.getenv("XLSX_CHUNK_ROWS", "50000"))
+QUERY_RESULT_MAX_ROWS = int(os.getenv("QUERY_RESULT_MAX_ROWS", "50"))
+QUERY_PLAN_MAX_TOKENS = int(os.getenv("QUERY_PLAN_MAX_TOKENS", "400"))
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))  # uvicorn worker processes
+COLUMNAR_STORE_MAX_TABLES = int(os.getenv("COLUMNAR_STORE_MAX_TABLES", "256"))
+CACHE_SYNC_INTERVAL_SECONDS = float(os.getenv("CACHE_SYNC_INTERVAL_SECONDS", "2"))
+DOCUMENT_LOAD_CLAIM_TIMEOUT_SECONDS = float(os.getenv("DOCUMENT_LOAD_CLAIM_TIMEOUT_SECONDS", "600"))
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() in ("1", "true", "yes")
+SLOW_REQUEST_THRESHOLD_MS = float(os.getenv("SLOW_REQUEST_THRESHOLD_MS", "1000"))
+SLOW_REQUEST_BUFFER_SIZE = int(os.getenv("SLOW_REQUEST_BUFFER_SIZE", "100"))
+DEBUG_TOKEN = os.getenv("DEBUG_TOKEN")  # unset disables the /debug endpoints
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
 
 # Ensure upload directory exists
 Path(STRUCTURED_DATA_UPLOAD_DIR).mkdir(exist_ok=True)
@@ -35,13 +110,605 @@ if not GROQ_API_KEY:
     print("   Please create a .env file with your GROQ API key")
     print("   Get your free API key at: https://console.groq.com/")
 
+# In-process metrics, served by /metrics in the Prometheus text format
+METRICS_LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class MetricsRegistry:
+    """
+    Counters, gauges and histograms kept in process memory. Every update is a dict lookup
+    and a few additions under one lock, cheap enough for the request hot path.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta: Dict[str, tuple] = {}
+        self._values: Dict[str, Dict[tuple, Any]] = {}
+
+    def describe(self, name: str, kind: str, help_text: str, label_names: tuple = ()):
+        self._meta[name] = (kind, help_text, label_names)
+        self._values[name] = {}
+
+    def inc(self, name: str, *labels: str, value: float = 1):
+        with self._lock:
+            series = self._values[name]
+            series[labels] = series.get(labels, 0) + value
+
+    def dec(self, name: str, *labels: str):
+        self.inc(name, *labels, value=-1)
+
+    def set(self, name: str, *labels: str, value: float):
+        with self._lock:
+            self._values[name][labels] = value
+
+    def observe(self, name: str, seconds: float, *labels: str):
+        with self._lock:
+            series = self._values[name]
+            histogram = series.get(labels)
+            if histogram is None:
+                histogram = series[labels] = [[0] * len(METRICS_LATENCY_BUCKETS), 0.0, 0]
+            for i, bound in enumerate(METRICS_LATENCY_BUCKETS):
+                if seconds <= bound:
+                    histogram[0][i] += 1
+                    break
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    @staticmethod
+    def _labels(label_names: tuple, labels: tuple, extra: str = "") -> str:
+        pairs = [f'{name}="{value}"' for name, value in zip(label_names, labels)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, label_names) in self._meta.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in sorted(self._values[name].items()):
+                    if kind != "histogram":
+                        lines.append(f"{name}{self._labels(label_names, labels)} {value}")
+                        continue
+                    # Buckets are stored per interval and exposed cumulatively
+                    buckets, total, count = value
+                    cumulative = 0
+                    for bound, bucket_count in zip(METRICS_LATENCY_BUCKETS, buckets):
+                        cumulative += bucket_count
+                        le_label = self._labels(label_names, labels, 'le="%s"' % bound)
+                        lines.append(f"{name}_bucket{le_label} {cumulative}")
+                    le_label = self._labels(label_names, labels, 'le="+Inf"')
+                    lines.append(f"{name}_bucket{le_label} {count}")
+                    lines.append(f"{name}_sum{self._labels(label_names, labels)} {total}")
+                    lines.append(f"{name}_count{self._labels(label_names, labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+metrics.describe("http_requests_total", "counter", "HTTP requests by endpoint, method and status", ("endpoint", "method", "status"))
+metrics.describe("http_request_duration_seconds", "histogram", "HTTP request latency by endpoint", ("endpoint",))
+metrics.describe("http_requests_in_flight", "gauge", "HTTP requests being handled", ())
+metrics.describe("chat_stage_duration_seconds", "histogram", "Latency of chat pipeline stages", ("stage",))
+metrics.describe("groq_requests_in_flight", "gauge", "Groq API calls waiting for a response", ())
+metrics.describe("groq_errors_total", "counter", "Failed Groq API calls by HTTP status or error type", ("status",))
+metrics.describe("groq_queue_depth", "gauge", "Groq calls waiting in the rate-limit scheduler queue", ())
+metrics.describe("groq_queue_wait_seconds", "histogram", "Time Groq calls waited in the scheduler queue by priority", ("priority",))
+metrics.describe("groq_queue_rejections_total", "counter", "Groq calls turned away by the scheduler: queue full or queue timeout", ("reason",))
+metrics.describe("groq_retries_total", "counter", "Groq calls retried after a 429/503, by status", ("status",))
+metrics.inc("http_requests_in_flight", value=0)
+metrics.inc("groq_requests_in_flight", value=0)
+metrics.inc("groq_queue_depth", value=0)
+
+# Opt-in request tracing (TRACING_ENABLED): requests slower than SLOW_REQUEST_THRESHOLD_MS
+# are kept with their span timings in a ring buffer served by /debug/slow-requests
+class RequestTrace:
+    __slots__ = ("trace_id", "started", "spans")
+
+    def __init__(self):
+        self.trace_id = uuid.uuid4().hex
+        self.started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+
+current_trace: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar("current_trace", default=None)
+slow_requests: deque = deque(maxlen=SLOW_REQUEST_BUFFER_SIZE)
+NO_SPAN = nullcontext()
+
+@contextmanager
+def record_span(trace: RequestTrace, name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.spans.append({
+            "name": name,
+            "start_ms": round((started - trace.started) * 1000, 3),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 3)
+        })
+
+def trace_span(name: str):
+    """Time a block as a span of the current request trace; a shared no-op when nothing is traced"""
+    trace = current_trace.get()
+    return NO_SPAN if trace is None else record_span(trace, name)
+
+@contextmanager
+def stage_timer(stage: str):
+    """Record the duration of a chat pipeline stage (db, parse, search, query, prompt, groq, persist)"""
+    with trace_span(stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            metrics.observe("chat_stage_duration_seconds", time.perf_counter() - started, stage)
+
+def record_groq_response(response: httpx.Response):
+    if response.status_code >= 400:
+        metrics.inc("groq_errors_total", str(response.status_code))
+
+def record_groq_exception(error: Exception):
+    if isinstance(error, httpx.TimeoutException):
+        metrics.inc("groq_errors_total", "timeout")
+    elif isinstance(error, httpx.HTTPError):
+        metrics.inc("groq_errors_total", "connection_error")
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting requests by route template and status, with latency and an
+    in-flight gauge. Streaming responses are timed until their last body chunk is sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        metrics.inc("http_requests_in_flight")
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            metrics.dec("http_requests_in_flight")
+            # The route template keeps label cardinality bounded (no ids in the label)
+            route = scope.get("route")
+            endpoint = getattr(route, "path", None) or "static"
+            metrics.inc("http_requests_total", endpoint, scope["method"], str(status_code))
+            metrics.observe("http_request_duration_seconds", time.perf_counter() - started, endpoint)
+
+class TracingMiddleware:
+    """
+    ASGI middleware giving each request a RequestTrace that spans are recorded into.
+    Only installed when TRACING_ENABLED is set, so untraced deployments pay nothing.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith("/debug/"):
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        trace = RequestTrace()
+        token = current_trace.set(trace)
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            current_trace.reset(token)
+            duration_ms = (time.perf_counter() - trace.started) * 1000
+            if duration_ms >= SLOW_REQUEST_THRESHOLD_MS:
+                route = scope.get("route")
+                slow_requests.append({
+                    "trace_id": trace.trace_id,
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "endpoint": getattr(route, "path", None),
+                    "status": status_code,
+                    "finished_at": datetime.now().isoformat(),
+                    "duration_ms": round(duration_ms, 3),
+                    "spans": trace.spans
+                })
+
+# Sampling profiler for /debug/profile, one run at a time
+profile_lock = threading.Lock()
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+def sample_stacks(seconds: float, interval: float) -> Counter:
+    """
+    Sample the Python stack of every other thread each `interval` seconds for `seconds`.
+    Returns collapsed stacks (root first, frames joined by ';') with their sample counts.
+    This is wall-clock sampling: idle threads show up waiting, as they really do.
+    """
+    own_id = threading.get_ident()
+    stacks: Counter = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(frame_label(frame))
+                frame = frame.f_back
+            labels.append(thread_names.get(thread_id, str(thread_id)))
+            stacks[";".join(reversed(labels))] += 1
+        time.sleep(interval)
+    return stacks
+
+def check_debug_token(token: Optional[str]):
+    if not DEBUG_TOKEN:
+        raise HTTPException(status_code=404, detail="Endpoint debug tidak diaktifkan.")
+    if not token or not hmac.compare_digest(token, DEBUG_TOKEN):
+        raise HTTPException(status_code=403, detail="Token debug tidak valid.")
+
+# Shared HTTP client for Groq, opened and closed by the app lifespan
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+groq_client: Optional[httpx.AsyncClient] = None
+groq_host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+def create_groq_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=GROQ_MAX_CONNECTIONS,
+            max_keepalive_connections=GROQ_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=GROQ_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(30.0, connect=5.0)
+    )
+
+def get_groq_client() -> httpx.AsyncClient:
+    global groq_client
+    if groq_client is None or groq_client.is_closed:
+        groq_client = create_groq_client()
+    return groq_client
+
+def get_groq_host_semaphore() -> asyncio.Semaphore:
+    host = urlsplit(GROQ_API_URL).netloc
+    if host not in groq_host_semaphores:
+        groq_host_semaphores[host] = asyncio.Semaphore(GROQ_MAX_CONNECTIONS_PER_HOST)
+    return groq_host_semaphores[host]
+
+def groq_headers() -> Dict[str, str]:
+    return {
+        "Authorization": f"Bearer {GROQ_API_KEY}",
+        "Content-Type": "application/json"
+    }
+
+async def groq_post(payload: Dict[str, Any], timeout: Optional[float] = None) -> httpx.Response:
+    """POST to the Groq API through the pooled client, bounded per host"""
+    async with get_groq_host_semaphore():
+        metrics.inc("groq_requests_in_flight")
+        try:
+            response = await get_groq_client().post(
+                GROQ_API_URL, json=payload, headers=groq_headers(),
+                timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT
+            )
+        except Exception as e:
+            record_groq_exception(e)
+            raise
+        finally:
+            metrics.dec("groq_requests_in_flight")
+    record_groq_response(response)
+    return response
+
+# Central scheduler for outbound Groq calls
+GROQ_PRIORITY_INTERACTIVE = 0
+GROQ_PRIORITY_PREDEFINED = 1
+GROQ_PRIORITY_HEALTH = 2
+GROQ_PRIORITY_NAMES = {GROQ_PRIORITY_INTERACTIVE: "interactive", GROQ_PRIORITY_PREDEFINED: "predefined",
+                       GROQ_PRIORITY_HEALTH: "health"}
+
+class GroqQueueFull(Exception):
+    pass
+
+class GroqScheduler:
+    """
+    Admits Groq requests through requests-per-minute and tokens-per-minute token buckets.
+    Waiting requests form a bounded priority queue (lower value goes first, FIFO within
+    a class); a 429/503 pauses every dispatch until its Retry-After has passed.
+    A limit of 0 disables that bucket. Queue depth, waits, rejections and retries are
+    exported to /metrics as well as kept in stats().
+    """
+
+    def __init__(self, rpm: int, tpm: int, max_queue: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_queue = max_queue
+        self._seq = itertools.count()
+        self._loop = None
+        self._reset_state()
+        self.dispatched = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.max_queue_depth = 0
+
+    def _reset_state(self):
+        self._waiters: list = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._request_allowance = float(self.rpm)
+        self._token_allowance = float(self.tpm)
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._record_depth()
+
+    def _record_depth(self):
+        metrics.set("groq_queue_depth", value=len(self._waiters))
+
+    def _ensure_dispatcher(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # First use, or the previous event loop is gone (e.g. the app was restarted)
+            self._loop = loop
+            self._reset_state()
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = loop.create_task(self._dispatch())
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        if self.rpm:
+            self._request_allowance = min(float(self.rpm), self._request_allowance + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._token_allowance = min(float(self.tpm), self._token_allowance + elapsed * self.tpm / 60)
+
+    def _delay_for(self, tokens: int) -> float:
+        self._refill()
+        delay = max(0.0, self._paused_until - time.monotonic())
+        if self.rpm and self._request_allowance < 1:
+            delay = max(delay, (1 - self._request_allowance) * 60 / self.rpm)
+        if self.tpm and self._token_allowance < tokens:
+            delay = max(delay, (tokens - self._token_allowance) * 60 / self.tpm)
+        return delay
+
+    async def _dispatch(self):
+        while True:
+            while self._waiters and self._waiters[0][3].done():
+                heapq.heappop(self._waiters)
+                self._record_depth()
+            if not self._waiters:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            _, _, tokens, future = self._waiters[0]
+            delay = self._delay_for(tokens)
+            if delay > 0:
+                # Wake up early when a new (possibly higher priority) request arrives
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._waiters)
+            self._record_depth()
+            if self.rpm:
+                self._request_allowance -= 1
+            if self.tpm:
+                self._token_allowance -= tokens
+            self.dispatched += 1
+            future.set_result(None)
+
+    async def acquire(self, priority: int, tokens: int, timeout: float = GROQ_QUEUE_TIMEOUT_SECONDS):
+        """Wait for rate-limit capacity; raises GroqQueueFull or asyncio.TimeoutError"""
+        self._ensure_dispatcher()
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            metrics.inc("groq_queue_rejections_total", "queue_full")
+            raise GroqQueueFull()
+
+        tokens = min(tokens, self.tpm) if self.tpm else tokens
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), tokens, future))
+        self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+        self._record_depth()
+        self._wakeup.set()
+
+        enqueued_at = time.monotonic()
+        try:
+            await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            metrics.inc("groq_queue_rejections_total", "timeout")
+            raise
+        waited = time.monotonic() - enqueued_at
+        self.total_wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        metrics.observe("groq_queue_wait_seconds", waited, GROQ_PRIORITY_NAMES.get(priority, str(priority)))
+
+    def record_retry(self, status_code: int):
+        self.retries += 1
+        metrics.inc("groq_retries_total", str(status_code))
+
+    def pause(self, seconds: float):
+        """Hold every dispatch for the given time (after a 429/503 from Groq)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """Correct the token bucket once the real usage of a request is known"""
+        if self.tpm and actual_tokens is not None:
+            self._token_allowance = min(float(self.tpm), self._token_allowance + estimated_tokens - actual_tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": len(self._waiters),
+            "max_queue_depth": self.max_queue_depth,
+            "max_queue_size": self.max_queue,
+            "dispatched": self.dispatched,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "retries": self.retries,
+            "avg_wait_seconds": round(self.total_wait_seconds / self.dispatched, 4) if self.dispatched else 0.0,
+            "max_wait_seconds": round(self.max_wait_seconds, 4),
+            "rpm_limit": self.rpm,
+            "tpm_limit": self.tpm
+        }
+
+    def close(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+        self._loop = None
+
+def worker_share(limit: int) -> int:
+    """Each worker process schedules against an equal share of the account-wide Groq limits"""
+    return max(1, limit // WEB_CONCURRENCY) if limit > 0 else limit
+
+groq_scheduler = GroqScheduler(worker_share(GROQ_RPM_LIMIT), worker_share(GROQ_TPM_LIMIT), GROQ_QUEUE_MAX_SIZE)
+
+# Word pieces of up to 4 characters and single punctuation marks, close to what BPE tokenizers produce
+TOKEN_ESTIMATE_PATTERN = re.compile(r"\w{1,4}|[^\w\s]")
+
+def estimate_tokens(text: str) -> int:
+    """Local token count estimate, used for prompt budgets and rate limiting"""
+    return len(TOKEN_ESTIMATE_PATTERN.findall(text))
+
+def estimate_request_tokens(payload: Dict[str, Any]) -> int:
+    """Token estimate of the prompt messages plus the completion budget"""
+    prompt_tokens = sum(estimate_tokens(message.get("content", "")) for message in payload.get("messages", []))
+    return prompt_tokens + payload.get("max_tokens", 0)
+
+def retry_after_seconds(response: httpx.Response, attempt: int) -> float:
+    retry_after = response.headers.get("retry-after")
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+    return min(30.0, 2 ** attempt) + random.uniform(0, 0.5)
+
+def response_total_tokens(response: httpx.Response) -> Optional[int]:
+    try:
+        return response.json().get("usage", {}).get("total_tokens")
+    except Exception:
+        return None
+
+async def scheduled_groq_post(payload: Dict[str, Any], priority: int = GROQ_PRIORITY_INTERACTIVE,
+                              timeout: Optional[float] = None,
+                              queue_timeout: float = GROQ_QUEUE_TIMEOUT_SECONDS) -> httpx.Response:
+    """groq_post behind the scheduler, retrying 429/503 after their Retry-After"""
+    estimated_tokens = estimate_request_tokens(payload)
+    for attempt in range(GROQ_MAX_RETRIES + 1):
+        await groq_scheduler.acquire(priority, estimated_tokens, queue_timeout)
+        response = await groq_post(payload, timeout)
+        if response.status_code not in (429, 503) or attempt == GROQ_MAX_RETRIES:
+            groq_scheduler.record_usage(estimated_tokens, response_total_tokens(response))
+            return response
+        groq_scheduler.record_retry(response.status_code)
+        groq_scheduler.pause(retry_after_seconds(response, attempt))
+
+@asynccontextmanager
+async def groq_stream(payload: Dict[str, Any], priority: int = GROQ_PRIORITY_INTERACTIVE):
+    """
+    Open a streaming POST to the Groq API behind the scheduler; 429/503 are retried before
+    the stream is handed out. The per-host slot is held until the stream closes.
+    """
+    estimated_tokens = estimate_request_tokens(payload)
+    client = get_groq_client()
+    for attempt in range(GROQ_MAX_RETRIES + 1):
+        await groq_scheduler.acquire(priority, estimated_tokens)
+        async with get_groq_host_semaphore():
+            request = client.build_request("POST", GROQ_API_URL, json=payload, headers=groq_headers())
+            metrics.inc("groq_requests_in_flight")
+            try:
+                response = await client.send(request, stream=True)
+            except Exception as e:
+                metrics.dec("groq_requests_in_flight")
+                record_groq_exception(e)
+                raise
+            record_groq_response(response)
+            try:
+                if response.status_code in (429, 503) and attempt < GROQ_MAX_RETRIES:
+                    groq_scheduler.record_retry(response.status_code)
+                    groq_scheduler.pause(retry_after_seconds(response, attempt))
+                    continue
+                yield response
+                return
+            finally:
+                metrics.dec("groq_requests_in_flight")
+                await response.aclose()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global groq_client
+    groq_client = create_groq_client()
+    health_probe_task = asyncio.create_task(health_probe_loop())
+    cache_sync_task = asyncio.create_task(cache_sync_loop())
+    try:
+        yield
+    finally:
+        for task in (health_probe_task, cache_sync_task):
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        groq_scheduler.close()
+        await groq_client.aclose()
+        groq_client = None
+        db_pool.close_all()
+
 # Initialize FastAPI
 app = FastAPI(
     title="Local Structured Data Chat System",
     description="Local structured data analysis and chat system powered by Groq AI",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+app.add_middleware(MetricsMiddleware)
+if TRACING_ENABLED:
+    app.add_middleware(TracingMiddleware)
+
+def is_database_busy(error: sqlite3.OperationalError) -> bool:
+    message = str(error).lower()
+    return "locked" in message or "busy" in message or "pool exhausted" in message
+
+@app.exception_handler(sqlite3.OperationalError)
+async def database_error_handler(request, exc: sqlite3.OperationalError):
+    """A write lock held past DB_BUSY_TIMEOUT_MS is temporary, so clients are told to retry"""
+    if is_database_busy(exc):
+        return JSONResponse(
+            status_code=503,
+            headers={"Retry-After": str(DB_BUSY_RETRY_AFTER_SECONDS)},
+            content={"detail": "Basis data sedang sibuk, silakan coba lagi sebentar lagi."}
+        )
+    print(f"Database error on {request.url.path}: {exc}")
+    return JSONResponse(status_code=500, content={"detail": f"Kesalahan basis data: {exc}"})
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -49,18 +716,48 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # The frontend reads the keyset cursor of paginated lists
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Pydantic models
 class ChatMessage(BaseModel):
     message: str
     structured_document_id: Optional[str] = None
+    sheet: Optional[str] = None
     is_predefined: bool = False
+    bypass_cache: bool = False
+    conversation_id: Optional[str] = None
+    # "query" lets Groq plan a filter/aggregate query that runs locally over the whole document
+    mode: Literal["search", "query"] = "search"
 
 class ChatResponse(BaseModel):
     response: str
     source_document_name: Optional[str] = None
     next_action: str = "continue_chat"
+    cached: bool = False
+    query_plan: Optional[Dict[str, Any]] = None
+
+class BatchChatRequest(BaseModel):
+    structured_document_id: str
+    sheet: Optional[str] = None
+    messages: List[str]
+    is_predefined: bool = True
+    bypass_cache: bool = False
+    conversation_id: Optional[str] = None
+
+class BatchChatItem(BaseModel):
+    message: str
+    response: str
+    cached: bool = False
+    search_ms: float
+    groq_ms: float
+    elapsed_ms: float
+
+class BatchChatResponse(BaseModel):
+    source_document_name: str
+    results: List[BatchChatItem]
+    elapsed_ms: float
 
 class StructuredDocument(BaseModel):
     id: str
@@ -68,23 +765,173 @@ class StructuredDocument(BaseModel):
     upload_date: str
     data_preview: Optional[List[Dict[str, Any]]] = None
     row_count: int
+    columns: Optional[List[Dict[str, str]]] = None
+    sheet_name: Optional[str] = None
+    sheets: Optional[List[str]] = None
+    deduplicated: bool = False
+
+class DocumentSheet(BaseModel):
+    id: str
+    sheet_name: str
+    row_count: Optional[int] = None
+    loaded: bool
+
+class QueryFilter(BaseModel):
+    column: str
+    op: Literal["==", "!=", ">", ">=", "<", "<=", "contains", "in"]
+    value: Any = None
+
+class QueryAggregation(BaseModel):
+    func: Literal["count", "sum", "mean", "min", "max", "nunique"]
+    column: str = "*"
+    name: Optional[str] = None
+
+class QuerySort(BaseModel):
+    column: str
+    descending: bool = False
+
+class QueryPlan(BaseModel):
+    select: List[str] = []
+    filters: List[QueryFilter] = []
+    group_by: List[str] = []
+    aggregations: List[QueryAggregation] = []
+    sort: List[QuerySort] = []
+    limit: int = Field(QUERY_RESULT_MAX_ROWS, ge=1)
+
+class QueryResult(BaseModel):
+    columns: List[str]
+    rows: List[Dict[str, Any]]
+    matched_rows: int
+    total_rows: int
+
+class IngestJob(BaseModel):
+    job_id: str
+    document_id: str
+    filename: str
+    status: str
+    stage: str
+    progress: int
+    error: Optional[str] = None
+    created_at: str
+    updated_at: str
+    document: Optional[StructuredDocument] = None
 
 class SystemStats(BaseModel):
     total_structured_documents: int
     total_chats: int
     recent_activity: List[Dict[str, Any]]
+    dataframe_cache: Optional[Dict[str, Any]] = None
+    columnar_store: Optional[Dict[str, Any]] = None
+    llm_cache: Optional[Dict[str, Any]] = None
+    groq_scheduler: Optional[Dict[str, Any]] = None
+    groq_single_flight: Optional[Dict[str, Any]] = None
 
 class SystemHealth(BaseModel):
     status: str
     groq_api: str
     database: str
     model_info: Optional[Dict[str, Any]] = None
+    checked_at: Optional[str] = None
+
+# Database connection pool
+class PooledConnection:
+    """
+    Thin proxy around a pooled sqlite3 connection. close() hands the connection back
+    to the pool (rolling back anything left uncommitted) instead of closing it.
+    """
+
+    def __init__(self, pool: "SQLiteConnectionPool", conn: sqlite3.Connection):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn)
+
+    def __del__(self):
+        # Safety net for code paths that forget close() on an exception
+        self.close()
+
+class SQLiteConnectionPool:
+    """
+    Bounded pool of SQLite connections in WAL mode. Up to pool_size idle connections are kept;
+    max_overflow extra connections may be opened under load and are closed when released.
+    """
+
+    def __init__(self, database: str, pool_size: int, max_overflow: int, timeout: float):
+        self.database = database
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size + max_overflow)
+        self._lock = threading.Lock()
+        self._created = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.database, check_same_thread=False, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+        conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE_MB * 1024 * 1024}")
+        conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def acquire(self) -> PooledConnection:
+        if not self._slots.acquire(timeout=self.timeout):
+            raise sqlite3.OperationalError("Database connection pool exhausted")
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            try:
+                conn = self._connect()
+            except Exception:
+                self._slots.release()
+                raise
+            with self._lock:
+                self._created += 1
+        return PooledConnection(self, conn)
+
+    def release(self, conn: sqlite3.Connection):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            if self._idle.qsize() < self.pool_size:
+                self._idle.put(conn)
+            else:
+                conn.close()
+        except sqlite3.Error:
+            conn.close()
+        finally:
+            self._slots.release()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pool_size": self.pool_size,
+            "max_overflow": self.max_overflow,
+            "idle": self._idle.qsize(),
+            "created": self._created
+        }
+
+db_pool = SQLiteConnectionPool(DATABASE_PATH, DB_POOL_SIZE, DB_POOL_MAX_OVERFLOW, DB_POOL_TIMEOUT)
 
-# Database connection
 def get_db_connection():
-    conn = sqlite3.connect("database.db")
-    conn.row_factory = sqlite3.Row
-    return conn
+    return db_pool.acquire()
 
 # Database Initialization
 def initialize_db():
@@ -96,7 +943,31 @@ def initialize_db():
             filename TEXT NOT NULL,
             file_path TEXT NOT NULL,
             upload_date TEXT NOT NULL,
-            row_count INTEGER
+            row_count INTEGER,
+            columnar_path TEXT,
+            fts_key INTEGER,
+            parent_id TEXT,
+            sheet_name TEXT,
+            content_hash TEXT
+        )
+    """)
+    document_columns = [col["name"] for col in cursor.execute("PRAGMA table_info(excel_documents)").fetchall()]
+    if "columnar_path" not in document_columns:
+        cursor.execute("ALTER TABLE excel_documents ADD COLUMN columnar_path TEXT")
+    if "fts_key" not in document_columns:
+        cursor.execute("ALTER TABLE excel_documents ADD COLUMN fts_key INTEGER")
+    if "parent_id" not in document_columns:
+        cursor.execute("ALTER TABLE excel_documents ADD COLUMN parent_id TEXT")
+    if "sheet_name" not in document_columns:
+        cursor.execute("ALTER TABLE excel_documents ADD COLUMN sheet_name TEXT")
+    if "content_hash" not in document_columns:
+        cursor.execute("ALTER TABLE excel_documents ADD COLUMN content_hash TEXT")
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS structured_rows_fts USING fts5(
+            document_id UNINDEXED,
+            row_id UNINDEXED,
+            content,
+            tokenize = 'unicode61 remove_diacritics 2'
         )
     """)
     cursor.execute("""
@@ -110,238 +981,2247 @@ def initialize_db():
             chat_turn INTEGER DEFAULT 0
         )
     """)
+    history_columns = [col["name"] for col in cursor.execute("PRAGMA table_info(chat_history)").fetchall()]
+    if "conversation_id" not in history_columns:
+        cursor.execute("ALTER TABLE chat_history ADD COLUMN conversation_id TEXT")
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_excel_documents_upload_date ON excel_documents(upload_date, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_excel_documents_parent_id ON excel_documents(parent_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_excel_documents_content_hash ON excel_documents(content_hash)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_history_timestamp ON chat_history(timestamp)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_history_document_timestamp ON chat_history(excel_document_id, timestamp)')
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chat_sessions (
+            excel_document_id TEXT NOT NULL,
+            conversation_id TEXT NOT NULL DEFAULT '',
+            chat_turn INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (excel_document_id, conversation_id)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS llm_response_cache (
+            cache_key TEXT PRIMARY KEY,
+            response TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_jobs (
+            id TEXT PRIMARY KEY,
+            document_id TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            status TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            progress INTEGER DEFAULT 0,
+            error TEXT,
+            result TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS document_digests (
+            document_id TEXT PRIMARY KEY,
+            digest TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS stored_files (
+            file_path TEXT PRIMARY KEY,
+            content_hash TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            ref_count INTEGER NOT NULL,
+            created_at TEXT NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cache_invalidations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            document_id TEXT,
+            columnar_path TEXT,
+            created_at TEXT NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS document_load_claims (
+            lock_key TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            claimed_at REAL NOT NULL
+        )
+    """)
     conn.commit()
     conn.close()
     print("Database initialized successfully.")
 
-# Function to extract data from Excel or CSV
-def extract_data_from_structured_file(file_path: Path):
-    try:
-        file_extension = file_path.suffix.lower()
-        df = None
-        if file_extension in ['.xlsx', '.xls']:
-            df = pd.read_excel(file_path)
-        elif file_extension == '.csv':
-            df = pd.read_csv(file_path)
+# In-process cache of parsed DataFrames
+class DataFrameCache:
+    """
+    LRU cache of parsed DataFrames keyed by document id.
+    Entries are validated against the file's mtime/size, so a replaced file is reparsed.
+    Each entry is [signature, df, size, derived] where derived holds structures built from
+    the DataFrame (e.g. search views) that share its lifetime and memory budget.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, doc_id: str, file_path: Path) -> pd.DataFrame:
+        """file_path is the file the DataFrame is read from (the columnar copy when it exists)"""
+        stat = file_path.stat()
+        signature = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            entry = self._entries.get(doc_id)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(doc_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        df = read_structured_file(file_path)
+        self.put(doc_id, file_path, df)
+        return df
+
+    def put(self, doc_id: str, file_path: Path, df: pd.DataFrame):
+        stat = file_path.stat()
+        signature = (stat.st_mtime_ns, stat.st_size)
+        size = int(df.memory_usage(deep=True).sum())
+
+        with self._lock:
+            self._discard(doc_id)
+            if size <= self.max_bytes:
+                self._entries[doc_id] = [signature, df, size, {}]
+                self.current_bytes += size
+                self._evict()
+
+    def get_derived(self, doc_id: str, file_path: Path, name: str, builder):
+        """Return builder(df) for a cached document, building it once per cached DataFrame"""
+        df = self.get(doc_id, file_path)
+        with self._lock:
+            entry = self._entries.get(doc_id)
+            if entry is not None and entry[1] is df and name in entry[3]:
+                return entry[3][name]
+
+        value, size = builder(df)
+
+        with self._lock:
+            entry = self._entries.get(doc_id)
+            if entry is not None and entry[1] is df and name not in entry[3]:
+                entry[3][name] = value
+                entry[2] += size
+                self.current_bytes += size
+                self._evict()
+        return value
+
+    def _evict(self):
+        while self.current_bytes > self.max_bytes and self._entries:
+            _, (_, _, evicted_size, _) = self._entries.popitem(last=False)
+            self.current_bytes -= evicted_size
+            self.evictions += 1
+
+    def _discard(self, doc_id: str):
+        entry = self._entries.pop(doc_id, None)
+        if entry is not None:
+            self.current_bytes -= entry[2]
+
+    def invalidate(self, doc_id: Optional[str] = None):
+        """Drop one document from the cache, or everything when doc_id is None"""
+        with self._lock:
+            if doc_id is None:
+                self._entries.clear()
+                self.current_bytes = 0
+            else:
+                self._discard(doc_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "current_bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+dataframe_cache = DataFrameCache(DATAFRAME_CACHE_MAX_MB * 1024 * 1024)
+
+# Read-only memory maps of columnar copies, shared by all worker processes through the page cache
+class ColumnarStore:
+    """
+    LRU of memory-mapped Arrow tables keyed by columnar file path. Opening a table only
+    reads its footer; column data is paged in from the OS page cache on access, so every
+    worker process reading a document shares one physical copy of it. Entries are
+    validated against the file's mtime/size, so a replaced file is mapped again.
+    """
+
+    def __init__(self, max_tables: int):
+        self.max_tables = max_tables
+        self._tables: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, columnar_path: Path) -> pa.Table:
+        key = str(columnar_path)
+        stat = columnar_path.stat()
+        signature = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            entry = self._tables.get(key)
+            if entry is not None and entry[0] == signature:
+                self._tables.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        table = feather.read_table(columnar_path, memory_map=True)
+        with self._lock:
+            self._tables[key] = (signature, table)
+            self._tables.move_to_end(key)
+            while len(self._tables) > self.max_tables:
+                self._tables.popitem(last=False)
+        return table
+
+    def invalidate(self, columnar_path: Optional[str] = None):
+        """Unmap one file, or everything when columnar_path is None"""
+        with self._lock:
+            if columnar_path is None:
+                self._tables.clear()
+            else:
+                self._tables.pop(str(Path(columnar_path)), None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "tables": len(self._tables),
+                "max_tables": self.max_tables,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+columnar_store = ColumnarStore(COLUMNAR_STORE_MAX_TABLES)
+
+# Two-tier cache of Groq responses
+class LLMResponseCache:
+    """
+    Groq responses keyed by a hash of model, prompt, max_tokens and document version.
+    An in-memory LRU tier sits in front of the llm_response_cache table; every entry has its own TTL.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model: str, prompt: str, max_tokens: int, document_version: Optional[str]) -> str:
+        raw = json.dumps([model, prompt, max_tokens, document_version])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, cache_key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(cache_key)
+                    self.memory_hits += 1
+                    return entry[0]
+                del self._entries[cache_key]
+
+        conn = get_db_connection()
+        row = conn.execute(
+            "SELECT response, expires_at FROM llm_response_cache WHERE cache_key = ?", (cache_key,)
+        ).fetchone()
+        if row is not None and row["expires_at"] <= now:
+            conn.execute("DELETE FROM llm_response_cache WHERE cache_key = ?", (cache_key,))
+            conn.commit()
+            row = None
+        conn.close()
+
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.db_hits += 1
+            self._remember(cache_key, row["response"], row["expires_at"])
+        return row["response"]
+
+    def set(self, cache_key: str, response: str, ttl_seconds: int):
+        now = time.time()
+        expires_at = now + ttl_seconds
+        conn = get_db_connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_response_cache (cache_key, response, created_at, expires_at) VALUES (?, ?, ?, ?)",
+            (cache_key, response, now, expires_at)
+        )
+        conn.commit()
+        conn.close()
+        with self._lock:
+            self._remember(cache_key, response, expires_at)
+
+    def _remember(self, cache_key: str, response: str, expires_at: float):
+        self._entries[cache_key] = (response, expires_at)
+        self._entries.move_to_end(cache_key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop the in-memory tier; the table is emptied by the caller's transaction"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.memory_hits + self.db_hits
+            lookups = hits + self.misses
+            return {
+                "memory_entries": len(self._entries),
+                "max_memory_entries": self.max_entries,
+                "memory_hits": self.memory_hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0
+            }
+
+llm_response_cache = LLMResponseCache(LLM_CACHE_MAX_ENTRIES)
+
+# Worker processes keep their own caches; deletes are announced through cache_invalidations
+CACHE_INVALIDATIONS_KEPT = 10000
+
+def publish_cache_invalidation(conn: sqlite3.Connection, rows: Iterable[sqlite3.Row] = ()):
+    """
+    Record that the given document rows were removed (no rows: everything was) so other
+    worker processes drop their cached data. The caller commits with its own changes.
+    """
+    now = datetime.now().isoformat()
+    events = [(row["id"], row["columnar_path"], now) for row in rows] or [(None, None, now)]
+    conn.executemany(
+        "INSERT INTO cache_invalidations (document_id, columnar_path, created_at) VALUES (?, ?, ?)", events
+    )
+    conn.execute(
+        "DELETE FROM cache_invalidations WHERE id <= (SELECT MAX(id) FROM cache_invalidations) - ?",
+        (CACHE_INVALIDATIONS_KEPT,)
+    )
+
+def apply_cache_invalidation(document_id: Optional[str], columnar_path: Optional[str]):
+    if document_id is None:
+        dataframe_cache.invalidate()
+        columnar_store.invalidate()
+        llm_response_cache.clear()
+        return
+    dataframe_cache.invalidate(document_id)
+    if columnar_path:
+        columnar_store.invalidate(columnar_path)
+
+class CacheInvalidationListener:
+    """Applies invalidations published by any worker process, in order, exactly once per process"""
+
+    def __init__(self):
+        self.last_seen_id: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def sync(self) -> int:
+        with self._lock:
+            conn = get_db_connection()
+            try:
+                if self.last_seen_id is None:
+                    # Caches start empty, so earlier events do not apply to this process
+                    self.last_seen_id = conn.execute("SELECT COALESCE(MAX(id), 0) AS id FROM cache_invalidations").fetchone()["id"]
+                    return 0
+                events = conn.execute(
+                    "SELECT id, document_id, columnar_path FROM cache_invalidations WHERE id > ? ORDER BY id",
+                    (self.last_seen_id,)
+                ).fetchall()
+            finally:
+                conn.close()
+            for event in events:
+                apply_cache_invalidation(event["document_id"], event["columnar_path"])
+                self.last_seen_id = event["id"]
+            return len(events)
+
+cache_invalidation_listener = CacheInvalidationListener()
+
+def read_structured_file(file_path: Path) -> pd.DataFrame:
+    file_extension = file_path.suffix.lower()
+    if file_extension == COLUMNAR_EXTENSION:
+        # Arrow IPC is read through a memory map; code needing only some columns (the query
+        # engine) works on the mapped table from columnar_store instead of a DataFrame
+        return feather.read_table(file_path, memory_map=True).to_pandas()
+    elif file_extension in ['.xlsx', '.xls']:
+        return pd.read_excel(file_path)
+    elif file_extension == '.csv':
+        return pd.read_csv(file_path)
+    raise ValueError("Unsupported file type for structured data extraction.")
+
+def resolve_structured_source(file_path: Path, columnar_path: Optional[str] = None) -> Path:
+    """Prefer the columnar copy of a document, the original upload is only kept for download"""
+    if columnar_path and Path(columnar_path).exists():
+        return Path(columnar_path)
+    candidate = file_path.with_suffix(COLUMNAR_EXTENSION)
+    return candidate if candidate.exists() else file_path
+
+def load_structured_dataframe(file_path: Path, doc_id: Optional[str] = None,
+                              columnar_path: Optional[str] = None) -> pd.DataFrame:
+    """Load a whole structured document through the DataFrame cache (uploads are stored as <doc_id><ext>)"""
+    source_path = resolve_structured_source(file_path, columnar_path)
+    return dataframe_cache.get(doc_id or file_path.stem, source_path)
+
+def make_arrow_compatible(df: pd.DataFrame) -> pd.DataFrame:
+    """Stringify column names and mixed-type object columns that Arrow cannot store as-is"""
+    df = df.copy()
+    df.columns = [str(col) for col in df.columns]
+    for col in df.columns:
+        if df[col].dtype == object:
+            try:
+                pa.array(df[col], from_pandas=True)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+def write_columnar_copy(df: pd.DataFrame, file_path: Path) -> tuple[Path, pd.DataFrame]:
+    """Write an uncompressed Arrow IPC copy next to the original so later reads can memory-map it"""
+    df = make_arrow_compatible(df)
+    columnar_path = file_path.with_suffix(COLUMNAR_EXTENSION)
+    tmp_path = columnar_path.with_suffix(COLUMNAR_EXTENSION + ".tmp")
+    feather.write_feather(df, tmp_path, compression="uncompressed")
+    os.replace(tmp_path, columnar_path)
+    return columnar_path, df
+
+def promote_arrow_type(types: List[pa.DataType]) -> pa.DataType:
+    """Common type for a column whose inferred type differs between CSV chunks"""
+    known = [t for t in types if not pa.types.is_null(t)]
+    if not known:
+        return pa.null()
+    if all(t == known[0] for t in known):
+        return known[0]
+    if all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in known):
+        return pa.float64()
+    return pa.large_string()
+
+def write_columnar_chunks(chunks: Iterable[pd.DataFrame], columnar_path: Path) -> int:
+    """
+    Write DataFrame chunks to an Arrow IPC file, holding one chunk in memory at a time, and
+    return the row count. Chunks are appended to a segment file while their inferred schema
+    holds; if it changes (e.g. a column turns from int to float), a new segment starts and
+    the segments are merged into the final file under a promoted schema.
+    """
+    tmp_path = columnar_path.with_suffix(COLUMNAR_EXTENSION + ".tmp")
+    segments: List[tuple[Path, pa.Schema]] = []
+    writer = None
+    row_count = 0
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(make_arrow_compatible(chunk), preserve_index=False)
+            table = table.replace_schema_metadata(None)
+            if writer is None or table.schema != segments[-1][1]:
+                if writer is not None:
+                    writer.close()
+                segment_path = columnar_path.with_suffix(f"{COLUMNAR_EXTENSION}.part{len(segments)}")
+                writer = pa.ipc.new_file(str(segment_path), table.schema)
+                segments.append((segment_path, table.schema))
+            writer.write_table(table)
+            row_count += len(chunk)
+        if writer is not None:
+            writer.close()
+            writer = None
+
+        if not segments:
+            with pa.ipc.new_file(str(tmp_path), pa.schema([])):
+                pass
+            os.replace(tmp_path, columnar_path)
+            return 0
+
+        schema = pa.schema([
+            pa.field(name, promote_arrow_type([segment_schema.field(name).type for _, segment_schema in segments]))
+            for name in segments[0][1].names
+        ])
+        if len(segments) == 1:
+            os.replace(segments[0][0], columnar_path)
         else:
-            raise ValueError("Unsupported file type for structured data extraction.")
+            with pa.ipc.new_file(str(tmp_path), schema) as merged:
+                for segment_path, _ in segments:
+                    with pa.memory_map(str(segment_path)) as segment_source:
+                        segment = pa.ipc.open_file(segment_source)
+                        for i in range(segment.num_record_batches):
+                            merged.write_table(pa.Table.from_batches([segment.get_batch(i)]).cast(schema))
+            os.replace(tmp_path, columnar_path)
+        return row_count
+    finally:
+        if writer is not None:
+            writer.close()
+        for segment_path, _ in segments:
+            segment_path.unlink(missing_ok=True)
+        tmp_path.unlink(missing_ok=True)
+
+def read_csv_chunks(file_path: Path, progress=None) -> Iterator[pd.DataFrame]:
+    """Parse a CSV CSV_CHUNK_ROWS rows at a time; progress(fraction) gets the share of the file read so far"""
+    file_size = max(file_path.stat().st_size, 1)
+    empty = True
+    with open(file_path, "rb") as source:
+        for chunk in pd.read_csv(source, chunksize=CSV_CHUNK_ROWS, on_bad_lines=CSV_BAD_LINES):
+            empty = False
+            yield chunk
+            if progress:
+                progress(min(source.tell() / file_size, 1.0))
+    if empty:
+        # Header-only CSV: keep its columns
+        yield pd.read_csv(file_path, nrows=0)
+
+def write_csv_columnar_copy(file_path: Path, progress=None) -> tuple[Path, int]:
+    """Convert a CSV to its Arrow IPC copy in bounded memory"""
+    columnar_path = file_path.with_suffix(COLUMNAR_EXTENSION)
+    return columnar_path, write_columnar_chunks(read_csv_chunks(file_path, progress), columnar_path)
+
+def list_workbook_sheets(file_path: Path) -> List[str]:
+    workbook = openpyxl.load_workbook(file_path, read_only=True)
+    try:
+        return workbook.sheetnames
+    finally:
+        workbook.close()
+
+def excel_column_names(header: tuple) -> List[str]:
+    """Header row to unique column names, the way pandas names blank and repeated headers"""
+    names: List[str] = []
+    seen: Dict[str, int] = {}
+    for i, value in enumerate(header):
+        name = f"Unnamed: {i}" if value is None or str(value).strip() == "" else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+def read_xlsx_sheet_chunks(file_path: Path, sheet_name: str, progress=None) -> Iterator[pd.DataFrame]:
+    """
+    Stream one worksheet with openpyxl's read-only mode, XLSX_CHUNK_ROWS rows at a time.
+    Only this sheet is parsed; the first row is the header and fully empty rows are skipped.
+    """
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet_name]
+        rows = worksheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            yield pd.DataFrame()
+            return
+        columns = excel_column_names(header)
+        width = len(columns)
+        total_rows = worksheet.max_row
+        chunk: List[tuple] = []
+        rows_read = 0
+        empty = True
+        for row in rows:
+            rows_read += 1
+            if all(value is None for value in row):
+                continue
+            chunk.append(tuple(row[:width]) + (None,) * (width - len(row)))
+            if len(chunk) >= XLSX_CHUNK_ROWS:
+                empty = False
+                yield pd.DataFrame.from_records(chunk, columns=columns)
+                chunk = []
+                if progress and total_rows:
+                    progress(min(rows_read / total_rows, 1.0))
+        if chunk or empty:
+            yield pd.DataFrame.from_records(chunk, columns=columns)
+    finally:
+        workbook.close()
+
+def sheet_columnar_path(file_path: Path, doc_id: str) -> Path:
+    """Columnar copy of a (sheet) document; the first sheet shares the upload's <doc_id> stem"""
+    return file_path.with_name(f"{doc_id}{COLUMNAR_EXTENSION}")
+
+def iter_columnar_batches(columnar_path: Path) -> Iterator[pd.DataFrame]:
+    """
+    Yield the record batches of a columnar copy as DataFrames, one at a time. Batches are read
+    with plain file reads rather than a memory map so a full scan does not leave the whole file
+    resident in the process.
+    """
+    with pa.OSFile(str(columnar_path)) as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            yield reader.get_batch(i).to_pandas()
+
+def infer_column_schema(df: pd.DataFrame) -> List[Dict[str, str]]:
+    return [{"name": str(col), "dtype": str(dtype)} for col, dtype in df.dtypes.items()]
+
+def preview_records(df: pd.DataFrame, rows: int = 5) -> List[Dict[str, Any]]:
+    head = df.head(rows).astype(object)
+    return head.where(head.notna(), None).to_dict(orient='records')
+
+def truncate_value(value: Any, max_chars: int = PROMPT_VALUE_MAX_CHARS) -> str:
+    text = str(value)
+    return text if len(text) <= max_chars else text[:max_chars - 1] + "…"
+
+def to_python_scalar(value: Any) -> Any:
+    return value.item() if hasattr(value, "item") else value
+
+class DocumentDigestBuilder:
+    """
+    Accumulates a document digest chunk by chunk: per-column dtype and null count, min/max/mean
+    for numeric and datetime columns, top-k values for the rest, plus a fixed-seed row sample.
+    Value counts are pruned to the most frequent ones past DIGEST_MAX_TRACKED_VALUES.
+    """
+
+    def __init__(self, row_count: int):
+        self.row_count = row_count
+        sample_size = min(DIGEST_SAMPLE_ROWS, row_count)
+        self._sample_positions = np.sort(
+            np.random.default_rng(0).choice(row_count, size=sample_size, replace=False)
+        ) if sample_size else np.array([], dtype=np.int64)
+        self._sample_rows: List[Dict[str, str]] = []
+        self._offset = 0
+        self._columns: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, df: pd.DataFrame):
+        for col in df.columns:
+            series = df[col]
+            stats = self._columns.get(str(col))
+            if stats is None:
+                if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+                    kind = "numeric"
+                elif pd.api.types.is_datetime64_any_dtype(series):
+                    kind = "datetime"
+                else:
+                    kind = "categorical"
+                stats = self._columns[str(col)] = {
+                    "dtype": str(series.dtype), "kind": kind, "null_count": 0,
+                    "count": 0, "sum": 0.0, "min": None, "max": None,
+                    "values": Counter(), "pruned": False
+                }
+
+            non_null = series.dropna()
+            stats["null_count"] += len(series) - len(non_null)
+            if not len(non_null):
+                continue
+            if stats["kind"] == "categorical":
+                values = stats["values"]
+                counts = non_null.astype(str).value_counts()
+                values.update(dict(zip(counts.index.tolist(), counts.tolist())))
+                if len(values) > DIGEST_MAX_TRACKED_VALUES:
+                    stats["values"] = Counter(dict(values.most_common(DIGEST_MAX_TRACKED_VALUES // 2)))
+                    stats["pruned"] = True
+            else:
+                low, high = to_python_scalar(non_null.min()), to_python_scalar(non_null.max())
+                stats["min"] = low if stats["min"] is None else min(stats["min"], low)
+                stats["max"] = high if stats["max"] is None else max(stats["max"], high)
+                if stats["kind"] == "numeric":
+                    stats["count"] += len(non_null)
+                    stats["sum"] += float(non_null.sum())
+
+        end = self._offset + len(df)
+        in_chunk = self._sample_positions[(self._sample_positions >= self._offset) & (self._sample_positions < end)]
+        if len(in_chunk):
+            self._sample_rows.extend(
+                {str(k): truncate_value(v) for k, v in row.items()}
+                for row in df.iloc[in_chunk - self._offset].astype(str).to_dict(orient='records')
+            )
+        self._offset = end
+
+    def result(self) -> Dict[str, Any]:
+        columns = []
+        for name, stats in self._columns.items():
+            info: Dict[str, Any] = {"name": name, "dtype": stats["dtype"], "null_count": stats["null_count"]}
+            if stats["kind"] == "categorical":
+                info["distinct_count"] = len(stats["values"])
+                if stats["pruned"]:
+                    # Only a lower bound is known once rare values were pruned
+                    info["distinct_count_approx"] = True
+                info["top_values"] = [
+                    {"value": truncate_value(value), "count": int(count)}
+                    for value, count in stats["values"].most_common(DIGEST_TOP_K)
+                ]
+            elif stats["min"] is not None:
+                if stats["kind"] == "datetime":
+                    info.update(min=stats["min"].isoformat(), max=stats["max"].isoformat())
+                else:
+                    info.update(min=stats["min"], max=stats["max"], mean=round(stats["sum"] / stats["count"], 4))
+            columns.append(info)
+        return {
+            "row_count": self.row_count,
+            "column_count": len(columns),
+            "columns": columns,
+            "sample_rows": self._sample_rows
+        }
+
+def build_document_digest(df: pd.DataFrame) -> Dict[str, Any]:
+    builder = DocumentDigestBuilder(len(df))
+    builder.add(df)
+    return builder.result()
+
+def write_document_digest(conn: sqlite3.Connection, doc_id: str, digest: Dict[str, Any]):
+    """Store a document's digest inside the caller's transaction"""
+    conn.execute(
+        "INSERT OR REPLACE INTO document_digests (document_id, digest, created_at) VALUES (?, ?, ?)",
+        (doc_id, json.dumps(digest, default=str), datetime.now().isoformat())
+    )
 
-        num_rows_for_ai = min(len(df), 50)
-        num_cols_for_ai = min(len(df.columns), 10)
+def store_document_digest(conn: sqlite3.Connection, doc_id: str, df: pd.DataFrame) -> Dict[str, Any]:
+    """Compute and store a document's digest inside the caller's transaction"""
+    digest = build_document_digest(df)
+    write_document_digest(conn, doc_id, digest)
+    return digest
 
-        data_string = df.head(num_rows_for_ai).iloc[:, :num_cols_for_ai].to_string()
-        return data_string, len(df)
+def get_document_digest(doc_id: str) -> Optional[Dict[str, Any]]:
+    conn = get_db_connection()
+    try:
+        row = conn.execute("SELECT digest FROM document_digests WHERE document_id = ?", (doc_id,)).fetchone()
+    finally:
+        conn.close()
+    return json.loads(row["digest"]) if row else None
+
+def format_prompt_row(row: Dict[str, Any]) -> str:
+    return "; ".join(f"{k}={truncate_value(v)}" for k, v in row.items())
+
+def format_column_digest(info: Dict[str, Any]) -> str:
+    parts = [f"{info['name']} ({info['dtype']}"]
+    if info["null_count"]:
+        parts.append(f", {info['null_count']} kosong")
+    if "min" in info:
+        parts.append(f", min={info['min']}, max={info['max']}")
+        if "mean" in info:
+            parts.append(f", rata-rata={info['mean']}")
+    if "top_values" in info:
+        top = ", ".join(f"{item['value']} ({item['count']})" for item in info["top_values"])
+        distinct = f">{info['distinct_count']}" if info.get("distinct_count_approx") else info["distinct_count"]
+        parts.append(f", {distinct} nilai unik; terbanyak: {top}")
+    return "- " + "".join(parts) + ")"
+
+def build_prompt_context(
+    digest: Optional[Dict[str, Any]],
+    search_text: str,
+    search_rows: List[Dict[str, Any]],
+    token_budget: int = PROMPT_CONTEXT_TOKEN_BUDGET
+) -> str:
+    """
+    Assemble prompt context from a document's digest and its search hits, most useful first:
+    dataset shape, matching rows, column statistics, then sample rows. Lines are added until
+    the token budget runs out.
+    """
+    sections: List[List[str]] = []
+    if digest:
+        sections.append([f"Dataset: {digest['row_count']} baris, {digest['column_count']} kolom."])
+    if search_rows:
+        sections.append(["Baris yang cocok dengan pertanyaan:"] + [
+            f"{i + 1}. {format_prompt_row(row)}" for i, row in enumerate(search_rows)
+        ])
+    else:
+        # No hits: keep the search outcome (not found, or the search error)
+        sections.append([search_text])
+    if digest:
+        sections.append(["Statistik kolom:"] + [format_column_digest(info) for info in digest["columns"]])
+        if digest["sample_rows"]:
+            sections.append(["Contoh baris:"] + [format_prompt_row(row) for row in digest["sample_rows"]])
+
+    lines: List[str] = []
+    used_tokens = 0
+    for section in sections:
+        for line in section:
+            line_tokens = estimate_tokens(line) + 1
+            if used_tokens + line_tokens > token_budget:
+                lines.append("(konteks dipotong sesuai batas token)")
+                return "\n".join(lines)
+            lines.append(line)
+            used_tokens += line_tokens
+    return "\n".join(lines)
+
+# Function to extract data from Excel or CSV
+def extract_data_from_structured_file(file_path: Path, doc_id: Optional[str] = None):
+    """Compact, token-budgeted summary of a structured file and its row count"""
+    try:
+        digest = get_document_digest(doc_id) if doc_id else None
+        if digest is None:
+            df = load_structured_dataframe(file_path, doc_id)
+            digest = build_document_digest(df)
+        return build_prompt_context(digest, "", []), digest["row_count"]
     except Exception as e:
         print(f"Error extracting data from structured file {file_path}: {e}")
         return None, 0
 
-def query_groq(prompt: str, max_tokens: int = 2000, model: str = "llama3-8b-8192") -> str:
+def build_groq_payload(prompt: str, max_tokens: int, model: str, stream: bool = False) -> Dict[str, Any]:
+    return {
+        "model": model,
+        "messages": [
+            {
+                "role": "system",
+                "content": "Anda adalah asisten analisis data lokal yang membantu pengguna memahami konten dokumen terstruktur. Berikan jawaban yang akurat, informatif, dan relevan dalam bahasa Indonesia. Jika pertanyaan tidak relevan dengan dokumen atau bersifat umum yang tidak terkait analisis dokumen, jawablah dengan sopan bahwa Anda hanya berfokus pada analisis data terstruktur."
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ],
+        "max_tokens": max_tokens,
+        "temperature": 0.7,
+        "top_p": 0.9,
+        "stream": stream
+    }
+
+def groq_error_message(status_code: int, body: str) -> str:
+    if status_code == 401:
+        return "Error: Invalid GROQ API key. Please check your credentials."
+    elif status_code == 429:
+        return "Error: Rate limit exceeded. Please try again later."
+    print(f"GROQ API error: {status_code} {body}")
+    return f"Error: GROQ API returned status {status_code}"
+
+# Request coalescing for identical in-flight Groq prompts
+class SingleFlight:
+    """
+    Identical concurrent calls share one in-flight task: the first caller starts it,
+    later callers await the same result. The task is shielded, so a caller that
+    disconnects does not cancel the request for the others.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn):
+        task = self._calls.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done, key=key: self._forget(key, done))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._calls),
+            "upstream_requests": self.leaders,
+            "coalesced": self.coalesced
+        }
+
+groq_single_flight = SingleFlight()
+
+async def query_groq(prompt: str, max_tokens: int = 2000, model: str = GROQ_MODEL,
+                     priority: int = GROQ_PRIORITY_INTERACTIVE) -> str:
+    """
+    Query GROQ API for AI responses. Identical prompts already in flight are coalesced.
+    """
+    if not GROQ_API_KEY:
+        return "Error: GROQ API key not configured. Please check your .env file."
+
+    payload = build_groq_payload(prompt, max_tokens, model)
+    key = hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+    with stage_timer("groq"):
+        return await groq_single_flight.do(key, lambda: send_groq_query(payload, priority))
+
+async def send_groq_query(payload: Dict[str, Any], priority: int) -> str:
+    try:
+        response = await scheduled_groq_post(payload, priority)
+
+        if response.status_code == 200:
+            result = response.json()
+            if "choices" in result and len(result["choices"]) > 0:
+                return result["choices"][0]["message"]["content"]
+            else:
+                return "Error: Invalid response format from GROQ API"
+        return groq_error_message(response.status_code, response.text)
+
+    except GroqQueueFull:
+        metrics.inc("groq_errors_total", "queue_full")
+        return "Error: Too many pending GROQ requests. Please try again later."
+    except asyncio.TimeoutError:
+        metrics.inc("groq_errors_total", "queue_timeout")
+        return "Error: Timed out waiting for GROQ rate limit capacity. Please try again later."
+    except httpx.ConnectError:
+        return "Error: Unable to connect to GROQ API. Please check your internet connection."
+    except httpx.TimeoutException:
+        return "Error: GROQ API request timed out. Please try again."
+    except Exception as e:
+        print(f"Error querying GROQ: {e}")
+        return f"Error: {str(e)}"
+
+async def stream_groq(prompt: str, max_tokens: int = 2000, model: str = GROQ_MODEL,
+                      priority: int = GROQ_PRIORITY_INTERACTIVE) -> AsyncIterator[str]:
+    """
+    Query GROQ API with stream=True and yield content tokens as they arrive.
+    Errors are yielded as a single message, like query_groq returns them.
+    """
+    if not GROQ_API_KEY:
+        yield "Error: GROQ API key not configured. Please check your .env file."
+        return
+
+    with stage_timer("groq"):
+        try:
+            async with groq_stream(build_groq_payload(prompt, max_tokens, model, stream=True), priority) as response:
+                if response.status_code != 200:
+                    body = (await response.aread()).decode(errors="replace")
+                    yield groq_error_message(response.status_code, body)
+                    return
+
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    choices = json.loads(data).get("choices") or []
+                    token = choices[0].get("delta", {}).get("content") if choices else None
+                    if token:
+                        yield token
+
+        except GroqQueueFull:
+            metrics.inc("groq_errors_total", "queue_full")
+            yield "Error: Too many pending GROQ requests. Please try again later."
+        except asyncio.TimeoutError:
+            metrics.inc("groq_errors_total", "queue_timeout")
+            yield "Error: Timed out waiting for GROQ rate limit capacity. Please try again later."
+        except httpx.ConnectError:
+            yield "Error: Unable to connect to GROQ API. Please check your internet connection."
+        except httpx.TimeoutException:
+            yield "Error: GROQ API request timed out. Please try again."
+        except Exception as e:
+            print(f"Error streaming from GROQ: {e}")
+            yield f"Error: {str(e)}"
+
+# Vectorized row matching
+def build_search_views(df: pd.DataFrame) -> tuple[Dict[str, pd.Series], int]:
+    """Lowercase string view of every column, built once per cached DataFrame"""
+    views = {}
+    for col in df.columns:
+        view = df[col].astype(str).astype("string[pyarrow]").str.lower()
+        views[col] = view
+    size = sum(int(view.memory_usage(deep=True)) for view in views.values())
+    return views, size
+
+def parse_search_query(query: str) -> tuple[List[str], str]:
+    """
+    Split a query into lowercase terms. "a OR b" matches either term, "a AND b" needs both;
+    anything else is matched as a single phrase, like the original substring search.
+    """
+    if re.search(r"\s+OR\s+", query):
+        terms, mode = re.split(r"\s+OR\s+", query), "or"
+    elif re.search(r"\s+AND\s+", query):
+        terms, mode = re.split(r"\s+AND\s+", query), "and"
+    else:
+        terms, mode = [query], "and"
+    terms = [term.strip().strip('"').lower() for term in terms]
+    return [term for term in terms if term], mode
+
+def match_rows(search_views: Dict[str, pd.Series], terms: List[str], mode: str = "and", limit: int = 5) -> np.ndarray:
+    """
+    Return positions of the top-N matching rows. In OR mode rows matching more terms come first;
+    ties (and every AND match) keep document order.
+    """
+    if not search_views or not terms:
+        return np.array([], dtype=np.int64)
+
+    row_count = len(next(iter(search_views.values())))
+    combined = np.ones(row_count, dtype=bool) if mode == "and" else None
+    scores = np.zeros(row_count, dtype=np.int32)
+
+    for term in terms:
+        term_mask = np.zeros(row_count, dtype=bool)
+        for view in search_views.values():
+            term_mask |= view.str.contains(term, regex=False).to_numpy(dtype=bool, na_value=False)
+        if mode == "and":
+            combined &= term_mask
+            if not combined.any():
+                return np.array([], dtype=np.int64)
+        else:
+            scores += term_mask
+
+    if mode == "and":
+        return np.flatnonzero(combined)[:limit]
+
+    candidates = np.flatnonzero(scores)
+    order = np.argsort(-scores[candidates], kind="stable")
+    return candidates[order][:limit]
+
+# Full-text index (SQLite FTS5)
+# Rows of a document use FTS rowids in [fts_key << FTS_ROWID_SHIFT, (fts_key + 1) << FTS_ROWID_SHIFT),
+# so a document's rows can be searched and deleted as a rowid range.
+FTS_ROWID_SHIFT = 32
+FTS_INSERT_BATCH_SIZE = 10000
+# Both bound the work of one search, whatever the document size: BM25 ranks at most
+# FTS_RANK_CANDIDATES matches, the substring fallback scans at most FTS_SUBSTRING_SCAN_ROWS rows
+FTS_RANK_CANDIDATES = 1000
+FTS_SUBSTRING_SCAN_ROWS = 2000
+FTS_PREFIX_MIN_CHARS = 3
+# Chat questions are searched by their keywords; these words carry no search meaning
+SEARCH_STOPWORDS = frozenset("""
+    apa apakah berapa siapa mana kapan bagaimana mengapa kenapa yang dan atau di ke dari
+    untuk dengan pada dalam ini itu ada adalah saya kami kita anda tolong mohon tampilkan
+    tunjukkan sebutkan berikan cari carikan data dokumen tabel semua seluruh juga tidak
+    bisa dapat akan sudah belum the and for of in to is what how which
+""".split())
+CHAT_SEARCH_MAX_TERMS = 8
+
+def fts_rowid_range(fts_key: int) -> tuple[int, int]:
+    return fts_key << FTS_ROWID_SHIFT, ((fts_key + 1) << FTS_ROWID_SHIFT) - 1
+
+def build_row_texts(df: pd.DataFrame) -> pd.Series:
+    """Concatenate the cell values of each row into one searchable string"""
+    row_texts = pd.Series([""] * len(df), index=df.index, dtype=object)
+    for col in df.columns:
+        values = df[col]
+        # Blank after astype(str): pandas 3 keeps missing values missing through astype(str)
+        row_texts = row_texts + " " + values.astype(str).where(values.notna(), "")
+    return row_texts.str.strip()
+
+def index_document_rows(conn: sqlite3.Connection, doc_id: str, df: pd.DataFrame) -> Optional[int]:
+    """Add a document's rows to the FTS index, see index_document_chunks"""
+    return index_document_chunks(conn, doc_id, [df])
+
+def reserve_fts_key(conn: sqlite3.Connection) -> int:
+    """
+    Pick an unused FTS key and take the write lock, so no other writer can pick it before
+    the caller's first insert commits. Keys of documents still being indexed are only
+    visible as FTS rowids, so both the index and excel_documents are checked.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    last_row = conn.execute("SELECT rowid FROM structured_rows_fts ORDER BY rowid DESC LIMIT 1").fetchone()
+    last_document = conn.execute("SELECT COALESCE(MAX(fts_key), 0) AS fts_key FROM excel_documents").fetchone()
+    in_index = last_row["rowid"] >> FTS_ROWID_SHIFT if last_row else 0
+    return max(in_index, last_document["fts_key"]) + 1
+
+def discard_fts_rows(conn: sqlite3.Connection, fts_key: int):
+    low, high = fts_rowid_range(fts_key)
+    conn.execute("DELETE FROM structured_rows_fts WHERE rowid BETWEEN ? AND ?", (low, high))
+    conn.commit()
+
+def index_document_chunks(conn: sqlite3.Connection, doc_id: str, chunks: Iterable[pd.DataFrame]) -> Optional[int]:
+    """
+    Add a document's rows to the FTS index from consecutive row chunks. Every batch of
+    FTS_INSERT_BATCH_SIZE rows is committed on its own, so other requests can write
+    between batches; call it outside a transaction. The returned key is not attached to
+    the document yet: the caller stores it with attach_fts_key in the transaction that
+    makes the document searchable. A document without rows gets no key (None).
+    """
+    fts_key = None
+    row_offset = 0
+    try:
+        for df in chunks:
+            row_texts = build_row_texts(df).tolist()
+            for start in range(0, len(row_texts), FTS_INSERT_BATCH_SIZE):
+                if fts_key is None:
+                    fts_key = reserve_fts_key(conn)
+                    base_rowid, _ = fts_rowid_range(fts_key)
+                batch = row_texts[start:start + FTS_INSERT_BATCH_SIZE]
+                first_row = row_offset + start
+                conn.executemany(
+                    "INSERT INTO structured_rows_fts (rowid, document_id, row_id, content) VALUES (?, ?, ?, ?)",
+                    ((base_rowid + first_row + i, doc_id, first_row + i, text) for i, text in enumerate(batch))
+                )
+                conn.commit()
+            row_offset += len(row_texts)
+    except Exception:
+        conn.rollback()
+        if fts_key is not None:
+            discard_fts_rows(conn, fts_key)
+        raise
+    return fts_key
+
+def attach_fts_key(conn: sqlite3.Connection, doc_id: str, fts_key: Optional[int]):
+    """Point a document at its freshly indexed rows, replacing any earlier ones; the caller commits"""
+    remove_document_rows(conn, doc_id)
+    conn.execute("UPDATE excel_documents SET fts_key = ? WHERE id = ?", (fts_key, doc_id))
+
+def remove_document_rows(conn: sqlite3.Connection, doc_id: str):
+    """Remove a document's rows from the FTS index, unless a duplicate upload shares them; the caller commits"""
+    doc = conn.execute("SELECT fts_key FROM excel_documents WHERE id = ?", (doc_id,)).fetchone()
+    if doc and doc["fts_key"] is not None:
+        shared = conn.execute(
+            "SELECT 1 FROM excel_documents WHERE fts_key = ? AND id != ? LIMIT 1", (doc["fts_key"], doc_id)
+        ).fetchone()
+        if not shared:
+            low, high = fts_rowid_range(doc["fts_key"])
+            conn.execute("DELETE FROM structured_rows_fts WHERE rowid BETWEEN ? AND ?", (low, high))
+        conn.execute("UPDATE excel_documents SET fts_key = NULL WHERE id = ?", (doc_id,))
+
+def build_fts_query(terms: List[str], mode: str, prefix: bool = True) -> Optional[str]:
+    """
+    Turn parsed search terms into an FTS5 expression of phrases, tokenized like the index
+    (underscores separate tokens). With prefix, a phrase ending in a token of
+    FTS_PREFIX_MIN_CHARS or more is a prefix phrase; shorter prefixes ("1", "ja") would
+    expand to a large part of the index vocabulary.
+    """
+    phrases = []
+    for term in terms:
+        tokens = re.findall(r"[^\W_]+", term)
+        if tokens:
+            wildcard = "*" if prefix and len(tokens[-1]) >= FTS_PREFIX_MIN_CHARS else ""
+            phrases.append('"' + " ".join(tokens) + '"' + wildcard)
+    if not phrases:
+        return None
+    return (" OR " if mode == "or" else " AND ").join(phrases)
+
+def chat_search_query(message: str) -> str:
+    """
+    Turn a chat question into an OR query of its keywords, so rows matching any of them
+    are found and BM25 ranks rows matching the rarest and most of them first. A question
+    with no keywords left is searched as it is.
+    """
+    terms = []
+    for token in re.findall(r"[^\W_]+", message.lower()):
+        if len(token) >= FTS_PREFIX_MIN_CHARS and token not in SEARCH_STOPWORDS and token not in terms:
+            terms.append(token)
+    return " OR ".join(terms[:CHAT_SEARCH_MAX_TERMS]) or message
+
+def like_pattern(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+def search_fts_rows(conn: sqlite3.Connection, fts_key: int, terms: List[str], mode: str, limit: int,
+                    prefix: bool = True) -> List[int]:
+    """
+    Row positions of the best BM25 matches inside one document, ranked among the first
+    FTS_RANK_CANDIDATES matches. FTS only matches whole tokens and their prefixes, so when
+    it finds nothing the first FTS_SUBSTRING_SCAN_ROWS row texts are scanned for the terms
+    as substrings (e.g. "akart" in "Jakarta"); substrings further into a large document
+    are not found.
+    """
+    low, high = fts_rowid_range(fts_key)
+    fts_query = build_fts_query(terms, mode, prefix)
+    if fts_query is not None:
+        rows = conn.execute(
+            """
+            SELECT row_id FROM (
+                SELECT row_id, bm25(structured_rows_fts) AS score FROM structured_rows_fts
+                WHERE structured_rows_fts MATCH ? AND rowid BETWEEN ? AND ?
+                LIMIT ?
+            )
+            ORDER BY score
+            LIMIT ?
+            """,
+            (fts_query, low, high, FTS_RANK_CANDIDATES, limit)
+        ).fetchall()
+        if rows:
+            return [row["row_id"] for row in rows]
+    if not terms:
+        return []
+    high = min(high, low + FTS_SUBSTRING_SCAN_ROWS - 1)
+
+    # LIKE is case-insensitive for ASCII; terms are already lowercase
+    conditions = ["content LIKE ? ESCAPE '\\'"] * len(terms)
+    patterns = [like_pattern(term) for term in terms]
+    if mode == "and":
+        where, order, params = " AND ".join(conditions), "rowid", patterns
+    else:
+        # Rows matching more terms first, then document order
+        where = " OR ".join(conditions)
+        order = " + ".join(f"({condition})" for condition in conditions) + " DESC, rowid"
+        params = patterns + patterns
+    rows = conn.execute(
+        f"SELECT row_id FROM structured_rows_fts WHERE rowid BETWEEN ? AND ? AND ({where}) ORDER BY {order} LIMIT ?",
+        (low, high, *params, limit)
+    ).fetchall()
+    return [row["row_id"] for row in rows]
+
+def row_reader(source_path: Path, doc_id: str):
+    """Return a function fetching rows by position, straight from the memory-mapped columnar copy when possible"""
+    if source_path.suffix == COLUMNAR_EXTENSION:
+        table = columnar_store.get(source_path)
+        # One slice per row: take() on a table of many record batches concatenates whole
+        # columns first, which costs as much as the document is long
+        return lambda positions: pa.concat_tables([table.slice(position, 1) for position in positions]).to_pandas()
+    df = dataframe_cache.get(doc_id, source_path)
+    return lambda positions: df.iloc[positions]
+
+def format_search_results(rows: pd.DataFrame) -> tuple[str, list]:
+    # Only the returned rows are formatted
+    results = rows.astype(str).to_dict(orient='records')
+
+    if results:
+        formatted_results = []
+        for i, res in enumerate(results):
+            formatted_results.append(f"Row {i+1}: {', '.join(f'{k}: {v}' for k, v in res.items())}")
+        return "Ditemukan data relevan di dokumen terstruktur Anda:\n" + "\n".join(formatted_results), results
+    else:
+        return "Tidak ditemukan data relevan di dokumen terstruktur.", []
+
+# Function for searching structured data (Excel/CSV)
+def search_structured_data(doc_id: str, query: str, limit: int = 5, prefix: bool = True) -> tuple[str, list]:
+    return search_structured_data_many(doc_id, [query], limit, prefix)[0]
+
+def search_structured_data_many(doc_id: str, queries: List[str], limit: int = 5,
+                                prefix: bool = True) -> List[tuple[str, list]]:
+    """
+    Run several row searches against one document, opening the document and its index once.
+    prefix=False matches whole words in the index, as chat keyword searches do: an FTS prefix
+    query reads every index entry of the terms it expands to, in all documents.
+    """
+    conn = get_db_connection()
+    doc = conn.execute(
+        "SELECT file_path, columnar_path, fts_key FROM excel_documents WHERE id = ?",
+        (doc_id,)
+    ).fetchone()
+
+    if not doc:
+        conn.close()
+        return [("Dokumen data terstruktur tidak ditemukan.", [])] * len(queries)
+
+    file_path = Path(doc["file_path"])
+    try:
+        if file_path.suffix.lower() not in ['.xlsx', '.xls', '.csv']:
+            return [("Tipe file data terstruktur tidak didukung untuk pencarian.", [])] * len(queries)
+        with stage_timer("parse"):
+            source_path = resolve_structured_source(file_path, doc["columnar_path"])
+
+            if doc["fts_key"] is not None:
+                read_rows = row_reader(source_path, doc_id)
+                find_rows = lambda terms, mode: search_fts_rows(conn, doc["fts_key"], terms, mode, limit, prefix)
+            else:
+                # Documents not yet in the full-text index fall back to the in-memory scan
+                df = dataframe_cache.get(doc_id, source_path)
+                search_views = dataframe_cache.get_derived(doc_id, source_path, "search_views", build_search_views)
+                read_rows = lambda positions: df.iloc[positions]
+                find_rows = lambda terms, mode: match_rows(search_views, terms, mode, limit)
+
+        with stage_timer("search"):
+            results = []
+            for query in queries:
+                positions = find_rows(*parse_search_query(query))
+                # A miss has no rows to fetch from the document
+                results.append(format_search_results(read_rows(positions) if len(positions) else pd.DataFrame()))
+            return results
+    except Exception as e:
+        print(f"Error searching structured data: {e}")
+        return [(f"Gagal mencari di dokumen data terstruktur: {str(e)}", [])] * len(queries)
+    finally:
+        conn.close()
+
+# Local query engine: plans produced by Groq (or sent to /query) run over the whole document
+QUERY_COMPARISONS = {
+    "==": pc.equal, "!=": pc.not_equal, ">": pc.greater,
+    ">=": pc.greater_equal, "<": pc.less, "<=": pc.less_equal
+}
+QUERY_AGGREGATE_FUNCTIONS = {
+    "count": "count", "sum": "sum", "mean": "mean", "min": "min", "max": "max", "nunique": "count_distinct"
+}
+
+def aggregation_name(aggregation: QueryAggregation) -> str:
+    if aggregation.name:
+        return aggregation.name
+    return aggregation.func if aggregation.column == "*" else f"{aggregation.func}_{aggregation.column}"
+
+def validate_query_plan(plan: QueryPlan, columns: List[str]):
+    """Reject plans referring to columns the document does not have"""
+    referenced = set(plan.select) | set(plan.group_by) | {f.column for f in plan.filters}
+    referenced |= {a.column for a in plan.aggregations if a.column != "*"}
+    unknown = sorted(referenced - set(columns))
+    if unknown:
+        raise ValueError(f"Kolom tidak dikenal: {', '.join(unknown)}")
+    for aggregation in plan.aggregations:
+        if aggregation.column == "*" and aggregation.func != "count":
+            raise ValueError(f"Agregasi {aggregation.func} membutuhkan nama kolom")
+    if plan.aggregations and plan.select:
+        raise ValueError("select tidak dapat digabung dengan agregasi, gunakan group_by")
+
+def query_scalar(value: Any, column_type: pa.DataType) -> pa.Scalar:
+    try:
+        return pa.scalar(value).cast(column_type)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+        raise ValueError(f"Nilai {value!r} tidak cocok dengan tipe kolom {column_type}")
+
+def query_filter_mask(table: pa.Table, query_filter: QueryFilter) -> pa.ChunkedArray:
+    column = table[query_filter.column]
+    is_text = pa.types.is_string(column.type) or pa.types.is_large_string(column.type)
+    if query_filter.op == "contains":
+        text = column if is_text else pc.cast(column, pa.large_string())
+        return pc.match_substring(text, str(query_filter.value), ignore_case=True)
+
+    values = query_filter.value if isinstance(query_filter.value, list) else [query_filter.value]
+    if is_text and query_filter.op in ("==", "!=", "in"):
+        # Text matches ignore case, the model rarely knows the exact spelling
+        column = pc.utf8_lower(column)
+        values = [str(value).lower() for value in values]
+    if query_filter.op == "in":
+        value_set = pa.array([query_scalar(value, column.type).as_py() for value in values], type=column.type)
+        return pc.is_in(column, value_set=value_set)
+    return QUERY_COMPARISONS[query_filter.op](column, query_scalar(values[0], column.type))
+
+def open_query_table(doc_id: str) -> pa.Table:
+    """The document as an Arrow table, memory-mapped from its columnar copy when there is one"""
+    conn = get_db_connection()
+    try:
+        doc = conn.execute(
+            "SELECT file_path, columnar_path FROM excel_documents WHERE id = ?", (doc_id,)
+        ).fetchone()
+    finally:
+        conn.close()
+    if not doc:
+        raise HTTPException(status_code=404, detail="Dokumen data terstruktur tidak ditemukan.")
+    source_path = resolve_structured_source(Path(doc["file_path"]), doc["columnar_path"])
+    if source_path.suffix == COLUMNAR_EXTENSION:
+        return columnar_store.get(source_path)
+    return pa.Table.from_pandas(dataframe_cache.get(doc_id, source_path), preserve_index=False)
+
+def run_query_plan(doc_id: str, plan: QueryPlan) -> QueryResult:
+    """
+    Execute a validated plan with Arrow compute kernels over every row of the document.
+    Only the columns the plan touches are read; plain row selections take just the
+    first `limit` matching (or top sorted) rows instead of filtering whole columns.
+    """
+    table = open_query_table(doc_id)
+    validate_query_plan(plan, table.column_names)
+    limit = min(plan.limit, QUERY_RESULT_MAX_ROWS)
+
+    mask = None
+    for query_filter in plan.filters:
+        condition = query_filter_mask(table, query_filter)
+        mask = condition if mask is None else pc.and_kleene(mask, condition)
+
+    if plan.group_by or plan.aggregations:
+        aggregations = plan.aggregations or [QueryAggregation(func="count")]
+        needed = list(dict.fromkeys(plan.group_by + [a.column for a in aggregations if a.column != "*"]))
+        source = table.select(needed)
+        if mask is not None:
+            source = source.filter(mask)
+        matched_rows = source.num_rows
+        specs = [
+            ([], "count_all") if a.column == "*" else (a.column, QUERY_AGGREGATE_FUNCTIONS[a.func])
+            for a in aggregations
+        ]
+        try:
+            grouped = source.group_by(plan.group_by).aggregate(specs)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError) as e:
+            raise ValueError(f"Agregasi tidak dapat dijalankan: {e}")
+        result_names = [
+            "count_all" if a.column == "*" else f"{a.column}_{QUERY_AGGREGATE_FUNCTIONS[a.func]}"
+            for a in aggregations
+        ]
+        result = pa.table(
+            [grouped[key] for key in plan.group_by] + [grouped[name] for name in result_names],
+            names=plan.group_by + [aggregation_name(a) for a in aggregations]
+        )
+        unknown_sort = [s.column for s in plan.sort if s.column not in result.column_names]
+        if unknown_sort:
+            raise ValueError(f"Kolom urutan tidak ada di hasil: {', '.join(unknown_sort)}")
+        if plan.sort:
+            result = result.sort_by([(s.column, "descending" if s.descending else "ascending") for s in plan.sort])
+        result = result.slice(0, limit)
+    else:
+        unknown_sort = [s.column for s in plan.sort if s.column not in table.column_names]
+        if unknown_sort:
+            raise ValueError(f"Kolom tidak dikenal: {', '.join(unknown_sort)}")
+        positions = pc.indices_nonzero(pc.fill_null(mask, False)) if mask is not None else None
+        matched_rows = len(positions) if positions is not None else table.num_rows
+        if plan.sort:
+            keys = table.select([s.column for s in plan.sort])
+            if positions is not None:
+                keys = keys.take(positions)
+            order = pc.sort_indices(keys, sort_keys=[
+                (s.column, "descending" if s.descending else "ascending") for s in plan.sort
+            ])[:limit]
+            positions = positions.take(order) if positions is not None else order
+        elif positions is not None:
+            positions = positions[:limit]
+        else:
+            positions = pa.array(range(min(limit, table.num_rows)), type=pa.int64())
+        result = table.select(plan.select or table.column_names).take(positions)
+
+    return QueryResult(
+        columns=result.column_names,
+        rows=jsonable_encoder(result.to_pylist()),
+        matched_rows=matched_rows,
+        total_rows=table.num_rows
+    )
+
+def format_query_result(result: QueryResult) -> str:
+    if not result.rows:
+        return "(tidak ada baris hasil)"
+    lines = [" | ".join(result.columns)]
+    lines += [" | ".join(truncate_value(row[column]) for column in result.columns) for row in result.rows]
+    return "\n".join(lines)
+
+def build_query_planning_prompt(digest: Dict[str, Any], question: str) -> str:
+    columns = "\n".join(format_column_digest(info) for info in digest["columns"])
+    return f"""
+            Anda adalah perencana kueri data. Dokumen memiliki {digest['row_count']} baris dengan kolom berikut:
+{columns}
+
+            Susun kueri untuk menjawab pertanyaan pengguna: "{question}"
+            Balas HANYA dengan satu objek JSON tanpa penjelasan, dengan format:
+            {{"select": ["kolom"], "filters": [{{"column": "kolom", "op": "==|!=|>|>=|<|<=|contains|in", "value": "nilai"}}],
+              "group_by": ["kolom"], "aggregations": [{{"func": "count|sum|mean|min|max|nunique", "column": "kolom atau *", "name": "nama_hasil"}}],
+              "sort": [{{"column": "kolom atau nama_hasil", "descending": true}}], "limit": 20}}
+            Gunakan hanya nama kolom di atas. Kosongkan bagian yang tidak diperlukan. "select" hanya dipakai tanpa agregasi.
+            """
+
+def parse_query_plan(text: str) -> QueryPlan:
+    """Read the JSON object out of the model's reply (it sometimes adds prose or code fences)"""
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end < start:
+        raise ValueError("Balasan perencana tidak berisi JSON")
+    try:
+        return QueryPlan.model_validate(json.loads(text[start:end + 1]))
+    except (json.JSONDecodeError, ValidationError) as e:
+        raise ValueError(f"Rencana kueri tidak valid: {e}")
+
+def build_query_answer_prompt(plan: QueryPlan, result: QueryResult, question: str) -> str:
+    return f"""
+            Anda adalah asisten analisis data. Untuk menjawab pertanyaan pengguna, kueri berikut telah dijalankan atas seluruh {result.total_rows} baris dokumen:
+            {plan.model_dump_json(exclude_defaults=True)}
+            Hasil kueri ({result.matched_rows} baris cocok dengan filter, {len(result.rows)} baris hasil ditampilkan):
+{format_query_result(result)}
+
+            Berdasarkan hasil kueri ini, jawablah pertanyaan pengguna: "{question}"
+            Hasil kueri sudah dihitung dari seluruh data, jangan menghitung ulang dari contoh.
+            """
+
+# Placeholder for Internet Search Function
+def search_internet(query: str) -> tuple[str, dict]:
+    """
+    This is a placeholder for actual internet search integration.
+    """
+    print(f"Performing internet search for: {query}")
+    try:
+        return "Ini adalah hasil pencarian dari internet (placeholder): Informasi tentang '" + query + "' dapat ditemukan melalui berbagai sumber online.", {"dummy_result": "internet_search_placeholder"}
+    except requests.exceptions.RequestException as e:
+        print(f"Error during internet search request: {e}")
+        return f"Maaf, gagal melakukan pencarian internet (koneksi/API): {str(e)}", {}
+    except Exception as e:
+        print(f"Generic error during internet search: {e}")
+        return f"Maaf, terjadi kesalahan tak terduga saat pencarian internet: {str(e)}", {}
+
+# --- API ENDPOINTS ---
+
+# Latest result of the background health probe, served by /health and /api-info
+health_state: Dict[str, Any] = {
+    "status": "starting",
+    "groq_api": "unknown",
+    "database": "unknown",
+    "model_info": None,
+    "checked_at": None
+}
+
+def check_database() -> str:
+    try:
+        conn = get_db_connection()
+        conn.execute("SELECT 1").fetchone()
+        conn.close()
+        return "connected"
+    except Exception as e:
+        return f"disconnected ({str(e)})"
+
+async def probe_health() -> Dict[str, Any]:
+    """Probe Groq and the database once"""
+    health_status = {
+        "status": "healthy",
+        "groq_api": "disconnected",
+        "database": "disconnected",
+        "model_info": None,
+        "checked_at": None
+    }
+
+    try:
+        response_test = await scheduled_groq_post({
+            "model": "llama3-8b-8192",
+            "messages": [{"role": "user", "content": "hello"}],
+            "max_tokens": 5
+        }, GROQ_PRIORITY_HEALTH, timeout=5, queue_timeout=5)
+        if response_test.status_code == 200:
+            health_status["groq_api"] = "connected"
+            health_status["model_info"] = {
+                "provider": "GROQ",
+                "model": "llama3-8b-8192",
+                "status": "operational"
+            }
+        else:
+            health_status["groq_api"] = f"error (HTTP {response_test.status_code})"
+    except Exception as e:
+        health_status["groq_api"] = f"error ({str(e)})"
+
+    health_status["database"] = await run_in_threadpool(check_database)
+
+    if health_status["groq_api"] == "connected" and health_status["database"] == "connected":
+        health_status["status"] = "healthy"
+    else:
+        health_status["status"] = "degraded"
+
+    health_status["checked_at"] = datetime.now().isoformat()
+    return health_status
+
+async def health_probe_loop():
+    """Refresh health_state every HEALTH_PROBE_INTERVAL_SECONDS"""
+    global health_state
+    while True:
+        try:
+            health_state = await probe_health()
+        except Exception as e:
+            print(f"Error during health probe: {e}")
+        await asyncio.sleep(HEALTH_PROBE_INTERVAL_SECONDS)
+
+async def cache_sync_loop():
+    """Apply cache invalidations from other worker processes every CACHE_SYNC_INTERVAL_SECONDS"""
+    while True:
+        try:
+            await run_in_threadpool(cache_invalidation_listener.sync)
+        except Exception as e:
+            print(f"Error syncing cache invalidations: {e}")
+        await asyncio.sleep(CACHE_SYNC_INTERVAL_SECONDS)
+
+@app.get("/health", response_model=SystemHealth, tags=["System"])
+def health_check():
+    """Check if API and dependencies are healthy (cached result of the background probe)"""
+    return health_state
+
+@app.get("/metrics", response_class=PlainTextResponse, tags=["System"])
+def get_metrics():
+    """Request, chat stage and Groq metrics in the Prometheus text exposition format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/debug/slow-requests", tags=["Debug"])
+def get_slow_requests(
+    limit: int = Query(50, ge=1, le=1000),
+    min_ms: Optional[float] = Query(None, ge=0),
+    x_debug_token: Optional[str] = Header(None)
+):
+    """Slowest recent requests with their span timings, newest first (needs TRACING_ENABLED)"""
+    check_debug_token(x_debug_token)
+    traces = [trace for trace in reversed(slow_requests) if min_ms is None or trace["duration_ms"] >= min_ms]
+    return {
+        "tracing_enabled": TRACING_ENABLED,
+        "threshold_ms": SLOW_REQUEST_THRESHOLD_MS,
+        "requests": traces[:limit]
+    }
+
+@app.get("/debug/profile", response_class=PlainTextResponse, tags=["Debug"])
+async def debug_profile(
+    seconds: float = Query(5, gt=0, le=PROFILE_MAX_SECONDS),
+    interval_ms: float = Query(PROFILE_INTERVAL_MS, ge=1, le=1000),
+    x_debug_token: Optional[str] = Header(None)
+):
+    """
+    Sample live traffic for `seconds` and return collapsed stacks ("frame;frame;... count"),
+    the input format of flamegraph.pl, speedscope and similar tools.
+    """
+    check_debug_token(x_debug_token)
+    if not profile_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="Profiling lain sedang berjalan.")
+    try:
+        stacks = await run_in_threadpool(sample_stacks, seconds, interval_ms / 1000)
+    finally:
+        profile_lock.release()
+    return PlainTextResponse(
+        "".join(f"{stack} {count}\n" for stack, count in stacks.most_common()),
+        headers={"Content-Disposition": 'attachment; filename="profile.folded"'}
+    )
+
+@app.get("/health/live", tags=["System"])
+def liveness_check():
+    """Report process liveness only, without touching Groq or the database"""
+    return {"status": "alive"}
+
+# --- INGESTION ---
+ingest_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+
+def create_ingest_job(doc_id: str, filename: str) -> str:
+    job_id = str(uuid.uuid4())
+    now = datetime.now().isoformat()
+    conn = get_db_connection()
+    conn.execute(
+        "INSERT INTO ingest_jobs (id, document_id, filename, status, stage, progress, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (job_id, doc_id, filename, "queued", "queued", 0, now, now)
+    )
+    conn.commit()
+    conn.close()
+    return job_id
+
+def update_ingest_job(job_id: str, **fields):
+    fields["updated_at"] = datetime.now().isoformat()
+    assignments = ", ".join(f"{key} = ?" for key in fields)
+    conn = get_db_connection()
+    conn.execute(f"UPDATE ingest_jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+    conn.commit()
+    conn.close()
+
+def index_columnar_document(conn: sqlite3.Connection, doc_id: str, columnar_path: Path,
+                            row_count: int) -> tuple[Optional[int], Dict[str, Any]]:
+    """
+    Build a document's FTS index and digest from its columnar copy, one batch at a time.
+    Returns the FTS key (see index_document_chunks) and the digest, for the caller to store.
+    """
+    digest_builder = DocumentDigestBuilder(row_count)
+
+    def document_chunks() -> Iterator[pd.DataFrame]:
+        for chunk in iter_columnar_batches(columnar_path):
+            digest_builder.add(chunk)
+            yield chunk
+
+    fts_key = index_document_chunks(conn, doc_id, document_chunks())
+    # The digest is complete once indexing has consumed every batch
+    return fts_key, digest_builder.result()
+
+def ingest_structured_file(doc_id: str, filename: str, file_path: Path, job_id: Optional[str] = None,
+                           content_hash: Optional[str] = None) -> StructuredDocument:
+    """
+    Parse an uploaded file exactly once: row count, preview, schema and the columnar copy
+    all come from the same pass. CSV files and the first sheet of an XLSX workbook are
+    converted in chunks and then indexed batch by batch from the columnar copy, so memory
+    stays bounded by one chunk; the other sheets are registered as sub-documents and only
+    parsed when first used (see ensure_document_loaded). Legacy .xls files are parsed whole.
+    Progress is reported to the ingest job when given. With a content hash, the stored
+    file is registered for reuse by later uploads of the same content.
+    """
+    def report(stage: str, progress: int):
+        if job_id:
+            update_ingest_job(job_id, status="running", stage=stage, progress=progress)
+
+    file_extension = file_path.suffix.lower()
+    columnar_path = sheet_columnar_path(file_path, doc_id)
+    sheets: List[str] = []
+    try:
+        report("parsing", 10)
+        with trace_span("parse"):
+            parse_progress = lambda fraction: report("parsing", 10 + int(fraction * 55))
+            if file_extension in ('.csv', '.xlsx'):
+                if file_extension == '.csv':
+                    chunks = read_csv_chunks(file_path, parse_progress)
+                else:
+                    sheets = list_workbook_sheets(file_path)
+                    chunks = read_xlsx_sheet_chunks(file_path, sheets[0], parse_progress)
+                row_count = write_columnar_chunks(chunks, columnar_path)
+                head = feather.read_table(columnar_path, memory_map=True).slice(0, 5).to_pandas()
+                index_rows = lambda conn: index_columnar_document(conn, doc_id, columnar_path, row_count)
+            else:
+                df = read_structured_file(file_path)
+
+                report("writing_columnar", 60)
+                columnar_path, df = write_columnar_copy(df, file_path)
+                dataframe_cache.put(doc_id, columnar_path, df)
+                head, row_count = df, len(df)
+
+                index_rows = lambda conn: (index_document_rows(conn, doc_id, df), build_document_digest(df))
+
+        report("indexing", 75)
+        columns = infer_column_schema(head)
+        upload_date = datetime.now().isoformat()
+        conn = get_db_connection()
+        fts_key = None
+        try:
+            # The index is written in its own short transactions; the document is only
+            # registered afterwards, so it never shows up half indexed
+            with trace_span("index"):
+                fts_key, digest = index_rows(conn)
+            conn.execute(
+                "INSERT INTO excel_documents (id, filename, file_path, upload_date, row_count, columnar_path, sheet_name, content_hash, fts_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (doc_id, filename, str(file_path), upload_date, row_count, str(columnar_path), sheets[0] if sheets else None, content_hash, fts_key)
+            )
+            write_document_digest(conn, doc_id, digest)
+            # Other sheets get a row with no row_count yet, marking them as not loaded
+            conn.executemany(
+                "INSERT INTO excel_documents (id, filename, file_path, upload_date, parent_id, sheet_name, content_hash) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(str(uuid.uuid4()), filename, str(file_path), upload_date, doc_id, sheet, content_hash) for sheet in sheets[1:]]
+            )
+            if content_hash:
+                conn.execute(
+                    "INSERT INTO stored_files (file_path, content_hash, size, ref_count, created_at) VALUES (?, ?, ?, 1, ?)",
+                    (str(file_path), content_hash, file_path.stat().st_size, upload_date)
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            if fts_key is not None:
+                discard_fts_rows(conn, fts_key)
+            raise
+        finally:
+            conn.close()
+
+        document = StructuredDocument(
+            id=doc_id,
+            filename=filename,
+            upload_date=upload_date,
+            data_preview=preview_records(head),
+            row_count=row_count,
+            columns=columns,
+            sheet_name=sheets[0] if sheets else None,
+            sheets=sheets or None
+        )
+        if job_id:
+            update_ingest_job(job_id, status="completed", stage="completed", progress=100,
+                              result=json.dumps(jsonable_encoder(document)))
+        return document
+    except Exception as e:
+        dataframe_cache.invalidate(doc_id)
+        if file_path.exists():
+            os.remove(file_path)
+        if columnar_path.exists():
+            os.remove(columnar_path)
+        if job_id:
+            update_ingest_job(job_id, status="failed", stage="failed", error=str(e))
+        raise
+
+# Loading a sheet sub-document happens once; concurrent requests for it wait on its lock
+sheet_load_locks: Dict[str, threading.Lock] = {}
+sheet_load_locks_guard = threading.Lock()
+
+def ensure_document_loaded(doc_id: str):
+    """
+    Parse a workbook sheet sub-document on first use: stream just that sheet into its own
+    columnar copy, then index it and store its digest. Loaded documents return immediately.
+    """
+    def load_state():
+        conn = get_db_connection()
+        try:
+            return conn.execute(
+                "SELECT file_path, sheet_name, row_count FROM excel_documents WHERE id = ?", (doc_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+
+    doc = load_state()
+    if not doc or doc["row_count"] is not None:
+        return
+
+    # Duplicate uploads share the stored file, so the same sheet of every copy loads only once
+    lock_key = f"{doc['file_path']}:{doc['sheet_name']}"
+    with sheet_load_locks_guard:
+        lock = sheet_load_locks.setdefault(lock_key, threading.Lock())
+    with lock:
+        try:
+            # A worker process loading the same sheet holds its claim row; wait for it to finish
+            while not claim_document_load(lock_key):
+                time.sleep(0.2)
+                doc = load_state()
+                if not doc or doc["row_count"] is not None:
+                    return
+            try:
+                doc = load_state()
+                if not doc or doc["row_count"] is not None:
+                    return
+                load_sheet_document(doc_id, doc)
+            finally:
+                release_document_load(lock_key)
+        finally:
+            with sheet_load_locks_guard:
+                sheet_load_locks.pop(lock_key, None)
+
+def load_sheet_document(doc_id: str, doc: sqlite3.Row):
+    file_path = Path(doc["file_path"])
+    columnar_path = sheet_columnar_path(file_path, doc_id)
+    try:
+        row_count = write_columnar_chunks(read_xlsx_sheet_chunks(file_path, doc["sheet_name"]), columnar_path)
+        conn = get_db_connection()
+        fts_key = None
+        try:
+            fts_key, digest = index_columnar_document(conn, doc_id, columnar_path, row_count)
+            # Setting row_count marks the sheet loaded, together with its index and digest
+            conn.execute(
+                "UPDATE excel_documents SET row_count = ?, columnar_path = ? WHERE id = ?",
+                (row_count, str(columnar_path), doc_id)
+            )
+            attach_fts_key(conn, doc_id, fts_key)
+            write_document_digest(conn, doc_id, digest)
+            share_loaded_sheet(conn, doc_id, doc["file_path"], doc["sheet_name"])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            if fts_key is not None:
+                discard_fts_rows(conn, fts_key)
+            raise
+        finally:
+            conn.close()
+    except Exception:
+        if columnar_path.exists():
+            os.remove(columnar_path)
+        raise
+
+def claim_document_load(lock_key: str) -> bool:
+    """
+    Take the database-wide claim on loading a sheet, so only one worker process parses it.
+    Claims older than DOCUMENT_LOAD_CLAIM_TIMEOUT_SECONDS (a crashed worker) are taken over.
+    """
+    now = time.time()
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute(
+            """
+            INSERT INTO document_load_claims (lock_key, owner, claimed_at) VALUES (?, ?, ?)
+            ON CONFLICT(lock_key) DO UPDATE SET owner = excluded.owner, claimed_at = excluded.claimed_at
+            WHERE claimed_at < ?
+            """,
+            (lock_key, f"{os.getpid()}:{threading.get_ident()}", now, now - DOCUMENT_LOAD_CLAIM_TIMEOUT_SECONDS)
+        )
+        conn.commit()
+        return cursor.rowcount == 1
+    finally:
+        conn.close()
+
+def release_document_load(lock_key: str):
+    conn = get_db_connection()
+    try:
+        conn.execute(
+            "DELETE FROM document_load_claims WHERE lock_key = ? AND owner = ?",
+            (lock_key, f"{os.getpid()}:{threading.get_ident()}")
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+def share_loaded_sheet(conn: sqlite3.Connection, doc_id: str, file_path: str, sheet_name: str):
+    """Point the same, still unloaded sheet of duplicate uploads at a freshly loaded sheet's artifacts"""
+    siblings = [row["id"] for row in conn.execute(
+        "SELECT id FROM excel_documents WHERE file_path = ? AND sheet_name = ? AND row_count IS NULL AND id != ?",
+        (file_path, sheet_name, doc_id)
+    ).fetchall()]
+    if siblings:
+        copy_document_artifacts(conn, doc_id, siblings)
+
+def copy_document_artifacts(conn: sqlite3.Connection, source_id: str, target_ids: List[str]):
+    """Share a loaded document's columnar copy, FTS rows and digest with other rows; the caller commits"""
+    for target_id in target_ids:
+        conn.execute(
+            """
+            UPDATE excel_documents SET (row_count, columnar_path, fts_key) =
+                (SELECT row_count, columnar_path, fts_key FROM excel_documents WHERE id = ?)
+            WHERE id = ?
+            """,
+            (source_id, target_id)
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO document_digests (document_id, digest, created_at) SELECT ?, digest, created_at FROM document_digests WHERE document_id = ?",
+            (target_id, source_id)
+        )
+
+def resolve_sheet_document(doc_id: str, sheet: str) -> str:
+    """Id of the named sheet within the workbook that doc_id (the workbook or one of its sheets) belongs to"""
+    conn = get_db_connection()
+    try:
+        row = conn.execute(
+            """
+            SELECT s.id FROM excel_documents d
+            JOIN excel_documents s ON s.id = COALESCE(d.parent_id, d.id) OR s.parent_id = COALESCE(d.parent_id, d.id)
+            WHERE d.id = ? AND s.sheet_name = ?
+            """,
+            (doc_id, sheet)
+        ).fetchone()
+    finally:
+        conn.close()
+    if not row:
+        raise HTTPException(status_code=404, detail=f"Sheet '{sheet}' tidak ditemukan di dokumen ini.")
+    return row["id"]
+
+def run_ingest_job(job_id: str, doc_id: str, filename: str, file_path: Path, content_hash: Optional[str] = None):
+    try:
+        ingest_structured_file(doc_id, filename, file_path, job_id, content_hash)
+    except Exception as e:
+        print(f"Error in ingest job {job_id}: {e}")
+
+def save_upload_file(file: UploadFile, file_path: Path) -> tuple[int, str]:
+    """
+    Copy an upload to disk in 1 MB blocks, rejecting it as soon as it passes MAX_UPLOAD_SIZE_MB.
+    Returns the size and the SHA-256 of the content, hashed while it streams.
+    """
+    max_bytes = int(MAX_UPLOAD_SIZE_MB * 1024 * 1024) if MAX_UPLOAD_SIZE_MB > 0 else None
+    too_large = HTTPException(status_code=413, detail=f"Ukuran file melebihi batas {MAX_UPLOAD_SIZE_MB:g} MB.")
+    if max_bytes is not None and file.size is not None and file.size > max_bytes:
+        raise too_large
+
+    written = 0
+    content_hash = hashlib.sha256()
+    with open(file_path, "wb") as buffer:
+        while block := file.file.read(1024 * 1024):
+            written += len(block)
+            if max_bytes is not None and written > max_bytes:
+                break
+            content_hash.update(block)
+            buffer.write(block)
+    if max_bytes is not None and written > max_bytes:
+        os.remove(file_path)
+        raise too_large
+    return written, content_hash.hexdigest()
+
+def find_duplicate_document(content_hash: str) -> Optional[sqlite3.Row]:
+    """
+    An already ingested upload with the same content, if there is one. Only documents with
+    a columnar copy qualify: a legacy document whose migration left columnar_path NULL has
+    nothing to share, so its content is ingested again like a new upload.
+    """
+    conn = get_db_connection()
+    try:
+        return conn.execute(
+            """
+            SELECT * FROM excel_documents
+            WHERE content_hash = ? AND parent_id IS NULL AND row_count IS NOT NULL AND columnar_path IS NOT NULL
+            ORDER BY upload_date LIMIT 1
+            """,
+            (content_hash,)
+        ).fetchone()
+    finally:
+        conn.close()
+
+def register_duplicate_upload(source: sqlite3.Row, filename: str) -> StructuredDocument:
     """
-    Query GROQ API for AI responses
+    Create a document for a re-upload of `source`'s content without parsing anything: the new
+    rows (workbook and sheets) share the stored file, columnar copies and FTS rows, get copies
+    of the digests, and take one more reference on the stored file.
     """
-    if not GROQ_API_KEY:
-        return "Error: GROQ API key not configured. Please check your .env file."
+    doc_id = str(uuid.uuid4())
+    upload_date = datetime.now().isoformat()
+    conn = get_db_connection()
+    try:
+        sources = [source] + conn.execute(
+            "SELECT * FROM excel_documents WHERE parent_id = ? ORDER BY rowid", (source["id"],)
+        ).fetchall()
+        for row in sources:
+            new_id = doc_id if row is source else str(uuid.uuid4())
+            conn.execute(
+                "INSERT INTO excel_documents (id, filename, file_path, upload_date, parent_id, sheet_name, content_hash) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (new_id, filename, row["file_path"], upload_date, None if row is source else doc_id,
+                 row["sheet_name"], row["content_hash"])
+            )
+            if row["row_count"] is not None:
+                copy_document_artifacts(conn, row["id"], [new_id])
+        conn.execute(
+            """
+            INSERT INTO stored_files (file_path, content_hash, size, ref_count, created_at) VALUES (?, ?, ?, 2, ?)
+            ON CONFLICT(file_path) DO UPDATE SET ref_count = ref_count + 1
+            """,
+            (source["file_path"], source["content_hash"], Path(source["file_path"]).stat().st_size, upload_date)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+    head = columnar_store.get(Path(source["columnar_path"])).slice(0, 5).to_pandas()
+    sheets = [row["sheet_name"] for row in sources if row["sheet_name"]]
+    return StructuredDocument(
+        id=doc_id,
+        filename=filename,
+        upload_date=upload_date,
+        data_preview=preview_records(head),
+        row_count=source["row_count"],
+        columns=infer_column_schema(head),
+        sheet_name=source["sheet_name"],
+        sheets=sheets or None,
+        deduplicated=True
+    )
 
+def release_stored_file(conn: sqlite3.Connection, file_path: str) -> bool:
+    """Drop one reference to a stored upload; True once nothing references it any more. The caller commits"""
+    conn.execute("UPDATE stored_files SET ref_count = ref_count - 1 WHERE file_path = ?", (file_path,))
+    row = conn.execute("SELECT ref_count FROM stored_files WHERE file_path = ?", (file_path,)).fetchone()
+    if row is None:
+        # Uploaded before reference counting: the file is free once no document row points at it
+        return conn.execute("SELECT 1 FROM excel_documents WHERE file_path = ? LIMIT 1", (file_path,)).fetchone() is None
+    if row["ref_count"] <= 0:
+        conn.execute("DELETE FROM stored_files WHERE file_path = ?", (file_path,))
+        return True
+    return False
+
+def validate_csv_file(file_path: Path):
+    """Reject malformed CSV files up front by parsing their first CSV_VALIDATE_ROWS rows"""
     try:
-        headers = {
-            "Authorization": f"Bearer {GROQ_API_KEY}",
-            "Content-Type": "application/json"
-        }
+        sample = pd.read_csv(file_path, nrows=CSV_VALIDATE_ROWS, on_bad_lines=CSV_BAD_LINES)
+    except (UnicodeDecodeError, pd.errors.ParserError, pd.errors.EmptyDataError) as e:
+        raise HTTPException(status_code=400, detail=f"File CSV tidak valid: {e}")
+    if len(sample.columns) == 0:
+        raise HTTPException(status_code=400, detail="File CSV tidak valid: tidak ada kolom.")
 
-        payload = {
-            "model": model,
-            "messages": [
-                {
-                    "role": "system",
-                    "content": "Anda adalah asisten analisis data lokal yang membantu pengguna memahami konten dokumen terstruktur. Berikan jawaban yang akurat, informatif, dan relevan dalam bahasa Indonesia. Jika pertanyaan tidak relevan dengan dokumen atau bersifat umum yang tidak terkait analisis dokumen, jawablah dengan sopan bahwa Anda hanya berfokus pada analisis data terstruktur."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            "max_tokens": max_tokens,
-            "temperature": 0.7,
-            "top_p": 0.9,
-            "stream": False
-        }
+# Endpoint for uploading structured documents (Excel/CSV)
+@app.post("/upload-structured-data", response_model=StructuredDocument, tags=["Structured Data"],
+          responses={202: {"model": IngestJob, "description": "Large file queued for background ingestion"}})
+async def upload_structured_document(file: UploadFile = File(...)):
+    """Upload structured data documents for processing (XLSX, XLS, CSV)"""
 
-        response = requests.post(GROQ_API_URL, json=payload, headers=headers, timeout=30)
+    file_extension = Path(file.filename).suffix.lower()
+    if file_extension not in ('.xlsx', '.xls', '.csv'):
+        raise HTTPException(status_code=400, detail="Hanya file .xlsx, .xls, atau .csv yang diizinkan.")
 
-        if response.status_code == 200:
-            result = response.json()
-            if "choices" in result and len(result["choices"]) > 0:
-                return result["choices"][0]["message"]["content"]
-            else:
-                return "Error: Invalid response format from GROQ API"
-        elif response.status_code == 401:
-            return "Error: Invalid GROQ API key. Please check your credentials."
-        elif response.status_code == 429:
-            return "Error: Rate limit exceeded. Please try again later."
-        else:
-            print(f"GROQ API error: {response.status_code} {response.text}")
-            return f"Error: GROQ API returned status {response.status_code}"
+    doc_id = str(uuid.uuid4())
+    file_path = Path(STRUCTURED_DATA_UPLOAD_DIR) / f"{doc_id}{file_extension}"
 
-    except requests.exceptions.ConnectionError:
-        return "Error: Unable to connect to GROQ API. Please check your internet connection."
-    except requests.exceptions.Timeout:
-        return "Error: GROQ API request timed out. Please try again."
+    try:
+        with trace_span("save"):
+            file_size, content_hash = await run_in_threadpool(save_upload_file, file, file_path)
+        duplicate = await run_in_threadpool(find_duplicate_document, content_hash)
+        if duplicate:
+            # Same content as an earlier upload: reuse its file and parsed artifacts
+            os.remove(file_path)
+            with trace_span("dedup"):
+                return await run_in_threadpool(register_duplicate_upload, duplicate, file.filename)
+        if file_extension == '.csv':
+            with trace_span("validate"):
+                await run_in_threadpool(validate_csv_file, file_path)
+
+        if file_size >= INGEST_BACKGROUND_THRESHOLD_MB * 1024 * 1024:
+            job_id = await run_in_threadpool(create_ingest_job, doc_id, file.filename)
+            ingest_executor.submit(run_ingest_job, job_id, doc_id, file.filename, file_path, content_hash)
+            job = await run_in_threadpool(get_ingest_job_status, job_id)
+            return JSONResponse(status_code=202, content=jsonable_encoder(job))
+
+        with trace_span("ingest"):
+            return await run_in_threadpool(ingest_structured_file, doc_id, file.filename, file_path, None, content_hash)
+    except (HTTPException, sqlite3.OperationalError):
+        if file_path.exists():
+            os.remove(file_path)
+        raise
     except Exception as e:
-        print(f"Error querying GROQ: {e}")
-        return f"Error: {str(e)}"
+        if file_path.exists():
+            os.remove(file_path)
+        raise HTTPException(status_code=500, detail=f"Gagal memproses file data terstruktur: {e}")
 
-# Function for searching structured data (Excel/CSV)
-def search_structured_data(doc_id: str, query: str) -> tuple[str, list]:
+@app.get("/ingest-jobs/{job_id}", response_model=IngestJob, tags=["Structured Data"])
+def get_ingest_job_status(job_id: str):
+    """Get the progress of a background ingestion job"""
     conn = get_db_connection()
-    doc = conn.execute(
-        "SELECT file_path FROM excel_documents WHERE id = ?",
-        (doc_id,)
-    ).fetchone()
+    job = conn.execute("SELECT * FROM ingest_jobs WHERE id = ?", (job_id,)).fetchone()
     conn.close()
 
-    if not doc:
-        return "Dokumen data terstruktur tidak ditemukan.", []
-
-    file_path = Path(doc["file_path"])
-    try:
-        df = None
-        if file_path.suffix.lower() in ['.xlsx', '.xls']:
-            df = pd.read_excel(file_path)
-        elif file_path.suffix.lower() == '.csv':
-            df = pd.read_csv(file_path)
-        else:
-            return "Tipe file data terstruktur tidak didukung untuk pencarian.", []
-
-        df_str = df.astype(str)
+    if not job:
+        raise HTTPException(status_code=404, detail="Pekerjaan ingest tidak ditemukan.")
+
+    return IngestJob(
+        job_id=job["id"],
+        document_id=job["document_id"],
+        filename=job["filename"],
+        status=job["status"],
+        stage=job["stage"],
+        progress=job["progress"],
+        error=job["error"],
+        created_at=job["created_at"],
+        updated_at=job["updated_at"],
+        document=StructuredDocument(**json.loads(job["result"])) if job["result"] else None
+    )
 
-        results = []
-        query_lower = query.lower()
 
-        for index, row in df_str.iterrows():
-            if any(query_lower in str(cell).lower() for cell in row):
-                results.append(row.to_dict())
-                if len(results) >= 5:
-                    break
+def build_structured_data_prompt(document_context: str, question: str) -> str:
+    return f"""
+            Anda adalah asisten analisis data yang akan menjawab pertanyaan berdasarkan data terstruktur yang disediakan.
+            Berikut adalah ringkasan dan hasil pencarian dari dokumen data terstruktur yang dipilih:
+{document_context}
 
-        if results:
-            formatted_results = []
-            for i, res in enumerate(results):
-                formatted_results.append(f"Row {i+1}: {', '.join(f'{k}: {v}' for k, v in res.items())}")
-            return "Ditemukan data relevan di dokumen terstruktur Anda:\n" + "\n".join(formatted_results), results
-        else:
-            return "Tidak ditemukan data relevan di dokumen terstruktur.", []
-    except Exception as e:
-        print(f"Error searching structured data: {e}")
-        return f"Gagal mencari di dokumen data terstruktur: {str(e)}", []
+            Berdasarkan data ini, jawablah pertanyaan pengguna: "{question}"
+            Jika tidak ada data relevan dari dokumen terstruktur, katakan bahwa tidak ditemukan di dokumen terstruktur dan bahwa Anda akan mencari di internet di giliran berikutnya.
+            """
 
-# Placeholder for Internet Search Function
-def search_internet(query: str) -> tuple[str, dict]:
-    """
-    This is a placeholder for actual internet search integration.
-    """
-    print(f"Performing internet search for: {query}")
+async def resolve_chat_document(doc_id: str, sheet: Optional[str]) -> str:
+    """Pick the requested sheet of a workbook and make sure it is parsed before it is searched"""
+    if sheet:
+        doc_id = await run_in_threadpool(resolve_sheet_document, doc_id, sheet)
     try:
-        return "Ini adalah hasil pencarian dari internet (placeholder): Informasi tentang '" + query + "' dapat ditemukan melalui berbagai sumber online.", {"dummy_result": "internet_search_placeholder"}
-    except requests.exceptions.RequestException as e:
-        print(f"Error during internet search request: {e}")
-        return f"Maaf, gagal melakukan pencarian internet (koneksi/API): {str(e)}", {}
+        await run_in_threadpool(ensure_document_loaded, doc_id)
+    except sqlite3.OperationalError:
+        raise
     except Exception as e:
-        print(f"Generic error during internet search: {e}")
-        return f"Maaf, terjadi kesalahan tak terduga saat pencarian internet: {str(e)}", {}
+        raise HTTPException(status_code=500, detail=f"Gagal memuat sheet dokumen: {e}")
+    return doc_id
 
-# --- API ENDPOINTS ---
+def document_display_name(doc: sqlite3.Row) -> str:
+    return f"{doc['filename']} [{doc['sheet_name']}]" if doc["sheet_name"] else doc["filename"]
 
-@app.get("/health", response_model=SystemHealth, tags=["System"])
-def health_check():
-    """Check if API and dependencies are healthy"""
-    health_status = {
-        "status": "healthy",
-        "groq_api": "disconnected",
-        "database": "disconnected",
-        "model_info": None
-    }
+def document_cache_version(doc: sqlite3.Row, doc_id: str) -> str:
+    """Version of a document in LLM cache keys: its content and sheet, so duplicate uploads share answers"""
+    if doc["content_hash"]:
+        return f"{doc['content_hash']}:{doc['sheet_name'] or ''}"
+    return f"{doc_id}:{doc['upload_date']}"
 
-    try:
-        response_test = requests.post(GROQ_API_URL, json={
-            "model": "llama3-8b-8192",
-            "messages": [{"role": "user", "content": "hello"}],
-            "max_tokens": 5
-        }, headers={"Authorization": f"Bearer {GROQ_API_KEY}"}, timeout=5)
-        if response_test.status_code == 200:
-            health_status["groq_api"] = "connected"
-            health_status["model_info"] = {
-                "provider": "GROQ",
-                "model": "llama3-8b-8192",
-                "status": "operational"
-            }
+async def prepare_chat_turn(message: ChatMessage) -> Dict[str, Any]:
+    """
+    Resolve the document and chat turn for a message and build its Groq prompt.
+    Turn 1 on a document searches the structured data, turn 2+ uses internet search.
+    """
+    if not message.structured_document_id:
+        general_prompt = f"""
+        Anda adalah asisten AI serbaguna. Jika pengguna memberikan dokumen terstruktur, Anda menganalisis dokumen tersebut.
+        Jika tidak ada dokumen yang diberikan, Anda bisa menjawab pertanyaan umum.
+        Pertanyaan Pengguna: "{message.message}"
+        """
+        return {
+            "prompt": general_prompt,
+            "max_tokens": 500,
+            "source_document_name": None,
+            "next_action": "continue_chat",
+            "chat_turn": None,
+            "document_version": None,
+            "query_plan": None
+        }
+
+    message.structured_document_id = await resolve_chat_document(message.structured_document_id, message.sheet)
+    with stage_timer("db"):
+        doc_info, current_chat_turn = await run_in_threadpool(
+            load_chat_document, message.structured_document_id, message.conversation_id
+        )
+    if not doc_info:
+        raise HTTPException(status_code=404, detail="Dokumen data terstruktur tidak ditemukan.")
+
+    document_version = document_cache_version(doc_info, message.structured_document_id)
+    query_plan = None
+    if current_chat_turn == 1:
+        with stage_timer("db"):
+            digest = await run_in_threadpool(get_document_digest, message.structured_document_id)
+        planned = None
+        if message.mode == "query" and digest:
+            planned = await plan_document_query(message, digest, document_version)
+
+        if planned:
+            query_plan, query_result = planned
+            with stage_timer("prompt"):
+                prompt_to_groq = build_query_answer_prompt(query_plan, query_result, message.message)
         else:
-            health_status["groq_api"] = f"error (HTTP {response_test.status_code})"
-    except Exception as e:
-        health_status["groq_api"] = f"error ({str(e)})"
+            structured_data_search_result_text, search_rows = await run_in_threadpool(
+                search_structured_data, message.structured_document_id, chat_search_query(message.message), prefix=False
+            )
+            with stage_timer("prompt"):
+                document_context = build_prompt_context(digest, structured_data_search_result_text, search_rows)
+                prompt_to_groq = build_structured_data_prompt(document_context, message.message)
+        next_action_type = "search_internet"
+    else:
+        internet_search_result_text, _ = search_internet(message.message)
 
+        prompt_to_groq = f"""
+            Anda adalah asisten cerdas yang dapat melakukan pencarian internet.
+            Berikut adalah hasil pencarian internet untuk pertanyaan: "{message.message}"
+            {internet_search_result_text}
 
-    try:
-        conn = get_db_connection()
-        conn.execute("SELECT 1").fetchone()
-        conn.close()
-        health_status["database"] = "connected"
-    except Exception as e:
-        health_status["database"] = f"disconnected ({str(e)})"
+            Berikan jawaban yang komprehensif berdasarkan informasi ini. Jika hasil pencarian internet kurang relevan atau tidak ada, informasikan kepada pengguna dengan sopan.
+            """
+        next_action_type = "continue_chat"
 
-    if health_status["groq_api"] == "connected" and health_status["database"] == "connected":
-        health_status["status"] = "healthy"
-    else:
-        health_status["status"] = "degraded"
+    return {
+        "prompt": prompt_to_groq,
+        "max_tokens": 1500,
+        "source_document_name": document_display_name(doc_info),
+        "next_action": next_action_type,
+        "chat_turn": current_chat_turn,
+        "document_version": document_version,
+        "query_plan": query_plan.model_dump(exclude_defaults=True) if query_plan else None
+    }
 
-    return health_status
+async def plan_document_query(message: ChatMessage, digest: Dict[str, Any],
+                              document_version: str) -> Optional[tuple[QueryPlan, QueryResult]]:
+    """
+    Ask Groq for a query plan answering the message and run it over the whole document.
+    Returns None when the plan cannot be produced, parsed or executed, and the caller
+    falls back to row search. Plans are cached like chat responses.
+    """
+    prompt = build_query_planning_prompt(digest, message.message)
+    cache_key = LLMResponseCache.make_key(GROQ_MODEL, prompt, QUERY_PLAN_MAX_TOKENS, document_version)
+    reply = None if message.bypass_cache else await run_in_threadpool(llm_response_cache.get, cache_key)
+    cached = reply is not None
+    if not cached:
+        reply = await query_groq(prompt, max_tokens=QUERY_PLAN_MAX_TOKENS, priority=chat_priority(message))
+        if reply.startswith("Error:"):
+            return None
 
-# Endpoint for uploading structured documents (Excel/CSV)
-@app.post("/upload-structured-data", response_model=StructuredDocument, tags=["Structured Data"])
-async def upload_structured_document(file: UploadFile = File(...)):
-    """Upload structured data documents for processing (XLSX, XLS, CSV)"""
+    try:
+        plan = parse_query_plan(reply)
+        with stage_timer("query"):
+            result = await run_in_threadpool(run_query_plan, message.structured_document_id, plan)
+    except ValueError as e:
+        print(f"Query plan rejected, falling back to row search: {e}")
+        return None
+
+    if not cached:
+        await run_in_threadpool(llm_response_cache.set, cache_key, reply, LLM_CACHE_TTL_SECONDS)
+    return plan, result
+
+def load_chat_document(doc_id: str, conversation_id: Optional[str]) -> tuple[Optional[sqlite3.Row], Optional[int]]:
+    """The document a chat message refers to and the conversation's turn, or (None, None) if it does not exist"""
+    conn = get_db_connection()
+    try:
+        doc_info = conn.execute(
+            "SELECT filename, file_path, upload_date, sheet_name, content_hash FROM excel_documents WHERE id = ?", (doc_id,)
+        ).fetchone()
+        if not doc_info:
+            return None, None
+        return doc_info, upcoming_chat_turn(conn, doc_id, conversation_id)
+    finally:
+        conn.close()
 
-    file_extension = Path(file.filename).suffix.lower()
-    if file_extension not in ('.xlsx', '.xls', '.csv'):
-        raise HTTPException(status_code=400, detail="Hanya file .xlsx, .xls, atau .csv yang diizinkan.")
+def get_document_row(doc_id: str) -> Optional[sqlite3.Row]:
+    conn = get_db_connection()
+    try:
+        return conn.execute(
+            "SELECT filename, upload_date, sheet_name, content_hash FROM excel_documents WHERE id = ?", (doc_id,)
+        ).fetchone()
+    finally:
+        conn.close()
 
-    doc_id = str(uuid.uuid4())
-    file_path = Path(STRUCTURED_DATA_UPLOAD_DIR) / f"{doc_id}{file_extension}"
+def upcoming_chat_turn(conn: sqlite3.Connection, doc_id: str, conversation_id: Optional[str]) -> int:
+    """The turn the next message of a document conversation takes; nothing is advanced yet"""
+    row = conn.execute(
+        "SELECT chat_turn FROM chat_sessions WHERE excel_document_id = ? AND conversation_id = ?",
+        (doc_id, conversation_id or "")
+    ).fetchone()
+    return row["chat_turn"] + 1 if row else 1
 
-    try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+def advance_chat_turn(conn: sqlite3.Connection, doc_id: str, conversation_id: Optional[str], chat_turn: int):
+    """
+    Record that a conversation has answered chat_turn, in the caller's transaction (the one
+    saving the answer). Concurrent messages that took the same turn advance it only once.
+    """
+    conn.execute(
+        """
+        INSERT INTO chat_sessions (excel_document_id, conversation_id, chat_turn, updated_at)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(excel_document_id, conversation_id)
+        DO UPDATE SET chat_turn = MAX(chat_turn, excluded.chat_turn), updated_at = excluded.updated_at
+        """,
+        (doc_id, conversation_id or "", chat_turn, datetime.now().isoformat())
+    )
 
-        _, row_count = extract_data_from_structured_file(file_path)
+def is_groq_error(ai_response: str) -> bool:
+    return not ai_response or ai_response.startswith("Error:")
 
+def save_chat_history(message: ChatMessage, ai_response: str, chat_turn: Optional[int]):
+    with stage_timer("persist"):
         conn = get_db_connection()
-        conn.execute(
-            "INSERT INTO excel_documents (id, filename, file_path, upload_date, row_count) VALUES (?, ?, ?, ?, ?)",
-            (doc_id, file.filename, str(file_path), datetime.now().isoformat(), row_count)
-        )
+        if message.structured_document_id:
+            conn.execute(
+                "INSERT INTO chat_history (message, response, timestamp, is_predefined, excel_document_id, chat_turn, conversation_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (message.message, ai_response, datetime.now().isoformat(), message.is_predefined,
+                 message.structured_document_id, chat_turn, message.conversation_id)
+            )
+            # A failed Groq call does not use up the turn, the next message retries it
+            if chat_turn is not None and not is_groq_error(ai_response):
+                advance_chat_turn(conn, message.structured_document_id, message.conversation_id, chat_turn)
+        else:
+            conn.execute(
+                "INSERT INTO chat_history (message, response, timestamp, is_predefined) VALUES (?, ?, ?, ?)",
+                (message.message, ai_response, datetime.now().isoformat(), message.is_predefined)
+            )
         conn.commit()
         conn.close()
 
-        df_preview = None
-        if file_extension in ['.xlsx', '.xls']:
-            df_preview = pd.read_excel(file_path)
-        elif file_extension == '.csv':
-            df_preview = pd.read_csv(file_path)
+def chat_priority(message: ChatMessage) -> int:
+    return GROQ_PRIORITY_PREDEFINED if message.is_predefined else GROQ_PRIORITY_INTERACTIVE
 
-        data_preview = df_preview.head(5).to_dict(orient='records') if df_preview is not None else []
+def chat_cache_key(chat_turn: Dict[str, Any]) -> str:
+    return LLMResponseCache.make_key(GROQ_MODEL, chat_turn["prompt"], chat_turn["max_tokens"], chat_turn["document_version"])
 
-        return StructuredDocument(
-            id=doc_id,
-            filename=file.filename,
-            upload_date=datetime.now().isoformat(),
-            data_preview=data_preview,
-            row_count=row_count
-        )
-    except Exception as e:
-        if file_path.exists():
-            os.remove(file_path)
-        raise HTTPException(status_code=500, detail=f"Gagal memproses file data terstruktur: {e}")
+async def get_cached_chat_response(message: ChatMessage, chat_turn: Dict[str, Any]) -> Optional[str]:
+    if message.bypass_cache:
+        return None
+    return await run_in_threadpool(llm_response_cache.get, chat_cache_key(chat_turn))
 
+async def store_chat_response(message: ChatMessage, chat_turn: Dict[str, Any], ai_response: str):
+    # Error messages are returned as text, they must not be served again from the cache
+    if is_groq_error(ai_response):
+        return
+    ttl = LLM_CACHE_PREDEFINED_TTL_SECONDS if message.is_predefined else LLM_CACHE_TTL_SECONDS
+    with stage_timer("persist"):
+        await run_in_threadpool(llm_response_cache.set, chat_cache_key(chat_turn), ai_response, ttl)
 
 @app.post("/chat", response_model=ChatResponse, tags=["Chat"])
 async def chat(
@@ -349,121 +3229,383 @@ async def chat(
 ):
     """Chat with structured data using GROQ AI, with turn-based logic"""
 
-    conn = get_db_connection()
-
-    ai_response = ""
-    source_doc_name = None
-    next_action_type = "continue_chat"
-
-    if message.structured_document_id:
-        doc_info = conn.execute(
-            "SELECT filename, file_path FROM excel_documents WHERE id = ?", (message.structured_document_id,)
-        ).fetchone()
+    chat_turn = await prepare_chat_turn(message)
+    ai_response = await get_cached_chat_response(message, chat_turn)
+    cached = ai_response is not None
+    if not cached:
+        ai_response = await query_groq(chat_turn["prompt"], max_tokens=chat_turn["max_tokens"],
+                                       priority=chat_priority(message))
+        await store_chat_response(message, chat_turn, ai_response)
+    await run_in_threadpool(save_chat_history, message, ai_response, chat_turn["chat_turn"])
 
-        if not doc_info:
-            conn.close()
-            raise HTTPException(status_code=404, detail="Dokumen data terstruktur tidak ditemukan.")
+    return {
+        "response": ai_response,
+        "source_document_name": chat_turn["source_document_name"],
+        "next_action": chat_turn["next_action"],
+        "cached": cached,
+        "query_plan": chat_turn["query_plan"]
+    }
 
-        source_doc_name = doc_info["filename"]
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-        cursor = conn.execute(
-            "SELECT chat_turn FROM chat_history WHERE excel_document_id = ? ORDER BY timestamp DESC LIMIT 1",
-            (message.structured_document_id,)
-        )
-        last_turn_record = cursor.fetchone()
-        last_chat_turn = last_turn_record["chat_turn"] if last_turn_record else 0
-        current_chat_turn = last_chat_turn + 1
+@app.post("/chat/stream", tags=["Chat"])
+async def chat_stream(
+    message: ChatMessage
+):
+    """
+    Same as /chat, but Groq tokens are forwarded as server-sent events:
+    'meta' first, then one 'token' event per chunk, then 'done' with the full response.
+    The chat_history row is written once the stream has finished.
+    """
 
-        if current_chat_turn == 1:
-            structured_data_search_result_text, _ = search_structured_data(message.structured_document_id, message.message)
+    chat_turn = await prepare_chat_turn(message)
 
-            prompt_to_groq = f"""
-            Anda adalah asisten analisis data yang akan menjawab pertanyaan berdasarkan data terstruktur yang disediakan.
-            Berikut adalah hasil pencarian dari dokumen data terstruktur yang dipilih:
-            {structured_data_search_result_text}
+    async def event_stream():
+        yield sse_event("meta", {
+            "source_document_name": chat_turn["source_document_name"],
+            "next_action": chat_turn["next_action"],
+            "query_plan": chat_turn["query_plan"]
+        })
 
-            Berdasarkan hasil pencarian ini, jawablah pertanyaan pengguna: "{message.message}"
-            Jika tidak ada data relevan dari dokumen terstruktur, katakan bahwa tidak ditemukan di dokumen terstruktur dan bahwa Anda akan mencari di internet di giliran berikutnya.
-            """
-            ai_response = query_groq(prompt_to_groq, max_tokens=1500)
-            next_action_type = "search_internet"
+        ai_response = await get_cached_chat_response(message, chat_turn)
+        cached = ai_response is not None
+        if cached:
+            yield sse_event("token", {"token": ai_response})
         else:
-            internet_search_result_text, _ = search_internet(message.message)
+            parts = []
+            async for token in stream_groq(chat_turn["prompt"], max_tokens=chat_turn["max_tokens"],
+                                           priority=chat_priority(message)):
+                parts.append(token)
+                yield sse_event("token", {"token": token})
+            ai_response = "".join(parts)
+            await store_chat_response(message, chat_turn, ai_response)
+
+        await run_in_threadpool(save_chat_history, message, ai_response, chat_turn["chat_turn"])
+        yield sse_event("done", {
+            "response": ai_response,
+            "source_document_name": chat_turn["source_document_name"],
+            "next_action": chat_turn["next_action"],
+            "cached": cached
+        })
 
-            prompt_to_groq = f"""
-            Anda adalah asisten cerdas yang dapat melakukan pencarian internet.
-            Berikut adalah hasil pencarian internet untuk pertanyaan: "{message.message}"
-            {internet_search_result_text}
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-            Berikan jawaban yang komprehensif berdasarkan informasi ini. Jika hasil pencarian internet kurang relevan atau tidak ada, informasikan kepada pengguna dengan sopan.
-            """
-            ai_response = query_groq(prompt_to_groq, max_tokens=1500)
-            next_action_type = "continue_chat"
+def save_chat_history_batch(rows: List[tuple]):
+    """Insert many document chat rows in a single transaction"""
+    with stage_timer("persist"):
+        conn = get_db_connection()
+        try:
+            conn.executemany(
+                "INSERT INTO chat_history (message, response, timestamp, is_predefined, excel_document_id, chat_turn, conversation_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            conn.commit()
+        finally:
+            conn.close()
 
-        conn.execute(
-            "INSERT INTO chat_history (message, response, timestamp, is_predefined, excel_document_id, chat_turn) VALUES (?, ?, ?, ?, ?, ?)",
-            (message.message, ai_response, datetime.now().isoformat(), message.is_predefined,
-             message.structured_document_id, current_chat_turn)
+@app.post("/chat/batch", response_model=BatchChatResponse, tags=["Chat"])
+async def chat_batch(request: BatchChatRequest):
+    """
+    Answer many questions about one structured document in a single call.
+    The document is opened once for all row searches, Groq calls run concurrently
+    (CHAT_BATCH_CONCURRENCY at a time) and results come back in request order.
+    Every item is answered from the document (turn-1 style) and does not advance the chat turn.
+    """
+    if not request.messages:
+        raise HTTPException(status_code=400, detail="Daftar pertanyaan tidak boleh kosong.")
+    if len(request.messages) > CHAT_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Maksimal {CHAT_BATCH_MAX_ITEMS} pertanyaan per batch.")
+
+    batch_started = time.perf_counter()
+    request.structured_document_id = await resolve_chat_document(request.structured_document_id, request.sheet)
+    with stage_timer("db"):
+        doc_info = await run_in_threadpool(get_document_row, request.structured_document_id)
+    if not doc_info:
+        raise HTTPException(status_code=404, detail="Dokumen data terstruktur tidak ditemukan.")
+
+    search_started = time.perf_counter()
+    search_results = await run_in_threadpool(
+        search_structured_data_many, request.structured_document_id,
+        [chat_search_query(question) for question in request.messages], prefix=False
+    )
+    with stage_timer("db"):
+        digest = await run_in_threadpool(get_document_digest, request.structured_document_id)
+    # The searches run together, so each item is charged an equal share
+    search_ms = (time.perf_counter() - search_started) * 1000 / len(request.messages)
+
+    document_version = document_cache_version(doc_info, request.structured_document_id)
+    priority = GROQ_PRIORITY_PREDEFINED if request.is_predefined else GROQ_PRIORITY_INTERACTIVE
+    semaphore = asyncio.Semaphore(CHAT_BATCH_CONCURRENCY)
+
+    async def answer(question: str, search_text: str, search_rows: list) -> BatchChatItem:
+        item_started = time.perf_counter()
+        message = ChatMessage(
+            message=question,
+            structured_document_id=request.structured_document_id,
+            is_predefined=request.is_predefined,
+            bypass_cache=request.bypass_cache,
+            conversation_id=request.conversation_id
         )
-
-    else: # No structured document selected. General chat.
-        general_prompt = f"""
-        Anda adalah asisten AI serbaguna. Jika pengguna memberikan dokumen terstruktur, Anda menganalisis dokumen tersebut.
-        Jika tidak ada dokumen yang diberikan, Anda bisa menjawab pertanyaan umum.
-        Pertanyaan Pengguna: "{message.message}"
-        """
-        ai_response = query_groq(general_prompt, max_tokens=500)
-        next_action_type = "continue_chat"
-        conn.execute(
-            "INSERT INTO chat_history (message, response, timestamp, is_predefined) VALUES (?, ?, ?, ?)",
-            (message.message, ai_response, datetime.now().isoformat(), message.is_predefined)
+        with stage_timer("prompt"):
+            prompt = build_structured_data_prompt(build_prompt_context(digest, search_text, search_rows), question)
+        chat_turn = {"prompt": prompt, "max_tokens": 1500, "document_version": document_version}
+        async with semaphore:
+            groq_started = time.perf_counter()
+            ai_response = await get_cached_chat_response(message, chat_turn)
+            cached = ai_response is not None
+            if not cached:
+                ai_response = await query_groq(chat_turn["prompt"], max_tokens=chat_turn["max_tokens"], priority=priority)
+                await store_chat_response(message, chat_turn, ai_response)
+            groq_ms = (time.perf_counter() - groq_started) * 1000
+        return BatchChatItem(
+            message=question,
+            response=ai_response,
+            cached=cached,
+            search_ms=round(search_ms, 2),
+            groq_ms=round(groq_ms, 2),
+            elapsed_ms=round((time.perf_counter() - item_started) * 1000 + search_ms, 2)
         )
 
-    conn.commit()
-    conn.close()
+    results = await asyncio.gather(*(
+        answer(question, search_text, search_rows)
+        for question, (search_text, search_rows) in zip(request.messages, search_results)
+    ))
+
+    timestamp = datetime.now().isoformat()
+    await run_in_threadpool(save_chat_history_batch, [
+        (item.message, item.response, timestamp, request.is_predefined,
+         request.structured_document_id, 1, request.conversation_id)
+        for item in results
+    ])
+
+    return BatchChatResponse(
+        source_document_name=document_display_name(doc_info),
+        results=results,
+        elapsed_ms=round((time.perf_counter() - batch_started) * 1000, 2)
+    )
 
-    return {
-        "response": ai_response,
-        "source_document_name": source_doc_name,
-        "next_action": next_action_type
-    }
+# Keyset pagination helpers
+def encode_cursor(order_value: str, row_id: Any) -> str:
+    return f"{order_value}|{row_id}"
+
+def decode_cursor(cursor: str, id_type=str) -> tuple[str, Any]:
+    try:
+        order_value, row_id = cursor.rsplit("|", 1)
+        return order_value, id_type(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Parameter 'before' tidak valid.")
+
+def build_keyset_query(table: str, columns: str, order_column: str, filters: List[tuple],
+                       before: Optional[str], limit: Optional[int], id_type=str) -> tuple[str, list]:
+    """
+    Newest-first keyset query over (order_column, id). filters are (sql, *values) tuples;
+    every filter and the cursor condition are index-backed range/equality predicates.
+    """
+    conditions = [sql for sql, *_ in filters]
+    params = [value for _, *values in filters for value in values]
+    if before:
+        order_value, row_id = decode_cursor(before, id_type)
+        conditions.append(f"({order_column}, id) < (?, ?)")
+        params.extend([order_value, row_id])
+
+    sql = f"SELECT {columns} FROM {table}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += f" ORDER BY {order_column} DESC, id DESC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return sql, params
+
+def stream_ndjson(sql: str, params: list):
+    """Yield query rows as NDJSON lines straight from the cursor"""
+    conn = get_db_connection()
+    try:
+        for row in conn.execute(sql, params):
+            yield json.dumps(dict(row)) + "\n"
+    finally:
+        conn.close()
+
+def keyset_page(sql: str, params: list, order_column: str, limit: int) -> tuple[List[Dict[str, Any]], Optional[str]]:
+    conn = get_db_connection()
+    rows = [dict(row) for row in conn.execute(sql, params)]
+    conn.close()
+    next_cursor = encode_cursor(rows[-1][order_column], rows[-1]["id"]) if len(rows) == limit else None
+    return rows, next_cursor
 
 # Endpoint to get list of all structured data documents (Excel/CSV)
 @app.get("/structured-documents", response_model=List[StructuredDocument], tags=["Structured Data"])
-def get_structured_documents():
-    """Get list of all structured data documents (Excel/CSV)"""
+def get_structured_documents(
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    before: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    format: Literal["json", "ndjson"] = "json"
+):
+    """
+    Get structured data documents (Excel/CSV), newest first. Without 'limit' or 'before'
+    every document is returned, as before pagination existed. With them the list is
+    paged: pass the X-Next-Cursor response header back as 'before' for the next page;
+    format=ndjson streams every matching document.
+    """
+    # Sheets after the first are reached through /structured-documents/{doc_id}/sheets
+    filters = [("parent_id IS NULL",)]
+    if since:
+        filters.append(("upload_date >= ?", since))
+    if until:
+        filters.append(("upload_date < ?", until))
+
+    columns = "id, filename, upload_date, row_count, sheet_name"
+    if format == "ndjson":
+        sql, params = build_keyset_query("excel_documents", columns, "upload_date", filters, before, None)
+        return StreamingResponse(stream_ndjson(sql, params), media_type="application/x-ndjson")
+
+    if before and limit is None:
+        limit = DOCUMENTS_PAGE_SIZE
+    sql, params = build_keyset_query("excel_documents", columns, "upload_date", filters, before, limit)
+    documents, next_cursor = keyset_page(sql, params, "upload_date", limit)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    return JSONResponse(content=documents, headers=headers)
+
+@app.get("/structured-documents/{doc_id}/download", response_class=FileResponse, tags=["Structured Data"])
+def download_structured_document(doc_id: str):
+    """Download the originally uploaded file of a structured document"""
     conn = get_db_connection()
-    documents = conn.execute(
-        "SELECT id, filename, upload_date, row_count FROM excel_documents ORDER BY upload_date DESC"
-    ).fetchall()
+    doc = conn.execute(
+        "SELECT filename, file_path FROM excel_documents WHERE id = ?", (doc_id,)
+    ).fetchone()
     conn.close()
 
-    result = []
-    for doc in documents:
-        result.append(StructuredDocument(
-            id=doc["id"],
-            filename=doc["filename"],
-            upload_date=doc["upload_date"],
-            row_count=doc["row_count"]
-        ))
-    return result
+    if not doc or not Path(doc["file_path"]).exists():
+        raise HTTPException(status_code=404, detail="Dokumen data terstruktur tidak ditemukan.")
 
-@app.get("/history", tags=["Chat"])
-def get_chat_history():
-    """Get all chat history"""
+    return FileResponse(doc["file_path"], filename=doc["filename"])
+
+@app.delete("/structured-documents/{doc_id}", tags=["Structured Data"])
+def delete_structured_document(doc_id: str):
+    """
+    Delete a document and its sheets. The stored file and parsed artifacts are shared with
+    duplicate uploads, so they are only removed from disk once nothing references them.
+    """
+    conn = get_db_connection()
+    try:
+        doc = conn.execute("SELECT * FROM excel_documents WHERE id = ?", (doc_id,)).fetchone()
+        if not doc:
+            raise HTTPException(status_code=404, detail="Dokumen data terstruktur tidak ditemukan.")
+        if doc["parent_id"]:
+            raise HTTPException(status_code=400, detail="Sheet tidak dapat dihapus sendiri, hapus dokumen induknya.")
+
+        rows = [doc] + conn.execute("SELECT * FROM excel_documents WHERE parent_id = ?", (doc_id,)).fetchall()
+        ids = [row["id"] for row in rows]
+        placeholders = ", ".join("?" * len(ids))
+        for row in rows:
+            remove_document_rows(conn, row["id"])
+        conn.execute(f"DELETE FROM document_digests WHERE document_id IN ({placeholders})", ids)
+        conn.execute(f"DELETE FROM chat_sessions WHERE excel_document_id IN ({placeholders})", ids)
+        conn.execute(f"DELETE FROM excel_documents WHERE id IN ({placeholders})", ids)
+        publish_cache_invalidation(conn, rows)
+
+        orphaned = [
+            row["columnar_path"] for row in rows
+            if row["columnar_path"] and not conn.execute(
+                "SELECT 1 FROM excel_documents WHERE columnar_path = ? LIMIT 1", (row["columnar_path"],)
+            ).fetchone()
+        ]
+        if release_stored_file(conn, doc["file_path"]):
+            orphaned.append(doc["file_path"])
+        conn.commit()
+    except HTTPException:
+        raise
+    except Exception as e:
+        conn.rollback()
+        raise HTTPException(status_code=500, detail=f"Gagal menghapus dokumen: {e}")
+    finally:
+        conn.close()
+
+    for row in rows:
+        apply_cache_invalidation(row["id"], row["columnar_path"])
+    for path in orphaned:
+        if os.path.exists(path):
+            os.remove(path)
+    return {"message": "Dokumen berhasil dihapus.", "files_removed": len(orphaned)}
 
+@app.get("/structured-documents/{doc_id}/sheets", response_model=List[DocumentSheet], tags=["Structured Data"])
+def get_structured_document_sheets(doc_id: str):
+    """
+    Sheets of an uploaded workbook in workbook order, each addressable as its own document
+    (structured_document_id) or through the 'sheet' field of /chat. Sheets are parsed on first use.
+    """
     conn = get_db_connection()
-    history = conn.execute(
-        "SELECT message, response, timestamp, is_predefined, excel_document_id, chat_turn FROM chat_history ORDER BY timestamp DESC LIMIT 100"
+    rows = conn.execute(
+        """
+        SELECT id, sheet_name, row_count FROM excel_documents
+        WHERE (id = ? OR parent_id = ?) AND sheet_name IS NOT NULL
+        ORDER BY rowid
+        """,
+        (doc_id, doc_id)
     ).fetchall()
     conn.close()
 
-    parsed_history = []
-    for item in history:
-        item_dict = dict(item)
-        parsed_history.append(item_dict)
+    if not rows:
+        raise HTTPException(status_code=404, detail="Dokumen tidak memiliki sheet atau tidak ditemukan.")
+    return [
+        DocumentSheet(id=row["id"], sheet_name=row["sheet_name"], row_count=row["row_count"],
+                      loaded=row["row_count"] is not None)
+        for row in rows
+    ]
+
+@app.get("/structured-documents/{doc_id}/digest", tags=["Structured Data"])
+def get_structured_document_digest(doc_id: str):
+    """Column statistics and row sample computed at ingest, as used in chat prompts"""
+    ensure_document_loaded(doc_id)
+    digest = get_document_digest(doc_id)
+    if digest is None:
+        raise HTTPException(status_code=404, detail="Ringkasan dokumen data terstruktur tidak ditemukan.")
+    return digest
+
+@app.post("/structured-documents/{doc_id}/query", response_model=QueryResult, tags=["Structured Data"])
+def query_structured_document(doc_id: str, plan: QueryPlan):
+    """Run a filter/group-by/aggregate query plan over every row of a document"""
+    ensure_document_loaded(doc_id)
+    try:
+        return run_query_plan(doc_id, plan)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    return {"history": parsed_history}
+@app.get("/history", tags=["Chat"])
+def get_chat_history(
+    limit: Optional[int] = Query(100, ge=1, le=1000),
+    before: Optional[str] = None,
+    document_id: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    format: Literal["json", "ndjson"] = "json"
+):
+    """
+    Get chat history, newest first. Pass next_cursor back as 'before' for the next page;
+    format=ndjson streams every matching row.
+    """
+    filters = []
+    if document_id:
+        filters.append(("excel_document_id = ?", document_id))
+    if since:
+        filters.append(("timestamp >= ?", since))
+    if until:
+        filters.append(("timestamp < ?", until))
+
+    columns = "id, message, response, timestamp, is_predefined, excel_document_id, chat_turn, conversation_id"
+    if format == "ndjson":
+        sql, params = build_keyset_query("chat_history", columns, "timestamp", filters, before, None, int)
+        return StreamingResponse(stream_ndjson(sql, params), media_type="application/x-ndjson")
+
+    sql, params = build_keyset_query("chat_history", columns, "timestamp", filters, before, limit, int)
+    history, next_cursor = keyset_page(sql, params, "timestamp", limit)
+    return {"history": history, "next_cursor": next_cursor}
 
 @app.get("/api-info", tags=["System"])
 def get_api_info():
@@ -472,7 +3614,7 @@ def get_api_info():
     return {
         "provider": "GROQ",
         "model": "llama3-8b-8192",
-        "status": health.groq_api,
+        "status": health["groq_api"],
         "features": [
             "Fast inference speed",
             "High quality responses",
@@ -536,7 +3678,12 @@ def get_system_stats():
     return SystemStats(
         total_structured_documents=total_structured_documents,
         total_chats=total_chats,
-        recent_activity=recent_activity
+        recent_activity=recent_activity,
+        dataframe_cache=dataframe_cache.stats(),
+        columnar_store=columnar_store.stats(),
+        llm_cache=llm_response_cache.stats(),
+        groq_scheduler=groq_scheduler.stats(),
+        groq_single_flight=groq_single_flight.stats()
     )
 
 @app.delete("/clear-all-data", tags=["System"])
@@ -550,10 +3697,18 @@ def clear_all_data():
             Path(STRUCTURED_DATA_UPLOAD_DIR).mkdir(exist_ok=True)
 
         conn.execute("DELETE FROM excel_documents")
+        conn.execute("DELETE FROM structured_rows_fts")
         conn.execute("DELETE FROM chat_history")
+        conn.execute("DELETE FROM chat_sessions")
+        conn.execute("DELETE FROM ingest_jobs")
+        conn.execute("DELETE FROM llm_response_cache")
+        conn.execute("DELETE FROM document_digests")
+        conn.execute("DELETE FROM stored_files")
+        publish_cache_invalidation(conn)
 
         conn.commit()
         conn.close()
+        apply_cache_invalidation(None, None)
 
         return {"message": "Semua dokumen data terstruktur dan riwayat chat berhasil dihapus."}
     except Exception as e:
@@ -568,10 +3723,32 @@ async def read_index():
 
 app.mount("/", StaticFiles(directory="."), name="static_root")
 
-if __name__ == "__main__":
+def serve(host: str = "0.0.0.0", port: int = 8000, workers: int = WEB_CONCURRENCY):
+    """Run the app under uvicorn, as `workers` processes sharing one listening socket"""
     import uvicorn
+
+    if workers <= 1:
+        uvicorn.run(app, host=host, port=port)
+        return
+
+    # Multiprocess(config, sockets) as in the uvicorn pinned by setup.py; older releases also took a target
+    from uvicorn.supervisors import Multiprocess
+
+    # Worker processes import the app themselves, so it is passed by name
+    config = uvicorn.Config("app:app", host=host, port=port, workers=workers)
+    # uvicorn binds its own socket with proto 0, and asyncio only sets TCP_NODELAY on
+    # IPPROTO_TCP sockets; without it each response waits ~40 ms for the client's delayed ACK
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.set_inheritable(True)
+    Multiprocess(config, sockets=[sock]).run()
+
+if __name__ == "__main__":
     initialize_db()
     print("🚀 Starting Local Structured Data Chat System with GROQ AI (No Authentication)")
     print("📡 API Documentation: http://localhost:8000/docs")
     print("🌐 Frontend Application: http://localhost:8000")
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    if WEB_CONCURRENCY > 1:
+        print(f"👷 Serving with {WEB_CONCURRENCY} worker processes")
+    serve()
\ No newline at end of file
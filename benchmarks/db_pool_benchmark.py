@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark concurrent /chat and /history throughput with the old per-call sqlite3
+connections (rollback journal) versus the pooled WAL connections.
+
+Groq is replaced by an instant stub so only the database path is measured.
+
+Usage: python benchmarks/db_pool_benchmark.py [--concurrency 16] [--requests 400]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+
+def legacy_connection_factory(database: str):
+    """The connection handling app.py used before the pool: a new connection per call"""
+    def get_db_connection():
+        conn = sqlite3.connect(database)
+        conn.row_factory = sqlite3.Row
+        return conn
+    return get_db_connection
+
+
+async def run_load(app_module, endpoint: str, concurrency: int, total_requests: int) -> dict:
+    import httpx
+
+    transport = httpx.ASGITransport(app=app_module.app)
+    latencies = []
+    errors = 0
+    counter = iter(range(total_requests))
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        async def worker():
+            nonlocal errors
+            for i in counter:
+                start = time.perf_counter()
+                if endpoint == "/chat":
+                    response = await client.post("/chat", json={"message": f"pertanyaan {i}", "bypass_cache": True})
+                else:
+                    response = await client.get("/history")
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "endpoint": endpoint,
+        "requests": total_requests,
+        "errors": errors,
+        "throughput_rps": round(total_requests / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=400)
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="db-pool-bench-"))
+    os.chdir(workdir)
+    os.environ["DATABASE_PATH"] = str(workdir / "pooled.db")
+    os.environ.setdefault("GROQ_API_KEY", "benchmark")
+
+    import app
+
+    async def stub_query_groq(prompt, max_tokens=2000, model=app.GROQ_MODEL, **kwargs):
+        return "jawaban benchmark"
+    app.query_groq = stub_query_groq
+
+    pooled_connection = app.get_db_connection
+    results = {}
+    for mode in ("legacy", "pooled"):
+        if mode == "legacy":
+            legacy_db = str(workdir / "legacy.db")
+            sqlite3.connect(legacy_db).execute("PRAGMA journal_mode=DELETE").fetchone()
+            app.get_db_connection = legacy_connection_factory(legacy_db)
+        else:
+            app.get_db_connection = pooled_connection
+        app.initialize_db()
+
+        results[mode] = [
+            asyncio.run(run_load(app, endpoint, args.concurrency, args.requests))
+            for endpoint in ("/chat", "/history")
+        ]
+
+    print(json.dumps({"concurrency": args.concurrency, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test of app.py over HTTP: /chat, /chat/stream, /upload-structured-data,
+/history and /health, each at the given concurrency levels.
+
+By default the app and benchmarks/mock_groq.py are started as subprocesses on free
+ports, with a throwaway working directory and database and Groq pointed at the mock.
+Pass --base-url to test an app that is already running instead.
+
+Chat questions are replayed from --traffic, a JSONL file. A line is used as
+  {"endpoint": "/chat", "json": {...}}   an explicit request body, or
+  {"message": "..."}                    a question, or
+  {"title": "...", "body": "..."}       a question built from both (e.g. requests.jsonl)
+Without --traffic a small built-in question set is used. Chat requests go against a
+document uploaded before the run, each with its own conversation_id, so every request
+takes the turn-1 path (document search plus a Groq call). The LLM response cache is
+bypassed unless --use-cache is given.
+
+Every upload request appends one extra row, numbered across the whole run, to the
+--upload-rows sample CSV, so no two uploads have the same content and each one is
+parsed and indexed rather than answered by the content-hash deduplication. Pass
+--duplicate-uploads to send identical files and measure that deduplication path instead.
+
+The report is JSON with sorted keys, so two runs can be diffed:
+  {"meta": {...}, "results": [{"endpoint", "concurrency", "requests", "errors",
+   "throughput_rps", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"}, ...]}
+
+Usage: python benchmarks/load_test.py [--concurrency 1 8 32] [--requests 200]
+       [--endpoints chat history health upload] [--traffic requests.jsonl]
+       [--duplicate-uploads] [--mock-latency-ms 300] [--output load-test.json]
+"""
+
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import math
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+
+ENDPOINTS = {
+    "chat": "/chat",
+    "chat_stream": "/chat/stream",
+    "upload": "/upload-structured-data",
+    "history": "/history",
+    "health": "/health",
+}
+
+DEFAULT_QUESTIONS = [
+    "Berapa total anggaran untuk kota Jakarta?",
+    "Tampilkan data pegawai bernama Budi",
+    "Kota mana yang memiliki nilai tertinggi?",
+    "Apakah ada data untuk tahun 2023?",
+    "Ringkas isi dokumen ini",
+]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def load_traffic(path: str) -> list:
+    """Turn a JSONL traffic file into chat request bodies (without document/conversation ids)"""
+    bodies = []
+    with open(path, encoding="utf-8") as traffic:
+        for line in traffic:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if entry.get("endpoint") in ("/chat", "/chat/stream") and "json" in entry:
+                bodies.append(entry["json"])
+            elif "message" in entry:
+                bodies.append({"message": entry["message"]})
+            elif "title" in entry or "body" in entry:
+                bodies.append({"message": f"{entry.get('title', '')}. {entry.get('body', '')}".strip(". ")})
+    if not bodies:
+        raise SystemExit(f"No chat requests found in {path}")
+    return bodies
+
+
+def sample_csv(rows: int) -> bytes:
+    cities = ["Jakarta", "Bandung", "Surabaya", "Medan", "Makassar"]
+    lines = ["id,nama,kota,tahun,anggaran"]
+    for i in range(rows):
+        lines.append(f"{i},Pegawai {i},{cities[i % len(cities)]},{2015 + i % 10},{(i * 7919) % 100000}")
+    return ("\n".join(lines) + "\n").encode()
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def wait_until_ready(url: str, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Server for {url} exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"Server for {url} did not become ready in {timeout} s")
+
+
+def start_servers(args, workdir: Path) -> tuple[str, list]:
+    mock_port, app_port = free_port(), free_port()
+    mock = subprocess.Popen(
+        [sys.executable, str(ROOT / "benchmarks" / "mock_groq.py"), "--port", str(mock_port),
+         "--latency-ms", str(args.mock_latency_ms), "--jitter-ms", str(args.mock_jitter_ms),
+         "--token-delay-ms", str(args.mock_token_delay_ms),
+         "--rate-limit-every", str(args.mock_rate_limit_every)],
+        cwd=workdir
+    )
+    env = dict(
+        os.environ,
+        GROQ_API_KEY="load-test",
+        GROQ_API_URL=f"http://127.0.0.1:{mock_port}/v1/chat/completions",
+        DATABASE_PATH=str(workdir / "database.db"),
+        # The real account limits would dominate every number; the mock has none
+        GROQ_RPM_LIMIT=str(args.groq_rpm_limit),
+        GROQ_TPM_LIMIT=str(args.groq_tpm_limit),
+        PYTHONPATH=str(ROOT),
+    )
+    (workdir / "excel_uploads").mkdir(exist_ok=True)
+    # Tables are created by initialize_db(), which only `python app.py` runs
+    subprocess.run([sys.executable, "-c", "import app; app.initialize_db()"],
+                   cwd=workdir, env=env, check=True, capture_output=True)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--app-dir", str(ROOT),
+         "--host", "127.0.0.1", "--port", str(app_port), "--log-level", "warning"],
+        cwd=workdir, env=env
+    )
+    base_url = f"http://127.0.0.1:{app_port}"
+    wait_until_ready(f"http://127.0.0.1:{mock_port}/mock/stats", mock)
+    wait_until_ready(f"{base_url}/health/live", server)
+    return base_url, [server, mock]
+
+
+async def run_level(client: httpx.AsyncClient, endpoint: str, concurrency: int, total: int,
+                    make_request) -> dict:
+    latencies = []
+    errors = 0
+    status_counts: dict = {}
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                response = await make_request(i)
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            status_counts[str(status)] = status_counts.get(str(status), 0) + 1
+            if not isinstance(status, int) or status >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    ms = lambda seconds: round(seconds * 1000, 2)
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "status_counts": status_counts,
+        "throughput_rps": round(total / elapsed, 2),
+        "mean_ms": ms(sum(latencies) / len(latencies)),
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1]),
+    }
+
+
+async def run_load_test(args, base_url: str) -> list:
+    questions = load_traffic(args.traffic) if args.traffic else [{"message": q} for q in DEFAULT_QUESTIONS]
+    upload_body = sample_csv(args.upload_rows)
+    upload_serial = itertools.count()
+    limits = httpx.Limits(max_connections=max(args.concurrency) * 2, max_keepalive_connections=max(args.concurrency))
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        seed = await client.post("/upload-structured-data",
+                                 files={"file": ("load-test.csv", sample_csv(args.document_rows), "text/csv")})
+        seed.raise_for_status()
+        document_id = seed.json().get("id") or seed.json().get("document_id")
+        question_cycle = itertools.cycle(questions)
+
+        def chat_body() -> dict:
+            body = dict(next(question_cycle))
+            body.setdefault("structured_document_id", document_id)
+            body.setdefault("conversation_id", str(uuid.uuid4()))
+            body.setdefault("bypass_cache", not args.use_cache)
+            return body
+
+        def upload_content() -> bytes:
+            if args.duplicate_uploads:
+                return upload_body
+            n = next(upload_serial)
+            return upload_body + f"{args.upload_rows + n},Unggahan {n},Jakarta,2024,{n}\n".encode()
+
+        async def stream_request(_):
+            async with client.stream("POST", "/chat/stream", json=chat_body()) as response:
+                async for _ in response.aiter_bytes():
+                    pass
+                return response
+
+        makers = {
+            "chat": lambda _: client.post("/chat", json=chat_body()),
+            "chat_stream": stream_request,
+            "upload": lambda i: client.post("/upload-structured-data",
+                                            files={"file": (f"upload-{i}.csv", io.BytesIO(upload_content()), "text/csv")}),
+            "history": lambda _: client.get("/history", params={"limit": 50}),
+            "health": lambda _: client.get("/health"),
+        }
+
+        results = []
+        for concurrency in args.concurrency:
+            for name in args.endpoints:
+                result = await run_level(client, ENDPOINTS[name], concurrency, args.requests, makers[name])
+                print(json.dumps(result, sort_keys=True), file=sys.stderr)
+                results.append(result)
+        return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", help="Test a running app instead of starting one")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint and concurrency level")
+    parser.add_argument("--endpoints", nargs="+", choices=list(ENDPOINTS), default=["chat", "upload", "history", "health"])
+    parser.add_argument("--traffic", help="JSONL file with chat requests to replay")
+    parser.add_argument("--use-cache", action="store_true", help="Let repeated questions hit the LLM response cache")
+    parser.add_argument("--document-rows", type=int, default=5000)
+    parser.add_argument("--upload-rows", type=int, default=1000)
+    parser.add_argument("--duplicate-uploads", action="store_true",
+                        help="Upload identical content every time, measuring the deduplication path")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--mock-latency-ms", type=float, default=300)
+    parser.add_argument("--mock-jitter-ms", type=float, default=50)
+    parser.add_argument("--mock-token-delay-ms", type=float, default=0)
+    parser.add_argument("--mock-rate-limit-every", type=int, default=0)
+    parser.add_argument("--groq-rpm-limit", type=int, default=0)
+    parser.add_argument("--groq-tpm-limit", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here as well as to stdout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="load-test-") as tmp:
+        processes = []
+        try:
+            if args.base_url:
+                base_url = args.base_url
+            else:
+                base_url, processes = start_servers(args, Path(tmp))
+            results = asyncio.run(run_load_test(args, base_url))
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait(timeout=10)
+
+    report = {
+        "meta": {
+            "git_revision": git_revision(),
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "base_url": args.base_url or "local",
+            "requests_per_level": args.requests,
+            "traffic": args.traffic or "built-in",
+            "use_cache": args.use_cache,
+            "duplicate_uploads": args.duplicate_uploads,
+            "mock": None if args.base_url else {
+                "latency_ms": args.mock_latency_ms,
+                "jitter_ms": args.mock_jitter_ms,
+                "token_delay_ms": args.mock_token_delay_ms,
+                "rate_limit_every": args.mock_rate_limit_every,
+            },
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the data-processing hot paths of app.py, on synthetic CSV and XLSX
+files of 1k, 100k and 1M rows with 5 and 20 columns.
+
+Timed cases, per file:
+  extract        extract_data_from_structured_file (prompt digest of a document)
+  search_hit     search_structured_data for a value that occurs once
+  search_miss    search_structured_data for a value that does not occur, so the FTS
+                 lookup finds nothing and the bounded substring scan runs
+  search_part    search_structured_data for part of a word ("akart"), found by the
+                 substring scan
+  chat_search    the row search of a /chat turn 1: the keywords of a question
+                 (chat_search_query), one of them a city found in many rows
+  chat_miss      the same for a question whose keywords occur nowhere
+  preview        preview and schema from the columnar copy, as returned on upload
+  query          a planned query (total of jumlah_1 per kota_2, sorted) over every row
+  chat_turn      the document lookup and turn counter read done for every /chat
+
+Each case runs once as warm-up, then --repeat times. Wall time is reported as median
+and minimum. Peak memory is the tracemalloc peak of one run; it covers Python and NumPy
+allocations but not Arrow's own memory pool.
+
+Files are generated from fixed seeds, so every run measures the same data. Generated
+files are kept in --data-dir when given, which saves regenerating the large XLSX files.
+
+Results are sorted-key JSON, keyed "<case>/<format>/<rows>x<columns>". With --compare
+BASELINE.json, the fresh results (or --current CURRENT.json) are checked against the
+baseline. A case regresses when its median time or peak memory grows by more than
+--threshold (default 0.10) and by more than 0.5 ms or 0.1 MB. The exit code is 1 if
+anything regressed.
+
+Usage: python benchmarks/microbench.py [--rows 1000 100000 1000000] [--columns 5 20]
+       [--formats csv xlsx] [--repeat 5] [--output results.json]
+       [--compare baseline.json [--current results.json] [--threshold 0.10]]
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+CITIES = ["Jakarta", "Bandung", "Surabaya", "Medan", "Makassar", "Semarang", "Palembang", "Denpasar"]
+MISS_QUERY = "tidakadadimanapun"
+PART_QUERY = "akart"
+CHAT_QUESTION = "Berapa total jumlah_1 untuk kota Jakarta?"
+CHAT_MISS_QUESTION = "Siapa kepala dinas pendidikan provinsi?"
+
+
+def column_values(index: int, ids, rng):
+    """Column `index` of the synthetic table; the kinds rotate so wider tables mix types"""
+    import numpy as np
+    import pandas as pd
+
+    kind = index % 5
+    size = len(ids)
+    if kind == 0:
+        return f"kode_{index}", np.char.add("K-", ids.astype(str))
+    if kind == 1:
+        return f"jumlah_{index}", rng.integers(0, 100000, size)
+    if kind == 2:
+        return f"kota_{index}", np.array(CITIES)[rng.integers(0, len(CITIES), size)]
+    if kind == 3:
+        return f"nilai_{index}", np.round(rng.random(size) * 1e6, 2)
+    return f"tanggal_{index}", (pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 2000, size), unit="D")).strftime("%Y-%m-%d")
+
+
+def synthetic_blocks(rows: int, columns: int, block: int = 100000):
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(rows * 100 + columns)
+    for start in range(0, rows, block):
+        ids = np.arange(start, min(rows, start + block))
+        yield pd.DataFrame(dict(column_values(i, ids, rng) for i in range(columns)))
+
+
+def generate_file(path: Path, fmt: str, rows: int, columns: int):
+    if fmt == "csv":
+        with open(path, "w") as out:
+            for i, block in enumerate(synthetic_blocks(rows, columns)):
+                block.to_csv(out, header=i == 0, index=False)
+        return
+
+    import openpyxl
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("Data")
+    for i, block in enumerate(synthetic_blocks(rows, columns)):
+        if i == 0:
+            sheet.append(list(block.columns))
+        for record in block.itertuples(index=False):
+            sheet.append([value.item() if hasattr(value, "item") else value for value in record])
+    workbook.save(path)
+
+
+def measure(func, repeat: int) -> dict:
+    func()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "wall_ms_median": round(statistics.median(timings), 3),
+        "wall_ms_min": round(min(timings), 3),
+        "peak_mem_mb": round(peak / 1024 / 1024, 3),
+        "repeat": repeat,
+    }
+
+
+def run_suite(args) -> dict:
+    data_dir = Path(args.data_dir).resolve() if args.data_dir else None
+    workdir = Path(tempfile.mkdtemp(prefix="microbench-"))
+    os.chdir(workdir)
+    os.environ["DATABASE_PATH"] = str(workdir / "database.db")
+    os.environ.setdefault("GROQ_API_KEY", "benchmark")
+    import app
+
+    app.initialize_db()
+    (workdir / app.STRUCTURED_DATA_UPLOAD_DIR).mkdir(exist_ok=True)
+    data_dir = data_dir or workdir / "data"
+    data_dir.mkdir(parents=True, exist_ok=True)
+
+    def chat_turn_lookup(doc_id: str):
+        # The database work prepare_chat_turn does before building a prompt
+        conn = app.get_db_connection()
+        try:
+            conn.execute(
+                "SELECT filename, file_path, upload_date, sheet_name FROM excel_documents WHERE id = ?", (doc_id,)
+            ).fetchone()
+            app.upcoming_chat_turn(conn, doc_id, "microbench")
+        finally:
+            conn.close()
+
+    def chat_search(doc_id: str, question: str):
+        # The row search prepare_chat_turn runs on turn 1
+        return app.search_structured_data(doc_id, app.chat_search_query(question), prefix=False)
+
+    def preview(columnar_path: Path):
+        head = app.feather.read_table(columnar_path, memory_map=True).slice(0, 5).to_pandas()
+        return app.preview_records(head), app.infer_column_schema(head)
+
+    results = {}
+    for fmt in args.formats:
+        for rows in args.rows:
+            for columns in args.columns:
+                label = f"{fmt}/{rows}x{columns}"
+                source = data_dir / f"synthetic_{rows}x{columns}.{fmt}"
+                if not source.exists():
+                    print(f"generating {source.name}", file=sys.stderr)
+                    generate_file(source, fmt, rows, columns)
+
+                doc_id = f"bench-{fmt}-{rows}x{columns}"
+                upload = workdir / app.STRUCTURED_DATA_UPLOAD_DIR / f"{doc_id}.{fmt}"
+                try:
+                    os.link(source, upload)
+                except OSError:
+                    shutil.copyfile(source, upload)
+                print(f"ingesting {label}", file=sys.stderr)
+                app.ingest_structured_file(doc_id, source.name, upload)
+                columnar_path = app.sheet_columnar_path(upload, doc_id)
+                hit_query = f"K-{rows // 2}"
+                plan = app.QueryPlan(
+                    group_by=["kota_2"],
+                    aggregations=[app.QueryAggregation(func="sum", column="jumlah_1", name="total")],
+                    sort=[app.QuerySort(column="total", descending=True)]
+                )
+
+                cases = {
+                    "extract": lambda: app.extract_data_from_structured_file(upload, doc_id),
+                    "search_hit": lambda: app.search_structured_data(doc_id, hit_query),
+                    "search_miss": lambda: app.search_structured_data(doc_id, MISS_QUERY),
+                    "search_part": lambda: app.search_structured_data(doc_id, PART_QUERY),
+                    "chat_search": lambda: chat_search(doc_id, CHAT_QUESTION),
+                    "chat_miss": lambda: chat_search(doc_id, CHAT_MISS_QUESTION),
+                    "preview": lambda: preview(columnar_path),
+                    "query": lambda: app.run_query_plan(doc_id, plan),
+                    "chat_turn": lambda: chat_turn_lookup(doc_id),
+                }
+                for case, func in cases.items():
+                    result = measure(func, args.repeat)
+                    results[f"{case}/{label}"] = result
+                    print(f"{case}/{label}: {json.dumps(result)}", file=sys.stderr)
+    return results
+
+
+# Changes smaller than this are noise on sub-millisecond cases, whatever their ratio
+NOISE_FLOOR = {"wall_ms_median": 0.5, "peak_mem_mb": 0.1}
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+    """Cases whose median time or peak memory grew by more than threshold (and the noise floor)"""
+    regressions = []
+    for key, before in sorted(baseline["results"].items()):
+        after = current["results"].get(key)
+        if after is None:
+            continue
+        for metric in ("wall_ms_median", "peak_mem_mb"):
+            old, new = before[metric], after[metric]
+            change = (new - old) / old if old else 0.0
+            flag = "REGRESSION" if change > threshold and new - old > NOISE_FLOOR[metric] else ""
+            print(f"{key:45} {metric:15} {old:12.3f} -> {new:12.3f} {change:+8.1%} {flag}", file=sys.stderr)
+            if flag:
+                regressions.append({"case": key, "metric": metric, "baseline": old, "current": new,
+                                    "change": round(change, 4)})
+    return regressions
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 100000, 1000000])
+    parser.add_argument("--columns", type=int, nargs="+", default=[5, 20])
+    parser.add_argument("--formats", nargs="+", choices=["csv", "xlsx"], default=["csv", "xlsx"])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--data-dir", help="Keep generated files here and reuse them")
+    parser.add_argument("--output", help="Write the JSON results here as well as to stdout")
+    parser.add_argument("--compare", metavar="BASELINE", help="Compare against a previous results file")
+    parser.add_argument("--current", help="With --compare: compare this results file instead of running")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args()
+
+    if args.current:
+        current = json.loads(Path(args.current).read_text())
+    else:
+        current = {
+            "meta": {
+                "git_revision": git_revision(),
+                "started_at": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "repeat": args.repeat,
+            },
+            "results": run_suite(args),
+        }
+        output = json.dumps(current, indent=2, sort_keys=True)
+        if args.output:
+            Path(args.output).write_text(output + "\n")
+        if not args.compare:
+            print(output)
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        regressions = compare(baseline, current, args.threshold)
+        print(json.dumps({"threshold": args.threshold, "regressions": regressions}, indent=2, sort_keys=True))
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
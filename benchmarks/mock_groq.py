@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for Groq's OpenAI-compatible /v1/chat/completions endpoint, so app.py can
+be measured without spending quota or adding network variance.
+
+Point the app at it with GROQ_API_URL=http://127.0.0.1:8765/v1/chat/completions
+(any GROQ_API_KEY value is accepted).
+
+Behaviour is set on the command line:
+  --latency-ms / --jitter-ms    time to first byte, uniform jitter around the mean
+  --token-delay-ms / --tokens   pace and length of the answer ("stream": true sends SSE chunks)
+  --rate-limit-every N          every Nth request gets a 429 with Retry-After
+  --rate-limit-rate P           or a 429 with probability P
+  --error-rate P                500 with probability P
+GET /mock/stats returns request counters; POST /mock/reset clears them.
+
+Usage: python benchmarks/mock_groq.py [--port 8765] [--latency-ms 300] [--rate-limit-every 10]
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+MODEL_NAME = "llama3-8b-8192"
+
+
+def create_mock_app(config: argparse.Namespace) -> FastAPI:
+    mock = FastAPI(title="Mock Groq")
+    rng = random.Random(config.seed)
+    sequence = itertools.count(1)
+    stats = {"requests": 0, "streamed": 0, "rate_limited": 0, "errors": 0}
+
+    def answer_words(body: dict) -> list:
+        question = body.get("messages", [{}])[-1].get("content", "").split()
+        words = ["Jawaban", "uji", "untuk:"] + question[:8]
+        filler = itertools.cycle(["data", "menunjukkan", "nilai", "yang", "relevan", "dengan", "pertanyaan"])
+        while len(words) < config.tokens:
+            words.append(next(filler))
+        return words[:max(config.tokens, 1)]
+
+    def usage(body: dict, words: list) -> dict:
+        prompt_tokens = sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                "total_tokens": prompt_tokens + len(words)}
+
+    @mock.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        number = next(sequence)
+        stats["requests"] += 1
+
+        latency = max(0.0, config.latency_ms + rng.uniform(-config.jitter_ms, config.jitter_ms)) / 1000
+        await asyncio.sleep(latency)
+
+        if (config.rate_limit_every and number % config.rate_limit_every == 0) or rng.random() < config.rate_limit_rate:
+            stats["rate_limited"] += 1
+            return JSONResponse(
+                status_code=429,
+                headers={"retry-after": str(config.retry_after)},
+                content={"error": {"message": "Rate limit reached (mock)", "type": "rate_limit_exceeded"}}
+            )
+        if rng.random() < config.error_rate:
+            stats["errors"] += 1
+            return JSONResponse(status_code=500, content={"error": {"message": "Injected failure (mock)"}})
+
+        words = answer_words(body)
+        completion_id = f"chatcmpl-mock-{number}"
+        created = int(time.time())
+        model = body.get("model", MODEL_NAME)
+
+        if body.get("stream"):
+            stats["streamed"] += 1
+
+            async def events():
+                for i, word in enumerate(words):
+                    if config.token_delay_ms:
+                        await asyncio.sleep(config.token_delay_ms / 1000)
+                    chunk = {
+                        "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                        "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}, "finish_reason": None}]
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                final = {
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                    "x_groq": {"usage": usage(body, words)}
+                }
+                yield f"data: {json.dumps(final)}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        if config.token_delay_ms:
+            # A non-streamed answer still takes as long as generating every token
+            await asyncio.sleep(config.token_delay_ms * len(words) / 1000)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)}, "finish_reason": "stop"}],
+            "usage": usage(body, words)
+        }
+
+    @mock.get("/mock/stats")
+    async def mock_stats():
+        return stats
+
+    @mock.post("/mock/reset")
+    async def mock_reset():
+        for key in stats:
+            stats[key] = 0
+        return stats
+
+    return mock
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--token-delay-ms", type=float, default=0)
+    parser.add_argument("--tokens", type=int, default=40)
+    parser.add_argument("--rate-limit-every", type=int, default=0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+def main():
+    import uvicorn
+
+    config = build_parser().parse_args()
+    uvicorn.run(create_mock_app(config), host=config.host, port=config.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
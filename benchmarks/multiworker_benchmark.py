@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Throughput and per-worker memory of the app served by 1, 2, 4 ... uvicorn worker
+processes, all reading one large document from the shared columnar store.
+
+A synthetic CSV (the microbench.py generator, 5 columns) is ingested once into a
+throwaway database. Then for each worker count the app is started with app.serve()
+(what `python app.py` runs) and WEB_CONCURRENCY=N, with Groq pointed at
+benchmarks/mock_groq.py (no latency, so the Groq call does not hide CPU time). Each
+worker is warmed up, then --requests requests go out at --concurrency:
+  query    POST /structured-documents/{id}/query, total of jumlah_1 per kota_2 over
+           every row (Arrow group-by on the memory-mapped table)
+  chat     POST /chat, turn 1 with a new conversation_id, so a document search plus a
+           Groq call to the mock
+
+Memory is read from /proc for every worker process after the run:
+  rss_mb        resident memory
+  rss_anon_mb   private heap (Python objects, Arrow buffers, caches)
+  rss_file_mb   file-backed pages: libraries and the memory-mapped .arrow file, which
+                the page cache shares between workers
+  pss_mb        proportional set size, shared pages divided among the processes
+                mapping them, so the sum over workers is their real footprint
+
+Results on a 1 vCPU / 6 GB Linux VM, Python 3.11, pandas 3.0, pyarrow 26, 1,000,000
+rows (62 MB .arrow copy), 400 requests per endpoint at concurrency 16. Memory is the
+mean over workers after both endpoints ran:
+
+    workers  endpoint  rps    p50 ms   p95 ms   rss MB   anon MB   file MB   pss MB
+    1        query     11.1   1392     1676     460      312       148       414
+    2        query     11.1   602      2734     364      225       139       277
+    4        query     9.3    2192     2730     266      148       118       176
+    1        chat      44.3   359      480      460      312       148       414
+    2        chat      41.7   381      591      364      225       139       277
+    4        chat      32.7   473      707      266      148       118       176
+
+These numbers do not show throughput scaling with the worker count, which is what this
+benchmark is for: the VM has one core, so extra workers only take turns on it. Query
+throughput (CPU-bound Arrow group-by) stays flat and chat drops a little from process
+switching. Scaling is unverified until the benchmark is run on a multi-core host.
+What the numbers do show is memory: per-worker RSS does not grow with the worker
+count, it shrinks. The document is mapped, not copied into each heap, so what a worker
+holds privately is the working memory of the requests it served. PSS falls faster than
+RSS because the mapped file and libraries are counted once across all workers.
+
+Usage: python benchmarks/multiworker_benchmark.py [--workers 1 2 4] [--rows 1000000]
+       [--endpoints query chat] [--requests 400] [--concurrency 16] [--output results.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+from load_test import free_port, git_revision, run_level, wait_until_ready
+from microbench import generate_file
+
+ROOT = Path(__file__).resolve().parent.parent
+DOCUMENT_ID = "multiworker"
+
+QUERY_PLAN = {
+    "group_by": ["kota_2"],
+    "aggregations": [{"func": "sum", "column": "jumlah_1", "name": "total"}],
+    "sort": [{"column": "total", "descending": True}],
+}
+
+INGEST_SCRIPT = """
+import sys
+from pathlib import Path
+import app
+app.initialize_db()
+app.ingest_structured_file(sys.argv[1], Path(sys.argv[2]).name, Path(sys.argv[2]))
+"""
+
+
+def read_kb(path: str, fields: tuple) -> dict:
+    values = {}
+    with open(path) as status:
+        for line in status:
+            name, _, rest = line.partition(":")
+            if name in fields:
+                values[name] = int(rest.split()[0])
+    return values
+
+
+def process_memory(pid: int) -> dict:
+    status = read_kb(f"/proc/{pid}/status", ("VmRSS", "RssAnon", "RssFile"))
+    rollup = read_kb(f"/proc/{pid}/smaps_rollup", ("Pss",))
+    mb = lambda kb: round(kb / 1024, 1)
+    return {
+        "pid": pid,
+        "rss_mb": mb(status["VmRSS"]),
+        "rss_anon_mb": mb(status["RssAnon"]),
+        "rss_file_mb": mb(status["RssFile"]),
+        "pss_mb": mb(rollup["Pss"]),
+    }
+
+
+def worker_pids(server_pid: int) -> list:
+    """The uvicorn worker processes; with one worker the server process serves requests itself"""
+    children = []
+    for entry in Path("/proc").iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            ppid = int((entry / "stat").read_text().rsplit(")", 1)[1].split()[1])
+            cmdline = (entry / "cmdline").read_bytes()
+        except (OSError, IndexError):
+            continue
+        # multiprocessing's resource tracker is a child too, but serves nothing
+        if ppid == server_pid and b"resource_tracker" not in cmdline:
+            children.append(int(entry.name))
+    return sorted(children) or [server_pid]
+
+
+def start_app(workers: int, env: dict, workdir: Path) -> tuple[str, subprocess.Popen]:
+    port = free_port()
+    # app.serve is what `python app.py` runs, so the benchmark uses the same listening socket setup
+    server = subprocess.Popen(
+        [sys.executable, "-c", f"import app; app.serve('127.0.0.1', {port}, {workers})"],
+        cwd=workdir, env=dict(env, WEB_CONCURRENCY=str(workers))
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    wait_until_ready(f"{base_url}/health/live", server, timeout=120)
+    return base_url, server
+
+
+async def run_workers(args, base_url: str, workers: int) -> list:
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        def chat(_):
+            return client.post("/chat", json={
+                "message": "Berapa total jumlah_1 untuk kota Jakarta?",
+                "structured_document_id": DOCUMENT_ID,
+                "conversation_id": str(uuid.uuid4()),
+                "bypass_cache": True,
+            })
+
+        makers = {
+            "query": lambda _: client.post(f"/structured-documents/{DOCUMENT_ID}/query", json=QUERY_PLAN),
+            "chat": chat,
+        }
+        results = []
+        for name in args.endpoints:
+            # Enough warm-up requests that every worker has mapped the document
+            await run_level(client, name, args.concurrency, max(args.concurrency, workers * 4), makers[name])
+            result = await run_level(client, name, args.concurrency, args.requests, makers[name])
+            result["workers"] = workers
+            results.append(result)
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--endpoints", nargs="+", choices=["query", "chat"], default=["query", "chat"])
+    parser.add_argument("--requests", type=int, default=400, help="Requests per endpoint and worker count")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--output", help="Write the JSON report here as well as to stdout")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="multiworker-") as tmp:
+        workdir = Path(tmp)
+        mock_port = free_port()
+        env = dict(
+            os.environ,
+            GROQ_API_KEY="multiworker-benchmark",
+            GROQ_API_URL=f"http://127.0.0.1:{mock_port}/v1/chat/completions",
+            DATABASE_PATH=str(workdir / "database.db"),
+            GROQ_RPM_LIMIT="0",
+            GROQ_TPM_LIMIT="0",
+            PYTHONPATH=str(ROOT),
+        )
+        (workdir / "excel_uploads").mkdir()
+        source = workdir / "excel_uploads" / f"{DOCUMENT_ID}.csv"
+        print(f"generating and ingesting {args.rows} rows", file=sys.stderr)
+        generate_file(source, "csv", args.rows, 5)
+        subprocess.run([sys.executable, "-c", INGEST_SCRIPT, DOCUMENT_ID, str(source)],
+                       cwd=workdir, env=env, check=True)
+        columnar_mb = sum(path.stat().st_size for path in (workdir / "excel_uploads").glob("*.arrow")) / 1024 / 1024
+
+        mock = subprocess.Popen(
+            [sys.executable, str(ROOT / "benchmarks" / "mock_groq.py"), "--port", str(mock_port),
+             "--latency-ms", "0", "--jitter-ms", "0"],
+            cwd=workdir
+        )
+        try:
+            wait_until_ready(f"http://127.0.0.1:{mock_port}/mock/stats", mock)
+            for workers in args.workers:
+                base_url, server = start_app(workers, env, workdir)
+                try:
+                    levels = asyncio.run(run_workers(args, base_url, workers))
+                    memory = [process_memory(pid) for pid in worker_pids(server.pid)]
+                finally:
+                    server.terminate()
+                    server.wait(timeout=30)
+                for result in levels:
+                    result["worker_memory"] = memory
+                    for metric in ("rss_mb", "rss_anon_mb", "rss_file_mb", "pss_mb"):
+                        result[f"mean_{metric}"] = round(statistics.mean(m[metric] for m in memory), 1)
+                    print(json.dumps(result, sort_keys=True), file=sys.stderr)
+                    results.append(result)
+        finally:
+            mock.terminate()
+            mock.wait(timeout=10)
+
+    report = {
+        "meta": {
+            "git_revision": git_revision(),
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "rows": args.rows,
+            "columnar_mb": round(columnar_mb, 1),
+            "requests_per_level": args.requests,
+            "concurrency": args.concurrency,
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
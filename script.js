@@ -13,6 +13,11 @@ let currentChatSessionMessages = []; // Stores messages for the *current* chat s
 let selectedStructuredUploadFile = null;
 let confirmCallback = null;
 
+const HISTORY_PAGE_SIZE = 50;
+const DOCUMENTS_PAGE_SIZE = 500;
+let historyNextCursor = null;
+let isLoadingHistoryPage = false;
+
 // --- DOM ELEMENTS CACHE ---
 const elements = {
     loadingOverlay: document.getElementById('loading-overlay'),
@@ -149,11 +154,13 @@ function renderEmptyState(containerElement, message) {
 // --- API FUNCTIONS ---
 async function apiCall(endpoint, options = {}) {
     const url = `${API_BASE_URL}${endpoint}`;
+    // onHeaders(headers) is called for successful responses, e.g. to read pagination cursors
+    const { onHeaders, ...fetchOptions } = options;
     const config = {
-        ...options,
+        ...fetchOptions,
         headers: {
-            ...(options.body instanceof FormData ? {} : { 'Content-Type': 'application/json' }),
-            ...options.headers,
+            ...(fetchOptions.body instanceof FormData ? {} : { 'Content-Type': 'application/json' }),
+            ...fetchOptions.headers,
         },
     };
 
@@ -168,6 +175,7 @@ async function apiCall(endpoint, options = {}) {
             }
             throw new Error(errorData.detail || `HTTP error ${response.status}`);
         }
+        if (onHeaders) onHeaders(response.headers);
         if (response.status === 204 || response.headers.get("content-length") === "0") {
             return null;
         }
@@ -318,7 +326,11 @@ async function performUploadStructuredDocument() {
     formData.append('file', selectedStructuredUploadFile);
 
     try {
-        const data = await apiCall('/upload-structured-data', { method: 'POST', body: formData });
+        let data = await apiCall('/upload-structured-data', { method: 'POST', body: formData });
+        if (data && data.job_id) {
+            // Large files are ingested in the background; poll until the document is ready
+            data = await waitForIngestJob(data.job_id);
+        }
         showAlert(`Dokumen data terstruktur "${sanitizeText(data.filename)}" berhasil diunggah!`, 'success');
 
         selectedStructuredUploadFile = null;
@@ -341,9 +353,37 @@ async function performUploadStructuredDocument() {
     }
 }
 
+async function waitForIngestJob(jobId, intervalMs = 1000) {
+    while (true) {
+        const job = await apiCall(`/ingest-jobs/${jobId}`);
+        if (job.status === 'completed') return job.document;
+        if (job.status === 'failed') throw new Error(job.error || 'Pemrosesan file gagal.');
+        if (elements.uploadStructuredBtn) {
+            elements.uploadStructuredBtn.innerHTML = `<span class="loading-spinner-btn"></span> Memproses ${job.progress}%...`;
+        }
+        await new Promise(resolve => setTimeout(resolve, intervalMs));
+    }
+}
+
+// /structured-documents is keyset-paginated: follow X-Next-Cursor until the last page
+async function fetchAllStructuredDocuments() {
+    const documents = [];
+    let cursor = null;
+    do {
+        const params = new URLSearchParams({ limit: DOCUMENTS_PAGE_SIZE });
+        if (cursor) params.set('before', cursor);
+        cursor = null;
+        const page = await apiCall(`/structured-documents?${params.toString()}`, {
+            onHeaders: headers => { cursor = headers.get('X-Next-Cursor'); }
+        });
+        documents.push(...(page || []));
+    } while (cursor);
+    return documents;
+}
+
 async function loadAllStructuredDocuments() {
     try {
-        const data = await apiCall('/structured-documents');
+        const data = await fetchAllStructuredDocuments();
         renderStructuredDocumentList(data || [], elements.structuredDocumentsContainer);
     } catch (error) {
         showAlert(`Gagal memuat dokumen data terstruktur: ${error.message}`, 'error');
@@ -390,7 +430,7 @@ function renderStructuredDocumentList(documents, containerElement = elements.str
 async function loadStructuredDocumentsForChat() {
     console.log("Loading structured documents for chat sidebar..."); // Debug log
     try {
-        const structuredData = await apiCall('/structured-documents');
+        const structuredData = await fetchAllStructuredDocuments();
         renderChatDocumentSelectionList(structuredData || [], elements.chatStructuredDocumentList, 'structured');
 
         // Check if a document was previously selected for chat and re-activate it
@@ -527,16 +567,19 @@ function submitChatMessage(messageContent) {
                 message: messageContent,
                 structured_document_id: selectedChatStructuredDocumentId,
             };
-            console.log("Sending payload to /chat:", payload);
-
-            const responseData = await apiCall('/chat', {
-                method: 'POST',
-                body: JSON.stringify(payload),
+            console.log("Sending payload to /chat/stream:", payload);
+
+            // Render tokens into the assistant bubble as they arrive
+            const assistantMessage = addMessageToChatUI('', 'assistant', new Date().toISOString());
+            const responseData = await streamChatMessage(payload, (token) => {
+                assistantMessage.content += token;
+                assistantMessage.element.textContent = assistantMessage.content;
+                elements.chatMessagesContainer.scrollTop = elements.chatMessagesContainer.scrollHeight;
             });
-            console.log("Received response from /chat:", responseData);
-
+            console.log("Received response from /chat/stream:", responseData);
 
-            addMessageToChatUI(responseData.response, 'assistant', new Date().toISOString());
+            assistantMessage.content = responseData.response;
+            assistantMessage.element.textContent = responseData.response;
 
             if (selectedChatStructuredDocumentId) {
                 if (responseData.next_action === "search_internet") {
@@ -558,6 +601,56 @@ function submitChatMessage(messageContent) {
     })();
 }
 
+async function streamChatMessage(payload, onToken) {
+    const response = await fetch(`${API_BASE_URL}/chat/stream`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(payload),
+    });
+    if (!response.ok) {
+        let errorData;
+        try {
+            errorData = await response.json();
+        } catch (e) {
+            errorData = { detail: `Server error: ${response.status} ${response.statusText}.` };
+        }
+        throw new Error(errorData.detail || `HTTP error ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let result = null;
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Server-sent events are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let eventName = 'message';
+            let data = '';
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            });
+            if (!data) continue;
+
+            const parsed = JSON.parse(data);
+            if (eventName === 'token') onToken(parsed.token);
+            else if (eventName === 'done') result = parsed;
+        }
+    }
+
+    if (!result) throw new Error('Stream chat terputus sebelum selesai.');
+    return result;
+}
+
 function addMessageToChatUI(content, sender, timestamp, isNew = true) {
     if (!elements.chatMessagesContainer) return;
     const welcomeMsg = elements.chatMessagesContainer.querySelector('.chat-welcome');
@@ -581,9 +674,13 @@ function addMessageToChatUI(content, sender, timestamp, isNew = true) {
     elements.chatMessagesContainer.appendChild(messageDiv);
     elements.chatMessagesContainer.scrollTop = elements.chatMessagesContainer.scrollHeight;
 
+    const message = { content, sender, timestamp };
     if (isNew) {
-        currentChatSessionMessages.push({ content, sender, timestamp });
+        currentChatSessionMessages.push(message);
     }
+    // The element is non-enumerable so session messages stay plain data
+    Object.defineProperty(message, 'element', { value: contentDiv, enumerable: false });
+    return message;
 }
 
 function renderChatMessageHistoryUI() {
@@ -607,22 +704,36 @@ function renderChatMessageHistoryUI() {
 
 
 async function loadAllChatHistory() {
+    historyNextCursor = null;
+    await loadChatHistoryPage(false);
+}
+
+// Infinite scroll: fetch the next keyset page of /history and append it
+async function loadChatHistoryPage(append = true) {
+    if (isLoadingHistoryPage || (append && !historyNextCursor)) return;
+    isLoadingHistoryPage = true;
+
+    const params = new URLSearchParams({ limit: HISTORY_PAGE_SIZE });
+    if (append) params.set('before', historyNextCursor);
+
     try {
-        const data = await apiCall('/history');
-        renderChatHistoryList(data.history || []);
+        const data = await apiCall(`/history?${params.toString()}`);
+        historyNextCursor = data.next_cursor || null;
+        renderChatHistoryList(data.history || [], append);
     } catch (error) {
         showAlert(`Gagal memuat riwayat chat: ${error.message}`, 'error');
-        renderEmptyState(elements.historyContainer, 'Gagal memuat riwayat percakapan.');
+        if (!append) renderEmptyState(elements.historyContainer, 'Gagal memuat riwayat percakapan.');
     } finally {
+        isLoadingHistoryPage = false;
         // hideLoading() will be called by navigateToSection
     }
 }
 
-function renderChatHistoryList(historyItems) {
+function renderChatHistoryList(historyItems, append = false) {
     if (!elements.historyContainer) return;
-    elements.historyContainer.innerHTML = '';
+    if (!append) elements.historyContainer.innerHTML = '';
     if (!historyItems || historyItems.length === 0) {
-        renderEmptyState(elements.historyContainer, 'Belum ada riwayat chat yang tersimpan.');
+        if (!append) renderEmptyState(elements.historyContainer, 'Belum ada riwayat chat yang tersimpan.');
         return;
     }
     historyItems.forEach(item => {
@@ -747,6 +858,14 @@ function initializeEventListeners() {
         if (message) submitChatMessage(message);
     });
 
+    // Chat history infinite scroll
+    elements.historyContainer?.addEventListener('scroll', () => {
+        const container = elements.historyContainer;
+        if (container.scrollTop + container.clientHeight >= container.scrollHeight - 200) {
+            loadChatHistoryPage(true);
+        }
+    });
+
     // FAQ Accordion
     elements.faqContainer?.addEventListener('click', (e) => {
         const questionButton = e.target.closest('.faq-question');
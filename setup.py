@@ -6,6 +6,7 @@ This script creates the necessary database tables and initial setup
 
 import sqlite3
 import os
+import sys
 from pathlib import Path
 
 def create_database():
@@ -15,6 +16,9 @@ def create_database():
     conn = sqlite3.connect('database.db')
     cursor = conn.cursor()
 
+    # WAL agar pembaca tidak memblokir penulis (pengaturan ini persisten di file database)
+    cursor.execute("PRAGMA journal_mode=WAL")
+
     # Hapus tabel documents yang lama jika ada (berisi PDF, DOCX, TXT)
     cursor.execute("DROP TABLE IF EXISTS documents")
     print("   Dropped 'documents' table (text files).")
@@ -26,9 +30,28 @@ def create_database():
             filename TEXT NOT NULL,
             file_path TEXT NOT NULL,
             upload_date TEXT NOT NULL,
-            row_count INTEGER
+            row_count INTEGER,
+            columnar_path TEXT,
+            fts_key INTEGER,
+            parent_id TEXT,
+            sheet_name TEXT,
+            content_hash TEXT
         )
     ''')
+    cursor.execute("PRAGMA table_info(excel_documents)")
+    document_columns = [col[1] for col in cursor.fetchall()]
+    if "columnar_path" not in document_columns:
+        cursor.execute("ALTER TABLE excel_documents ADD COLUMN columnar_path TEXT")
+    if "fts_key" not in document_columns:
+        cursor.execute("ALTER TABLE excel_documents ADD COLUMN fts_key INTEGER")
+    # Sheet kedua dst. dari workbook XLSX disimpan sebagai sub-dokumen
+    if "parent_id" not in document_columns:
+        cursor.execute("ALTER TABLE excel_documents ADD COLUMN parent_id TEXT")
+    if "sheet_name" not in document_columns:
+        cursor.execute("ALTER TABLE excel_documents ADD COLUMN sheet_name TEXT")
+    # Hash isi file untuk mengenali unggahan ulang yang identik
+    if "content_hash" not in document_columns:
+        cursor.execute("ALTER TABLE excel_documents ADD COLUMN content_hash TEXT")
     print("   Ensured 'excel_documents' table (structured data) exists.")
 
 
@@ -46,7 +69,8 @@ def create_database():
                 timestamp TEXT NOT NULL,
                 is_predefined BOOLEAN DEFAULT FALSE,
                 excel_document_id TEXT,      -- Untuk referensi dokumen terstruktur
-                chat_turn INTEGER DEFAULT 0
+                chat_turn INTEGER DEFAULT 0,
+                conversation_id TEXT
             )
         ''')
     else:
@@ -55,19 +79,278 @@ def create_database():
             cursor.execute("ALTER TABLE chat_history ADD COLUMN excel_document_id TEXT")
         if "chat_turn" not in columns:
             cursor.execute("ALTER TABLE chat_history ADD COLUMN chat_turn INTEGER DEFAULT 0")
+        if "conversation_id" not in columns:
+            cursor.execute("ALTER TABLE chat_history ADD COLUMN conversation_id TEXT")
         # Hapus kolom document_ids jika masih ada dari versi lama (memerlukan recreate table)
         # Untuk simplicity di setup.py ini, kita tidak akan secara otomatis menghapus kolom jika sudah ada.
         # Jika Anda ingin bersih total dari `document_ids`, Anda harus menghapus `database.db` secara manual
         # dan biarkan setup.py membuat ulang tabel tanpa kolom itu.
 
     # Buat indeks
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_excel_documents_upload_date ON excel_documents(upload_date, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_excel_documents_parent_id ON excel_documents(parent_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_excel_documents_content_hash ON excel_documents(content_hash)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_history_timestamp ON chat_history(timestamp)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_history_document_timestamp ON chat_history(excel_document_id, timestamp)')
     print("   Ensured 'chat_history' table is up-to-date with necessary columns.")
 
+    # Penghitung giliran per dokumen/percakapan, menggantikan scan chat_history
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chat_sessions (
+            excel_document_id TEXT NOT NULL,
+            conversation_id TEXT NOT NULL DEFAULT '',
+            chat_turn INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (excel_document_id, conversation_id)
+        )
+    ''')
+    # Isi dari riwayat yang sudah ada: giliran terakhir tiap dokumen/percakapan
+    cursor.execute('''
+        INSERT OR IGNORE INTO chat_sessions (excel_document_id, conversation_id, chat_turn, updated_at)
+        SELECT h.excel_document_id, COALESCE(h.conversation_id, ''), h.chat_turn, h.timestamp
+        FROM chat_history h
+        WHERE h.excel_document_id IS NOT NULL
+          AND h.id = (
+              SELECT latest.id FROM chat_history latest
+              WHERE latest.excel_document_id = h.excel_document_id
+                AND COALESCE(latest.conversation_id, '') = COALESCE(h.conversation_id, '')
+              ORDER BY latest.timestamp DESC, latest.id DESC
+              LIMIT 1
+          )
+    ''')
+    print(f"   Ensured 'chat_sessions' table exists ({cursor.rowcount} session(s) migrated).")
+
+    # Cache respons Groq (tier persisten, TTL per entri)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS llm_response_cache (
+            cache_key TEXT PRIMARY KEY,
+            response TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+    print("   Ensured 'llm_response_cache' table exists.")
+
+    # Status pekerjaan ingest di latar belakang untuk file besar
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ingest_jobs (
+            id TEXT PRIMARY KEY,
+            document_id TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            status TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            progress INTEGER DEFAULT 0,
+            error TEXT,
+            result TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    ''')
+    print("   Ensured 'ingest_jobs' table exists.")
+
+    # Indeks full-text isi sel untuk pencarian BM25
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS structured_rows_fts USING fts5(
+            document_id UNINDEXED,
+            row_id UNINDEXED,
+            content,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+    ''')
+    print("   Ensured 'structured_rows_fts' full-text index exists.")
+
+    # Ringkasan statistik per dokumen untuk prompt yang ringkas
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS document_digests (
+            document_id TEXT PRIMARY KEY,
+            digest TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    print("   Ensured 'document_digests' table exists.")
+
+    # File unggahan yang dipakai bersama oleh unggahan duplikat, dengan jumlah referensinya
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stored_files (
+            file_path TEXT PRIMARY KEY,
+            content_hash TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            ref_count INTEGER NOT NULL,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    print("   Ensured 'stored_files' table exists.")
+
+    # Pemberitahuan invalidasi cache antar proses worker
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cache_invalidations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            document_id TEXT,
+            columnar_path TEXT,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    # Klaim pemuatan sheet agar hanya satu proses worker yang mem-parse sheet yang sama
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS document_load_claims (
+            lock_key TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            claimed_at REAL NOT NULL
+        )
+    ''')
+    print("   Ensured 'cache_invalidations' and 'document_load_claims' tables exist.")
+
     conn.commit()
     conn.close()
     print("✅ Database tables created successfully")
 
+def migrate_columnar_copies():
+    """Write the Arrow IPC copy for documents uploaded before columnar storage existed"""
+    print("🧱 Migrating structured documents to columnar storage...")
+
+    try:
+        from app import read_structured_file, write_columnar_copy, write_csv_columnar_copy
+    except ImportError as e:
+        print(f"⚠️  Skipped columnar migration, dependencies missing: {e}")
+        return
+
+    conn = sqlite3.connect('database.db')
+    conn.row_factory = sqlite3.Row
+    documents = conn.execute(
+        "SELECT id, file_path, columnar_path FROM excel_documents WHERE parent_id IS NULL"
+    ).fetchall()
+
+    migrated = 0
+    for doc in documents:
+        if doc["columnar_path"] and Path(doc["columnar_path"]).exists():
+            continue
+        file_path = Path(doc["file_path"])
+        if not file_path.exists():
+            print(f"   Missing original file for document {doc['id']}, skipped.")
+            continue
+        try:
+            if file_path.suffix.lower() == '.csv':
+                columnar_path, _ = write_csv_columnar_copy(file_path)
+            else:
+                columnar_path, _ = write_columnar_copy(read_structured_file(file_path), file_path)
+        except Exception as e:
+            print(f"   Failed to convert {file_path}: {e}")
+            continue
+        conn.execute(
+            "UPDATE excel_documents SET columnar_path = ? WHERE id = ?",
+            (str(columnar_path), doc["id"])
+        )
+        migrated += 1
+
+    conn.commit()
+    conn.close()
+    print(f"✅ Columnar copies written for {migrated} document(s)")
+
+def rebuild_search_index(only_missing=False):
+    """Rebuild the full-text index of structured documents (all, or only those not indexed yet)"""
+    print("🔎 Rebuilding full-text search index...")
+
+    try:
+        from app import attach_fts_key, index_document_rows, load_structured_dataframe
+    except ImportError as e:
+        print(f"⚠️  Skipped search index rebuild, dependencies missing: {e}")
+        return
+
+    conn = sqlite3.connect('database.db')
+    conn.row_factory = sqlite3.Row
+    if not only_missing:
+        conn.execute("DELETE FROM structured_rows_fts")
+        conn.execute("UPDATE excel_documents SET fts_key = NULL")
+        conn.commit()
+    documents = conn.execute(
+        "SELECT id, file_path, columnar_path FROM excel_documents WHERE fts_key IS NULL AND row_count IS NOT NULL"
+    ).fetchall()
+
+    indexed = 0
+    for doc in documents:
+        file_path = Path(doc["file_path"])
+        try:
+            df = load_structured_dataframe(file_path, doc["id"], doc["columnar_path"])
+            # Baris indeks di-commit per batch, dokumen baru ditautkan setelah semuanya masuk
+            attach_fts_key(conn, doc["id"], index_document_rows(conn, doc["id"], df))
+            conn.commit()
+            indexed += 1
+        except Exception as e:
+            conn.rollback()
+            print(f"   Failed to index document {doc['id']}: {e}")
+
+    conn.close()
+    print(f"✅ Search index built for {indexed} document(s)")
+
+def migrate_document_digests():
+    """Compute the prompt digest for documents uploaded before digests existed"""
+    print("📊 Computing document digests...")
+
+    try:
+        from app import load_structured_dataframe, store_document_digest
+    except ImportError as e:
+        print(f"⚠️  Skipped digest migration, dependencies missing: {e}")
+        return
+
+    conn = sqlite3.connect('database.db')
+    conn.row_factory = sqlite3.Row
+    documents = conn.execute("""
+        SELECT d.id, d.file_path, d.columnar_path FROM excel_documents d
+        LEFT JOIN document_digests g ON g.document_id = d.id
+        WHERE g.document_id IS NULL AND d.row_count IS NOT NULL
+    """).fetchall()
+
+    computed = 0
+    for doc in documents:
+        try:
+            df = load_structured_dataframe(Path(doc["file_path"]), doc["id"], doc["columnar_path"])
+            store_document_digest(conn, doc["id"], df)
+            conn.commit()
+            computed += 1
+        except Exception as e:
+            conn.rollback()
+            print(f"   Failed to compute digest for document {doc['id']}: {e}")
+
+    conn.close()
+    print(f"✅ Digests computed for {computed} document(s)")
+
+def migrate_content_hashes():
+    """Hash the files of documents uploaded before deduplication and register them as stored files"""
+    print("🧬 Hashing stored uploads for deduplication...")
+
+    import hashlib
+    from datetime import datetime
+
+    conn = sqlite3.connect('database.db')
+    conn.row_factory = sqlite3.Row
+    documents = conn.execute(
+        "SELECT id, file_path FROM excel_documents WHERE parent_id IS NULL AND content_hash IS NULL"
+    ).fetchall()
+
+    hashed = 0
+    for doc in documents:
+        file_path = Path(doc["file_path"])
+        if not file_path.exists():
+            print(f"   Missing original file for document {doc['id']}, skipped.")
+            continue
+        content_hash = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            while block := f.read(1024 * 1024):
+                content_hash.update(block)
+        conn.execute(
+            "UPDATE excel_documents SET content_hash = ? WHERE id = ? OR parent_id = ?",
+            (content_hash.hexdigest(), doc["id"], doc["id"])
+        )
+        conn.execute('''
+            INSERT INTO stored_files (file_path, content_hash, size, ref_count, created_at) VALUES (?, ?, ?, 1, ?)
+            ON CONFLICT(file_path) DO UPDATE SET ref_count = ref_count + 1
+        ''', (str(file_path), content_hash.hexdigest(), file_path.stat().st_size, datetime.now().isoformat()))
+        hashed += 1
+
+    conn.commit()
+    conn.close()
+    print(f"✅ Content hashes stored for {hashed} document(s)")
+
 def create_directories():
     """Create necessary directories"""
     print("📁 Creating directories...")
@@ -117,12 +400,14 @@ def install_dependencies():
 def create_requirements_file():
     """Create requirements.txt file (reflecting the new, trimmed dependencies)"""
     requirements = """fastapi==0.104.1
-uvicorn[standard]==0.24.0
+uvicorn[standard]==0.54.0
 python-multipart==0.0.6
 requests==2.31.0
+httpx[http2]==0.25.2
 python-dotenv==1.0.0
 pandas==2.2.2
 openpyxl==3.1.2
+pyarrow==16.1.0
 """
 
     with open('requirements.txt', 'w') as f:
@@ -147,6 +432,18 @@ def main():
     create_database()
     print()
 
+    migrate_columnar_copies()
+    print()
+
+    rebuild_search_index(only_missing=True)
+    print()
+
+    migrate_document_digests()
+    print()
+
+    migrate_content_hashes()
+    print()
+
     env_ok = check_env_file()
     print()
 
@@ -161,9 +458,13 @@ def main():
     print("\n📖 Next steps:")
     print("1. Configure your .env file with GROQ API key (if not already done)")
     print("2. Install dependencies: pip install -r requirements.txt")
-    print("3. Run the application: python app.py")
+    print("3. Run the application: python app.py (WEB_CONCURRENCY=4 python app.py for 4 worker processes)")
     print("4. Open browser: http://localhost:8000")
+    print("\nTo rebuild the full-text search index: python setup.py --rebuild-search-index")
     print("\nNote: This is a local-only, no-authentication version of the system.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if "--rebuild-search-index" in sys.argv:
+        rebuild_search_index()
+    else:
+        main()
\ No newline at end of file
@@ -0,0 +1,169 @@
+"""
+Request coalescing of identical in-flight Groq prompts (SingleFlight in app.py), checked
+against benchmarks/mock_groq.py running as a local fake Groq server.
+
+Run with: python -m pytest tests
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from load_test import free_port
+
+# app reads its configuration at import time
+os.environ.update(
+    GROQ_API_KEY="test",
+    DATABASE_PATH=str(Path(tempfile.mkdtemp(prefix="single-flight-")) / "database.db"),
+    GROQ_RPM_LIMIT="0",
+    GROQ_TPM_LIMIT="0",
+)
+
+import app  # noqa: E402
+
+MOCK_LATENCY_MS = 300
+
+
+def start_mock(*args) -> tuple[str, subprocess.Popen]:
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, str(ROOT / "benchmarks" / "mock_groq.py"), "--port", str(port),
+         "--latency-ms", str(MOCK_LATENCY_MS), "--jitter-ms", "0", *args]
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            httpx.get(f"{base_url}/mock/stats", timeout=1)
+            return base_url, process
+        except httpx.HTTPError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError("mock Groq server did not start")
+            time.sleep(0.1)
+
+
+@pytest.fixture(scope="module")
+def mock_groq():
+    base_url, process = start_mock()
+    yield base_url
+    process.terminate()
+    process.wait(timeout=10)
+
+
+@pytest.fixture(scope="module")
+def failing_mock_groq():
+    base_url, process = start_mock("--error-rate", "1")
+    yield base_url
+    process.terminate()
+    process.wait(timeout=10)
+
+
+@pytest.fixture
+def groq_at(monkeypatch):
+    """Point app at a mock server with fresh counters"""
+    def point(base_url: str):
+        monkeypatch.setattr(app, "GROQ_API_URL", f"{base_url}/v1/chat/completions")
+        httpx.post(f"{base_url}/mock/reset")
+        return base_url
+    return point
+
+
+def mock_stats(base_url: str) -> dict:
+    return httpx.get(f"{base_url}/mock/stats").json()
+
+
+def run(make_awaitable):
+    """Await make_awaitable() in a new event loop; the pooled Groq client belongs to that loop, so it is closed after"""
+    async def with_client():
+        try:
+            return await make_awaitable()
+        finally:
+            if app.groq_client is not None:
+                await app.groq_client.aclose()
+                app.groq_client = None
+    return asyncio.run(with_client())
+
+
+def test_identical_prompts_reach_groq_once(mock_groq, groq_at):
+    groq_at(mock_groq)
+    before = app.groq_single_flight.stats()
+
+    responses = run(lambda: asyncio.gather(*(app.query_groq("Berapa total anggaran Jakarta?") for _ in range(8))))
+
+    assert len(set(responses)) == 1
+    assert not responses[0].startswith("Error:")
+    assert mock_stats(mock_groq)["requests"] == 1
+    after = app.groq_single_flight.stats()
+    assert after["upstream_requests"] - before["upstream_requests"] == 1
+    assert after["coalesced"] - before["coalesced"] == 7
+    assert after["in_flight"] == 0
+
+
+def test_different_prompts_are_not_coalesced(mock_groq, groq_at):
+    groq_at(mock_groq)
+
+    run(lambda: asyncio.gather(app.query_groq("Pertanyaan satu"), app.query_groq("Pertanyaan dua"),
+                               app.query_groq("Pertanyaan satu", max_tokens=50)))
+
+    assert mock_stats(mock_groq)["requests"] == 3
+
+
+def test_sequential_prompts_are_sent_again(mock_groq, groq_at):
+    groq_at(mock_groq)
+
+    run(lambda: app.query_groq("Ringkas isi dokumen ini"))
+    run(lambda: app.query_groq("Ringkas isi dokumen ini"))
+
+    assert mock_stats(mock_groq)["requests"] == 2
+
+
+def test_failed_call_is_shared_and_not_left_in_flight(failing_mock_groq, groq_at):
+    groq_at(failing_mock_groq)
+
+    responses = run(lambda: asyncio.gather(*(app.query_groq("Tampilkan data pegawai") for _ in range(5))))
+
+    assert len(set(responses)) == 1
+    assert responses[0].startswith("Error:")
+    assert mock_stats(failing_mock_groq)["requests"] == 1
+    assert app.groq_single_flight.stats()["in_flight"] == 0
+
+    # The failure is not cached in the single-flight table: the next call goes upstream again
+    run(lambda: app.query_groq("Tampilkan data pegawai"))
+    assert mock_stats(failing_mock_groq)["requests"] == 2
+
+
+def test_leader_exception_propagates_to_every_waiter():
+    single_flight = app.SingleFlight()
+    calls = 0
+
+    async def failing_call():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        raise RuntimeError("upstream failed")
+
+    async def scenario():
+        results = await asyncio.gather(*(single_flight.do("key", failing_call) for _ in range(4)),
+                                       return_exceptions=True)
+        assert single_flight.stats()["in_flight"] == 0
+        with pytest.raises(RuntimeError):
+            await single_flight.do("key", failing_call)
+        return results
+
+    results = asyncio.run(scenario())
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert calls == 2
+    assert single_flight.stats() == {"in_flight": 0, "upstream_requests": 2, "coalesced": 3}